@@ -129,10 +129,87 @@ export default function VideoProcessor() {
         const videoURL = URL.createObjectURL(videoFile);
         video.src = videoURL;
         
+        // One persistent socket per run: frames go up as binary messages and every
+        // frame gets one JSON reply (result, dropped or error) pushed back
+        const query = userEmail ? `?user_email=${encodeURIComponent(userEmail)}` : "";
+        const socket = new WebSocket(`ws://localhost:8000/ws/frames/${encodeURIComponent(userUuid)}${query}`);
+        let maxInFlight = 0; // set by the server's "ready" message
+        let inFlight = 0;
+        let sampleInterval = 10 / 30; // seconds of video between frames, then whatever the server recommends
+        const waiting: Blob[] = []; // frames captured before "ready", sent once it arrives
+        let ending = false;
+        let onEnded: (() => void) | null = null;
+        const endMessage = JSON.stringify({ type: "end" });
+        
+        socket.onmessage = (event) => {
+          const message = JSON.parse(event.data);
+          if (message.type === "ready") {
+            maxInFlight = message.max_in_flight;
+            waiting.splice(0).forEach((frame) => socket.send(frame));
+            if (ending) {
+              socket.send(endMessage);
+            }
+            return;
+          }
+          if (message.type === "end") {
+            // Every frame has been answered; the server closes the socket next
+            socket.close();
+            return;
+          }
+          if (message.type === "job") {
+            console.log("Incident job finished:", message);
+            return;
+          }
+          inFlight = Math.max(0, inFlight - 1);
+          if (message.type === "result") {
+            console.log("Server response:", message);
+            if (message.recommended_sample_interval) {
+              sampleInterval = message.recommended_sample_interval;
+            }
+            if (message.incident_event === "opened") {
+              toast({
+                title: "Fire detected",
+                description: `Incident opened at frame ${message.frame}`,
+                variant: "destructive"
+              });
+            }
+          } else if (message.type === "error") {
+            console.error("Error processing frame:", message.error);
+          }
+        };
+        socket.onerror = (event) => console.error("Frame stream error:", event);
+        const finishEnd = () => {
+          const ended = onEnded;
+          onEnded = null;
+          ended?.();
+        };
+        socket.onclose = finishEnd;
+        
+        const release = () => {
+          URL.revokeObjectURL(videoURL);
+          socket.close();
+        };
+        
+        // Ask the server to answer every outstanding frame before the stream closes;
+        // closing straight away would abandon frames still waiting for detection
+        const endStream = (done: () => void) => {
+          onEnded = () => {
+            release();
+            done();
+          };
+          if (socket.readyState > WebSocket.OPEN) {
+            finishEnd();
+            return;
+          }
+          ending = true;
+          if (maxInFlight > 0) {
+            socket.send(endMessage);
+          }
+        };
+        
         video.onloadedmetadata = () => {
           setProcessedFrames(0);
-          const frameStep = 10; // Process every 10th frame
-          const totalEstimatedFrames = Math.floor(video.duration * 30) / frameStep; // Assuming 30fps
+          const totalEstimatedFrames = Math.floor(video.duration / sampleInterval); // Before any recommendation
           setTotalFrames(totalEstimatedFrames);
           
           canvas.width = video.videoWidth;
@@ -146,26 +223,27 @@ export default function VideoProcessor() {
           
           video.oncanplay = async () => {
             let framesProcessed = 0;
-            let frameCounter = 0;
+            let nextFrameTime = 0;
             
             const processFrames = async () => {
               try {
                 if (!processingRef.current) {
-                  URL.revokeObjectURL(videoURL);
+                  release();
                   resolve();
                   return;
                 }
                 
-                const frameTime = (frameCounter * frameStep) / 30;
+                const frameTime = nextFrameTime;
                 
                 if (frameTime >= video.duration) {
                   processingRef.current = false;
-                  URL.revokeObjectURL(videoURL);
-                  toast({
-                    title: "Processing Complete",
-                    description: `All ${framesProcessed} frames have been processed`,
+                  endStream(() => {
+                    toast({
+                      title: "Processing Complete",
+                      description: `All ${framesProcessed} frames have been processed`,
+                    });
+                    resolve();
                   });
-                  resolve();
                   return;
                 }
                 
@@ -185,50 +263,41 @@ export default function VideoProcessor() {
                 
                 // Update counters and progress
                 framesProcessed++;
-                frameCounter++;
+                nextFrameTime += sampleInterval;
                 setProcessedFrames(framesProcessed);
                 setProcessProgress(Math.min(100, Math.floor((frameTime / video.duration) * 100)));
                 
-                // Show notification every 50 frames processed
-                if (framesProcessed % 20 === 0) {
-                  console.log(`Processed frame ${framesProcessed} at time ${frameTime.toFixed(2)} seconds`);
-                  canvas.toBlob(async (blob) => {
-                    if (blob) {
-                      try {
-                        const formData = new FormData();
-                        formData.append('frame_number', framesProcessed.toString());
-                        formData.append('image_data', blob, `frame_${framesProcessed}.jpg`);
-                        formData.append('timestamp', frameTime.toString());
-                        formData.append('user_uuid', userUuid); // Use the fetched user UUID
-                        if (userEmail) {
-                          formData.append('user_email', userEmail); // Also add email if available
-                        }
-                        
-                        const response = await fetch("http://localhost:8000/test", {
-                          method: "POST",
-                          body: formData,
-                        });
-                    
-                        if (!response.ok) {
-                          throw new Error(`Error processing frame: ${response.statusText}`);
-                        }
-                    
-                        const result = await response.json();
-                        console.log("Server response:", result);
-                    
-                        // Handle fire detection or other responses here...
-                      } catch (error) {
-                        console.error("Error sending frame to backend:", error);
-                      }
+                // Stream every sampled frame while the server keeps up; frames are skipped
+                // here when the in-flight window is full instead of queueing behind detection.
+                // Until "ready" announces the window, frames wait here to be sent.
+                const ready = maxInFlight > 0;
+                if (socket.readyState <= WebSocket.OPEN && (!ready || inFlight < maxInFlight)) {
+                  inFlight++;
+                  const frameNumber = framesProcessed;
+                  // Wait for the encode so frames, and the end message after them, go out in order
+                  const blob = await new Promise<Blob | null>((blobResolve) => canvas.toBlob(blobResolve, 'image/jpeg', 0.8));
+                  if (!blob || socket.readyState > WebSocket.OPEN) {
+                    inFlight--;
+                  } else {
+                    // uint16 header length, then frame_number (uint32) and timestamp (float64), big-endian
+                    const header = new DataView(new ArrayBuffer(14));
+                    header.setUint16(0, 12);
+                    header.setUint32(2, frameNumber);
+                    header.setFloat64(6, frameTime);
+                    const frame = new Blob([header.buffer, blob]);
+                    if (maxInFlight > 0) {
+                      socket.send(frame);
+                    } else {
+                      waiting.push(frame);
                     }
-                  }, 'image/jpeg', 0.8);
+                  }
                 }
                 
                 setTimeout(processFrames, 10);
               } catch (error) {
                 console.error("Error processing frame:", error);
                 processingRef.current = false;
-                URL.revokeObjectURL(videoURL);
+                release();
                 reject(error);
               }
             };
@@ -238,7 +307,7 @@ export default function VideoProcessor() {
         };
         
         video.onerror = () => {
-          URL.revokeObjectURL(videoURL);
+          release();
           processingRef.current = false;
           reject(new Error("Error loading video"));
         };
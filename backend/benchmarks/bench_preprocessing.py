@@ -0,0 +1,113 @@
+"""
+Compare per-frame payload size and CPU time before and after the shared
+preprocessing stage.
+
+The "before" path is what process_frame used to do with raw upload bytes
+(reproduced here, since the services now all go through PreparedFrame):
+decode a thumbnail for the prefilter, decode again for the perceptual hash,
+then base64 the full JPEG for Roboflow and again for Gemini. The "after" path
+goes through one PreparedFrame. Payload is the request body handed to the
+HTTP clients; CPU covers decoding, resizing and encoding. The local fire estimate is computed on the
+original and on the detector-sized JPEG to show the downscale keeps the
+detection signal.
+
+Run from the backend directory (no tunnel or API keys are needed):
+
+    WEBHOOK_BASE_URL=http://localhost:8000 python -m benchmarks.bench_preprocessing [frame.jpg ...]
+
+Without arguments a synthetic 1920x1080 frame with a flame-coloured region is used.
+"""
+import base64
+import io
+import sys
+import time
+import numpy as np
+from PIL import Image
+from services.frame_cache import compute_dhash
+from services.prefilter import prefilter_score, estimate_fire, fire_pixel_score
+from services.preprocessing import PreparedFrame
+from config import PREFILTER_SIZE
+
+ROUNDS = 50
+
+
+def synthetic_frame(width=1920, height=1080, quality=80):
+    """A camera-like frame (gradient plus sensor noise) with a flame-coloured blob, at the upload page's JPEG quality."""
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([x * 200 // width, y * 200 // height, np.full_like(x, 90)], axis=-1)
+    image = np.clip(base + rng.integers(-6, 6, size=(height, width, 3)), 0, 255)
+    image[height // 2:, width // 2:] = (240, 120, 30)
+    buffer = io.BytesIO()
+    Image.fromarray(image.astype(np.uint8)).save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+# Work done per frame on each path: benign frames stop after the prefilter, frames
+# that pass it are hashed and sent to Roboflow, and the first hit of an incident
+# also goes to Gemini.
+STAGES = ["benign", "detector", "escalated"]
+
+
+def old_prefilter_score(data):
+    image = Image.open(io.BytesIO(data))
+    image.draft("RGB", (PREFILTER_SIZE, PREFILTER_SIZE))
+    image = image.convert("RGB")
+    image.thumbnail((PREFILTER_SIZE, PREFILTER_SIZE), Image.BILINEAR)
+    return fire_pixel_score(np.asarray(image))
+
+
+def old_compute_dhash(data, hash_size=8):
+    image = Image.open(io.BytesIO(data))
+    image.draft("L", (hash_size * 8, hash_size * 8))
+    return image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR).tobytes()
+
+
+def before(data, stage):
+    old_prefilter_score(data)
+    payload = 0
+    if stage != "benign":
+        old_compute_dhash(data)
+        payload += len(base64.b64encode(data))
+    if stage == "escalated":
+        payload += len(base64.b64encode(data))
+    return payload
+
+
+def after(data, stage):
+    frame = PreparedFrame(data)
+    prefilter_score(frame)
+    payload = 0
+    if stage != "benign":
+        compute_dhash(frame)
+        payload += len(base64.b64encode(frame.detector_jpeg))
+    if stage == "escalated":
+        payload += len(frame.llm_jpeg)  # sent as raw bytes
+    return payload
+
+
+def timed(fn, data, stage):
+    payload = fn(data, stage)  # warm up
+    start = time.process_time()
+    for _ in range(ROUNDS):
+        fn(data, stage)
+    return payload, (time.process_time() - start) / ROUNDS * 1000
+
+
+def main(paths):
+    frames = [(path, open(path, "rb").read()) for path in paths] or [("synthetic 1920x1080", synthetic_frame())]
+    for name, data in frames:
+        print(f"{name} ({len(data)} bytes, {Image.open(io.BytesIO(data)).size[0]}px wide)")
+        print(f"  {'stage':<10} {'payload bytes':>25} {'CPU ms per frame':>24}")
+        for stage in STAGES:
+            old_payload, old_ms = timed(before, data, stage)
+            new_payload, new_ms = timed(after, data, stage)
+            print(f"  {stage:<10} {old_payload:>11} -> {new_payload:>10} {old_ms:>10.2f} -> {new_ms:>9.2f}")
+
+        _, original_score = estimate_fire(data)
+        _, detector_score = estimate_fire(PreparedFrame(data).detector_jpeg)
+        print(f"  local fire score: {original_score:.3f} original, {detector_score:.3f} detector JPEG")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,463 @@
+"""
+Local stand-ins for every external service the backend talks to.
+
+One process serves:
+
+- HTTP (FastAPI) for Roboflow, Supabase Storage, Mailjet, Cerebras and Twilio
+- gRPC over TLS for Gemini (the async SDK only speaks gRPC)
+- IMAP over TLS, with IDLE, for the reply inbox
+
+Every service sleeps for a latency drawn from its distribution and fails a
+configurable fraction of requests (HTTP 503 / gRPC UNAVAILABLE). Control
+endpoints under /_control let the load driver change behaviour, inject reply
+emails and read what was "sent". Normally started by benchmarks.loadtest:
+
+    python -m benchmarks.fakes --http-port 9100 --grpc-port 9101 --imap-port 9102 \\
+        --cert cert.pem --key key.pem --latency roboflow=lognormal:120:0.3 --errors mailjet=0.05
+"""
+import argparse
+import asyncio
+import json
+import random
+import ssl
+import time
+import uuid
+from collections import Counter, defaultdict
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
+
+# Default per-service latency, roughly what the real providers show from a laptop
+DEFAULT_LATENCY = {
+    "roboflow": "lognormal:120:0.3",
+    "supabase": "lognormal:80:0.3",
+    "mailjet": "lognormal:150:0.3",
+    "gemini": "lognormal:2500:0.3",
+    "cerebras": "lognormal:200:0.3",
+    "twilio": "lognormal:300:0.3",
+    "imap": "fixed:5",
+}
+
+ANALYSIS_TEXT = (
+    "Fire severity: moderate (6/10). Flames visible in the lower right of the frame with light smoke. "
+    "Probable cause: ordinary combustibles. Spread risk: medium. Recommend evacuating the room and "
+    "contacting the fire department."
+)
+CONVERSATION_REPLY = (
+    "Thank you for taking the call. The fire is in the lower right of the room and appears moderate. "
+    "Can you dispatch a unit to the address on file? I can stay on the line to answer questions."
+)
+
+
+def parse_latency(spec):
+    """
+    Build a sampler returning seconds from a spec in milliseconds:
+    fixed:MS, uniform:LOW:HIGH, normal:MEAN:STDDEV or lognormal:MEDIAN:SIGMA.
+    """
+    kind, *args = spec.split(":")
+    args = [float(a) for a in args]
+    if kind == "fixed":
+        return lambda: args[0] / 1000
+    if kind == "uniform":
+        return lambda: random.uniform(args[0], args[1]) / 1000
+    if kind == "normal":
+        return lambda: max(0.0, random.gauss(args[0], args[1])) / 1000
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(0, args[1]) * args[0] / 1000
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class FakeState:
+    """Behaviour knobs and everything the fakes have received, shared by all protocols."""
+
+    def __init__(self, latency, errors, fire_rate, call_rate):
+        self.latency_specs = dict(DEFAULT_LATENCY, **latency)
+        self.samplers = {name: parse_latency(spec) for name, spec in self.latency_specs.items()}
+        self.errors = defaultdict(float, errors)
+        self.fire_rate = fire_rate
+        self.call_rate = call_rate
+        self.requests = Counter()
+        self.injected_errors = Counter()
+        self.objects = {}  # storage path -> bytes
+        self.sent_mail = []  # {"at", "to", "subject"}
+        self.calls = []  # {"at", "sid", "to"}
+        self.mailbox = []  # {"uid", "seen", "raw"}
+        self.idle_waiters = set()  # IMAP connections currently in IDLE
+
+    def configure(self, settings):
+        for name, spec in settings.get("latency", {}).items():
+            self.latency_specs[name] = spec
+            self.samplers[name] = parse_latency(spec)
+        self.errors.update(settings.get("errors", {}))
+        self.fire_rate = settings.get("fire_rate", self.fire_rate)
+        self.call_rate = settings.get("call_rate", self.call_rate)
+
+    async def serve(self, service):
+        """Count a request, wait out its latency and return True if it should fail."""
+        self.requests[service] += 1
+        await asyncio.sleep(self.samplers[service]())
+        if random.random() < self.errors[service]:
+            self.injected_errors[service] += 1
+            return True
+        return False
+
+    def deliver(self, sender, body, subject="Re: Fire Detection Alert"):
+        message = EmailMessage()
+        message["From"] = sender
+        message["To"] = "alerts@firewatch.test"
+        message["Subject"] = subject
+        message["Date"] = formatdate()
+        message["Message-ID"] = make_msgid(domain="bench.firewatch.test")
+        message.set_content(body)
+        uid = len(self.mailbox) + 1
+        self.mailbox.append({"uid": uid, "seen": False, "raw": message.as_bytes().replace(b"\n", b"\r\n")})
+        for waiter in list(self.idle_waiters):
+            waiter.notify_exists(len(self.mailbox))
+        return uid
+
+    def stats(self):
+        return {
+            "requests": dict(self.requests),
+            "injected_errors": dict(self.injected_errors),
+            "objects": len(self.objects),
+            "mail_sent": len(self.sent_mail),
+            "calls_placed": len(self.calls),
+            "mailbox": len(self.mailbox),
+            "latency": self.latency_specs,
+        }
+
+
+def create_http_app(state):
+    from fastapi import FastAPI, Request, Response
+    from fastapi.responses import JSONResponse, StreamingResponse
+
+    app = FastAPI()
+    unavailable = lambda: JSONResponse({"error": "injected failure"}, status_code=503)
+
+    # Roboflow hosted inference
+    @app.head("/roboflow/{model:path}")
+    async def roboflow_head(model: str):
+        return Response()
+
+    @app.post("/roboflow/{model:path}")
+    async def roboflow_detect(model: str, request: Request):
+        await request.body()
+        if await state.serve("roboflow"):
+            return unavailable()
+        predictions = []
+        if random.random() < state.fire_rate:
+            predictions.append({"class": "fire", "confidence": random.uniform(0.85, 0.98),
+                                "x": 320, "y": 180, "width": 120, "height": 90})
+        return {"time": 0.05, "image": {"width": 640, "height": 360}, "predictions": predictions}
+
+    # Supabase Storage
+    @app.get("/storage/v1/bucket/{bucket}")
+    async def storage_bucket(bucket: str):
+        return {"id": bucket, "name": bucket, "public": True}
+
+    @app.post("/storage/v1/object/list/{bucket}")
+    async def storage_list(bucket: str, request: Request):
+        prefix = (await request.json()).get("prefix", "")
+        if await state.serve("supabase"):
+            return unavailable()
+        names = [path.split("/", 2)[-1] for path in state.objects if path.startswith(f"{bucket}/{prefix}/")]
+        return [{"name": name, "id": name} for name in names]
+
+    @app.post("/storage/v1/object/{bucket}/{path:path}")
+    async def storage_upload(bucket: str, path: str, request: Request):
+        content = await request.body()
+        if await state.serve("supabase"):
+            return unavailable()
+        state.objects[f"{bucket}/{path}"] = content
+        return {"Key": f"{bucket}/{path}"}
+
+    @app.get("/storage/v1/object/{bucket}/{path:path}")
+    async def storage_download(bucket: str, path: str):
+        if await state.serve("supabase"):
+            return unavailable()
+        content = state.objects.get(f"{bucket}/{path}")
+        if content is None:
+            return JSONResponse({"error": "not_found"}, status_code=404)
+        return Response(content, media_type="image/jpeg")
+
+    # Mailjet Send API v3.1
+    @app.post("/v3.1/send")
+    async def mailjet_send(request: Request):
+        messages = (await request.json()).get("Messages", [])
+        if await state.serve("mailjet"):
+            return unavailable()
+        now = time.time()
+        for message in messages:
+            for recipient in message.get("To", []):
+                state.sent_mail.append({"at": now, "to": recipient["Email"], "subject": message.get("Subject", "")})
+        return {"Messages": [{"Status": "success", "To": message.get("To", [])} for message in messages]}
+
+    # Cerebras chat completions (OpenAI-compatible), streaming and not
+    @app.get("/v1/models")
+    async def cerebras_models():
+        return {"object": "list", "data": [{"id": "llama-4-scout-17b-16e-instruct", "object": "model"}]}
+
+    @app.get("/v1/tcp_warming")
+    async def cerebras_warming():
+        return {}
+
+    @app.post("/v1/chat/completions")
+    async def cerebras_chat(request: Request):
+        body = await request.json()
+        if await state.serve("cerebras"):
+            return unavailable()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        base = {"id": completion_id, "created": int(time.time()), "model": body.get("model", "")}
+        if not body.get("stream"):
+            return dict(base, object="chat.completion", choices=[{
+                "index": 0, "finish_reason": "stop",
+                "message": {"role": "assistant", "content": CONVERSATION_REPLY},
+            }], usage={"prompt_tokens": 200, "completion_tokens": 40, "total_tokens": 240})
+
+        async def events():
+            # Time to first token was spent above; the rest streams word by word
+            for word in CONVERSATION_REPLY.split(" "):
+                # system_fingerprint and tokens are what the SDK tells a chunk apart from a full completion by
+                chunk = dict(base, object="chat.completion.chunk", system_fingerprint="fp_bench",
+                             choices=[{"index": 0, "delta": {"content": word + " ", "tokens": None}, "finish_reason": None}])
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(0.005)
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    # Twilio REST API
+    @app.get("/2010-04-01/Accounts/{account_sid}.json")
+    async def twilio_account(account_sid: str):
+        return {"sid": account_sid, "status": "active", "friendly_name": "bench"}
+
+    @app.post("/2010-04-01/Accounts/{account_sid}/Calls.json")
+    async def twilio_call(account_sid: str, request: Request):
+        form = await request.form()
+        if await state.serve("twilio"):
+            return unavailable()
+        sid = f"CA{uuid.uuid4().hex}"
+        state.calls.append({"at": time.time(), "sid": sid, "to": form.get("To")})
+        return JSONResponse({"sid": sid, "account_sid": account_sid, "status": "queued",
+                             "to": form.get("To"), "from": form.get("From")}, status_code=201)
+
+    # Control plane for the load driver
+    @app.get("/_control/stats")
+    async def control_stats():
+        return state.stats()
+
+    @app.post("/_control/config")
+    async def control_config(request: Request):
+        state.configure(await request.json())
+        return state.stats()
+
+    @app.get("/_control/mail")
+    async def control_mail(since: float = 0.0):
+        return [mail for mail in state.sent_mail if mail["at"] >= since]
+
+    @app.post("/_control/imap/messages")
+    async def control_inject(request: Request):
+        messages = (await request.json()).get("messages", [])
+        uids = [state.deliver(m["from"], m.get("body", "STATUS")) for m in messages]
+        return {"uids": uids, "injected_at": time.time()}
+
+    return app
+
+
+def create_gemini_server(state, port, cert, key):
+    """gRPC GenerativeService answering GenerateContent and CountTokens."""
+    import grpc
+    from google.ai import generativelanguage_v1beta as glm
+
+    async def generate_content(request, context):
+        if await state.serve("gemini"):
+            await context.abort(grpc.StatusCode.UNAVAILABLE, "injected failure")
+        parts = [glm.Part(text=ANALYSIS_TEXT)]
+        if random.random() < state.call_rate:
+            parts.append(glm.Part(function_call=glm.FunctionCall(
+                name="call_help_operator", args={"fire_analysis": ANALYSIS_TEXT})))
+        return glm.GenerateContentResponse(candidates=[glm.Candidate(
+            content=glm.Content(role="model", parts=parts),
+            finish_reason=glm.Candidate.FinishReason.STOP,
+        )])
+
+    async def count_tokens(request, context):
+        return glm.CountTokensResponse(total_tokens=1)
+
+    def unary(handler, request_type, response_type):
+        return grpc.unary_unary_rpc_method_handler(
+            handler,
+            request_deserializer=request_type.deserialize,
+            response_serializer=response_type.serialize,
+        )
+
+    server = grpc.aio.server()
+    server.add_generic_rpc_handlers([grpc.method_handlers_generic_handler(
+        "google.ai.generativelanguage.v1beta.GenerativeService",
+        {
+            "GenerateContent": unary(generate_content, glm.GenerateContentRequest, glm.GenerateContentResponse),
+            "CountTokens": unary(count_tokens, glm.CountTokensRequest, glm.CountTokensResponse),
+        },
+    )])
+    with open(cert, "rb") as c, open(key, "rb") as k:
+        credentials = grpc.ssl_server_credentials([(k.read(), c.read())])
+    server.add_secure_port(f"127.0.0.1:{port}", credentials)
+    return server
+
+
+class ImapConnection:
+    """
+    Just enough IMAP4rev1 for EmailPoller: LOGIN, SELECT, UID SEARCH/FETCH/STORE,
+    NOOP, IDLE, CLOSE and LOGOUT against the shared in-memory mailbox.
+    """
+
+    UID_VALIDITY = 1
+
+    def __init__(self, state, reader, writer):
+        self.state = state
+        self.reader = reader
+        self.writer = writer
+        self.idle_tag = None
+
+    def send(self, line):
+        self.writer.write(line.encode() + b"\r\n")
+
+    def notify_exists(self, count):
+        self.send(f"* {count} EXISTS")
+
+    async def run(self):
+        self.send("* OK [CAPABILITY IMAP4rev1 IDLE] Fake IMAP ready")
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                line = line.decode().rstrip("\r\n")
+                if self.idle_tag is not None:
+                    if line.upper() == "DONE":
+                        self.state.idle_waiters.discard(self)
+                        self.send(f"{self.idle_tag} OK IDLE terminated")
+                        self.idle_tag = None
+                    continue
+                tag, _, rest = line.partition(" ")
+                await self.state.serve("imap")
+                if not await self.handle(tag, rest):
+                    break
+                await self.writer.drain()
+        except (ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            self.state.idle_waiters.discard(self)
+            self.writer.close()
+
+    async def handle(self, tag, rest):
+        command, _, args = rest.partition(" ")
+        command = command.upper()
+        mailbox = self.state.mailbox
+        if command == "CAPABILITY":
+            self.send("* CAPABILITY IMAP4rev1 IDLE")
+        elif command == "SELECT":
+            self.send(f"* {len(mailbox)} EXISTS")
+            self.send(f"* OK [UIDVALIDITY {self.UID_VALIDITY}] UIDs valid")
+            self.send(f"* OK [UIDNEXT {len(mailbox) + 1}] Predicted next UID")
+            self.send(f"{tag} OK [READ-WRITE] SELECT completed")
+            return True
+        elif command == "IDLE":
+            self.idle_tag = tag
+            self.state.idle_waiters.add(self)
+            self.send("+ idling")
+            return True
+        elif command == "UID":
+            self.handle_uid(args)
+        elif command == "LOGOUT":
+            self.send("* BYE Logging out")
+            self.send(f"{tag} OK LOGOUT completed")
+            await self.writer.drain()
+            return False
+        self.send(f"{tag} OK {command} completed")
+        return True
+
+    def handle_uid(self, args):
+        command, _, args = args.partition(" ")
+        command = command.upper()
+        mailbox = self.state.mailbox
+        if command == "SEARCH":
+            if "UNSEEN" in args.upper():
+                uids = [m["uid"] for m in mailbox if not m["seen"]]
+            else:
+                low = int(args.split()[-1].split(":")[0])
+                uids = [m["uid"] for m in mailbox if m["uid"] >= low]
+                if not uids and mailbox:
+                    uids = [mailbox[-1]["uid"]]  # "N:*" always matches the newest message
+            self.send("* SEARCH " + " ".join(map(str, uids)))
+        elif command == "FETCH":
+            sequence, _, _ = args.partition(" ")
+            for uid in self.parse_uids(sequence):
+                raw = mailbox[uid - 1]["raw"]
+                header, _, body = raw.partition(b"\r\n\r\n")
+                header += b"\r\n\r\n"
+                self.writer.write(
+                    f"* {uid} FETCH (UID {uid} BODY[HEADER.FIELDS (FROM TO SUBJECT DATE MESSAGE-ID)] "
+                    f"{{{len(header)}}}\r\n".encode() + header
+                    + f" BODY[1]<0> {{{len(body)}}}\r\n".encode() + body + b")\r\n"
+                )
+        elif command == "STORE":
+            for uid in self.parse_uids(args.partition(" ")[0]):
+                mailbox[uid - 1]["seen"] = True
+
+    def parse_uids(self, sequence):
+        uids = []
+        for part in sequence.split(","):
+            low, _, high = part.partition(":")
+            high = len(self.state.mailbox) if high == "*" else int(high or low)
+            uids.extend(range(int(low), high + 1))
+        return [uid for uid in uids if 1 <= uid <= len(self.state.mailbox)]
+
+
+async def serve(args):
+    import uvicorn
+
+    state = FakeState(
+        latency=dict(item.split("=", 1) for item in args.latency),
+        errors={name: float(rate) for name, rate in (item.split("=", 1) for item in args.errors)},
+        fire_rate=args.fire_rate,
+        call_rate=args.call_rate,
+    )
+
+    tls = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    tls.load_cert_chain(args.cert, args.key)
+    imap_server = await asyncio.start_server(
+        lambda reader, writer: ImapConnection(state, reader, writer).run(),
+        "127.0.0.1", args.imap_port, ssl=tls,
+    )
+
+    gemini_server = create_gemini_server(state, args.grpc_port, args.cert, args.key)
+    await gemini_server.start()
+
+    http_server = uvicorn.Server(uvicorn.Config(
+        create_http_app(state), host="127.0.0.1", port=args.http_port, log_level="warning",
+    ))
+    print(f"Fakes listening: http={args.http_port} grpc={args.grpc_port} imap={args.imap_port}", flush=True)
+    try:
+        await http_server.serve()
+    finally:
+        imap_server.close()
+        await gemini_server.stop(None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--http-port", type=int, default=9100)
+    parser.add_argument("--grpc-port", type=int, default=9101)
+    parser.add_argument("--imap-port", type=int, default=9102)
+    parser.add_argument("--cert", required=True)
+    parser.add_argument("--key", required=True)
+    parser.add_argument("--latency", action="append", default=[], metavar="SERVICE=SPEC",
+                        help="e.g. roboflow=lognormal:120:0.3 (milliseconds)")
+    parser.add_argument("--errors", action="append", default=[], metavar="SERVICE=RATE",
+                        help="fraction of requests to fail, e.g. mailjet=0.05")
+    parser.add_argument("--fire-rate", type=float, default=0.1, help="fraction of Roboflow calls that find fire")
+    parser.add_argument("--call-rate", type=float, default=0.0, help="fraction of Gemini analyses that call for help")
+    asyncio.run(serve(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,444 @@
+"""
+Load-test the backend end to end against local fakes of every external service.
+
+Starts benchmarks.fakes and the FastAPI app (uvicorn) as subprocesses, wires the
+app to the fakes through its config environment variables, runs one or more
+scenarios and reports client-side throughput and latency percentiles next to
+the per-stage breakdown scraped from the app's /metrics endpoint.
+
+Scenarios:
+
+    streams        N camera streams posting frames to /test at a fixed rate
+    status-storm   many users reply STATUS to their alert emails at once
+    calls          concurrent multi-turn Twilio conversations
+    all            the three above, one after another
+
+Examples (run from the backend directory):
+
+    python -m benchmarks.loadtest streams --streams 16 --fps 2 --duration 30
+    python -m benchmarks.loadtest status-storm --users 20 --replies 100 --errors mailjet=0.05
+    python -m benchmarks.loadtest calls --calls 10 --turns 4 --latency cerebras=lognormal:400:0.5
+    python -m benchmarks.loadtest all --json results.json
+
+--latency and --errors take SERVICE=VALUE for roboflow, supabase, mailjet, gemini,
+cerebras, twilio and imap (see benchmarks.fakes for the distribution syntax).
+--app-env passes extra settings to the app, e.g. --app-env PREFILTER_ENABLED=false.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+import numpy as np
+from PIL import Image
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+METRIC_LINE = re.compile(r'^(firewatch_stage_\w+?)(_bucket|_sum|_count)?\{stage="([^"]+)"(?:,le="([^"]+)")?\} (\S+)$')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+def make_frames(count, fire, width=1280, height=720, seed=0):
+    """Distinct camera-like JPEG frames; fire frames have a flame-coloured region that passes the prefilter."""
+    rng = np.random.default_rng(seed + (1000 if fire else 0))
+    y, x = np.mgrid[0:height, 0:width]
+    frames = []
+    for _ in range(count):
+        tint = rng.integers(40, 160, size=3)
+        image = np.stack([(x * tint[0] // width), (y * tint[1] // height), np.full_like(x, tint[2])], axis=-1)
+        image = np.clip(image + rng.integers(-6, 6, size=(height, width, 3)), 0, 255).astype(np.uint8)
+        if fire:
+            top, left = rng.integers(0, height // 2), rng.integers(0, width // 2)
+            image[top:top + height // 3, left:left + width // 3] = (240, 120, 30)
+        buffer = io.BytesIO()
+        Image.fromarray(image).save(buffer, format="JPEG", quality=80)
+        frames.append(buffer.getvalue())
+    return frames
+
+
+def parse_metrics(text):
+    """Stage histograms and error counters from the app's /metrics output."""
+    stages = {}
+    for line in text.splitlines():
+        match = METRIC_LINE.match(line)
+        if not match:
+            continue
+        name, suffix, stage, le, value = match.groups()
+        entry = stages.setdefault(stage, {"buckets": {}, "sum": 0.0, "count": 0, "errors": 0})
+        if name == "firewatch_stage_duration_seconds" and suffix == "_bucket":
+            entry["buckets"][float(le)] = float(value)
+        elif name == "firewatch_stage_duration_seconds" and suffix == "_sum":
+            entry["sum"] = float(value)
+        elif name == "firewatch_stage_duration_seconds" and suffix == "_count":
+            entry["count"] = int(float(value))
+        elif name == "firewatch_stage_errors_total":
+            entry["errors"] = int(float(value))
+    return stages
+
+
+def stage_breakdown(before, after):
+    """Per-stage count, mean and interpolated p50/p95 for what happened between two scrapes."""
+    rows = {}
+    for stage, end in after.items():
+        start = before.get(stage, {"buckets": {}, "sum": 0.0, "count": 0, "errors": 0})
+        count = end["count"] - start["count"]
+        if count <= 0:
+            continue
+        buckets = sorted((le, value - start["buckets"].get(le, 0)) for le, value in end["buckets"].items())
+        rows[stage] = {
+            "count": count,
+            "errors": end["errors"] - start["errors"],
+            "mean_ms": (end["sum"] - start["sum"]) / count * 1000,
+            "p50_ms": histogram_quantile(buckets, count, 0.50),
+            "p95_ms": histogram_quantile(buckets, count, 0.95),
+        }
+    return rows
+
+
+def histogram_quantile(buckets, count, q):
+    """Linear interpolation inside the bucket holding the quantile, like Prometheus' histogram_quantile."""
+    rank = q * count
+    previous_le, previous_count = 0.0, 0.0
+    for le, cumulative in buckets:
+        if cumulative >= rank:
+            if le == float("inf"):
+                return previous_le * 1000
+            fraction = (rank - previous_count) / (cumulative - previous_count) if cumulative > previous_count else 1
+            return (previous_le + (le - previous_le) * fraction) * 1000
+        previous_le, previous_count = le, cumulative
+    return previous_le * 1000
+
+
+class Environment:
+    """The fakes and the app under test, running as subprocesses in a scratch directory."""
+
+    def __init__(self, args):
+        self.args = args
+        self.workdir = tempfile.mkdtemp(prefix="firewatch-bench-")
+        self.ports = {name: free_port() for name in ("app", "http", "grpc", "imap")}
+        self.app_url = f"http://127.0.0.1:{self.ports['app']}"
+        self.fakes_url = f"http://127.0.0.1:{self.ports['http']}"
+        self.processes = []
+
+    def __enter__(self):
+        cert, key = os.path.join(self.workdir, "cert.pem"), os.path.join(self.workdir, "key.pem")
+        subprocess.run([
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+            "-keyout", key, "-out", cert, "-subj", "/CN=localhost",
+            "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1",
+        ], check=True, capture_output=True)
+
+        fakes_command = [
+            sys.executable, "-m", "benchmarks.fakes",
+            "--http-port", str(self.ports["http"]), "--grpc-port", str(self.ports["grpc"]),
+            "--imap-port", str(self.ports["imap"]), "--cert", cert, "--key", key,
+            "--fire-rate", str(self.args.fire_rate), "--call-rate", str(self.args.call_rate),
+        ]
+        for item in self.args.latency:
+            fakes_command += ["--latency", item]
+        for item in self.args.errors:
+            fakes_command += ["--errors", item]
+        self._spawn("fakes", fakes_command, cwd=BACKEND_DIR, env=os.environ)
+        self._wait_ready(f"{self.fakes_url}/_control/stats")
+
+        http = f"http://127.0.0.1:{self.ports['http']}"
+        env = dict(
+            os.environ,
+            WEBHOOK_BASE_URL=self.app_url,
+            NEXT_PUBLIC_SUPABASE_URL=http,
+            NEXT_PUBLIC_SUPABASE_ANON_KEY="bench",
+            ROBOFLOW_MODEL_URL=f"{http}/roboflow/fire-smoke-spark/2",
+            MAILJET_API_URL=f"{http}/",
+            MAILJET_API_KEY="bench",
+            MAILJET_SECRET_KEY="bench",
+            EMAIL_FROM="alerts@firewatch.test",
+            CEREBRAS_BASE_URL=http,
+            CEREBRAS_API_KEY="bench",
+            GEMINI_API_ENDPOINT=f"localhost:{self.ports['grpc']}",
+            GEMINI_API_KEY="bench",
+            GRPC_DEFAULT_SSL_ROOTS_FILE_PATH=cert,
+            TWILIO_API_URL=http,
+            TWILIO_ACCOUNT_SID="ACbench",
+            TWILIO_AUTH_TOKEN="bench",
+            TWILIO_PHONE_NUMBER="+15550000000",
+            EMAIL_IMAP_SERVER="127.0.0.1",
+            EMAIL_IMAP_PORT=str(self.ports["imap"]),
+            EMAIL_USERNAME="alerts@firewatch.test",
+            EMAIL_PASSWORD="bench",
+            EMAIL_STATE_PATH=os.path.join(self.workdir, "email_state.json"),
+            ALERT_DEDUP_PATH=os.path.join(self.workdir, "alert_dedup.db"),
+            CONVERSATION_DB_PATH=os.path.join(self.workdir, "conversations.db"),
+        )
+        env.update(item.split("=", 1) for item in self.args.app_env)
+        self._spawn("app", [
+            sys.executable, "-m", "uvicorn", "main:app", "--app-dir", BACKEND_DIR,
+            "--host", "127.0.0.1", "--port", str(self.ports["app"]),
+            "--workers", str(self.args.workers), "--log-level", "warning",
+        ], cwd=self.workdir, env=env)
+        self._wait_ready(f"{self.app_url}/health/clients", timeout=60)
+        return self
+
+    def __exit__(self, *exc_info):
+        for process, log in self.processes:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            log.close()
+        print(f"Logs kept in {self.workdir}")
+
+    def _spawn(self, name, command, cwd, env):
+        log = open(os.path.join(self.workdir, f"{name}.log"), "w")
+        process = subprocess.Popen(command, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+        self.processes.append((process, log))
+
+    def _wait_ready(self, url, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            for process, log in self.processes:
+                if process.poll() is not None:
+                    raise RuntimeError(f"Process exited early, see {log.name}")
+            try:
+                if httpx.get(url, timeout=1).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"Timed out waiting for {url}")
+
+
+async def post_frame(client, app_url, user_uuid, frame_number, frame, user_email=None):
+    data = {"frame_number": str(frame_number), "timestamp": f"{time.time():.3f}", "user_uuid": user_uuid}
+    if user_email:
+        data["user_email"] = user_email
+    return await client.post(f"{app_url}/test", data=data,
+                             files={"image_data": ("frame.jpg", frame, "image/jpeg")})
+
+
+async def run_streams(env, client, args):
+    """N streams each posting frames at `fps`; a fraction of them look like fire."""
+    await client.post(f"{env.fakes_url}/_control/config", json={"fire_rate": args.fire_rate})
+    benign, fire = make_frames(8, fire=False), make_frames(8, fire=True)
+    latencies, statuses, sources = [], [], {}
+    deadline = time.monotonic() + args.duration
+
+    async def stream(index):
+        interval = 1 / args.fps
+        next_at = time.monotonic() + random.random() * interval
+        frame_number = 0
+        while next_at < deadline:
+            await asyncio.sleep(max(0.0, next_at - time.monotonic()))
+            next_at += interval
+            frame_number += 1
+            frame = random.choice(fire if random.random() < args.fire_frames else benign)
+            started = time.perf_counter()
+            try:
+                response = await post_frame(client, env.app_url, f"bench-stream-{index}", frame_number, frame,
+                                            f"stream{index}@bench.test" if args.emails else None)
+                statuses.append(response.status_code)
+                if response.status_code == 200:
+                    source = response.json().get("detection_source")
+                    sources[source] = sources.get(source, 0) + 1
+            except httpx.HTTPError:
+                statuses.append(None)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(stream(i) for i in range(args.streams)))
+    elapsed = time.perf_counter() - started
+    return summarize("streams", latencies, statuses, elapsed, detection_sources=sources,
+                     offered_fps=args.streams * args.fps)
+
+
+async def run_status_storm(env, client, args):
+    """Give each user an alert email, then have them all reply STATUS at once."""
+    await client.post(f"{env.fakes_url}/_control/config", json={"fire_rate": 1.0})
+    fire = make_frames(4, fire=True, seed=1)
+    users = [(f"bench-storm-{i}", f"storm{i}@bench.test") for i in range(args.users)]
+
+    # Two positive frames per user open an incident, upload the frame and send the alert
+    setup_started = time.time()
+    await asyncio.gather(*(
+        post_frame(client, env.app_url, user_uuid, n, fire[n % len(fire)], email)
+        for user_uuid, email in users for n in (1, 2)
+    ))
+    alerted = await wait_for_mail(client, env, setup_started, "URGENT", {email for _, email in users}, timeout=60)
+    if len(alerted) < len(users):
+        print(f"Only {len(alerted)} of {len(users)} users received an alert; replies from the rest are ignored")
+
+    before = (await client.get(f"{env.app_url}/email-commands/stats")).json()
+    senders = [users[i % len(users)][1] for i in range(args.replies)]
+    injected = (await client.post(f"{env.fakes_url}/_control/imap/messages", json={
+        "messages": [{"from": sender, "body": "STATUS"} for sender in senders]
+    })).json()["injected_at"]
+
+    delivered = await wait_for_mail(client, env, injected, "Fire Status Analysis", alerted, timeout=args.storm_timeout)
+    after = (await client.get(f"{env.app_url}/email-commands/stats")).json()
+    latencies = [at - injected for at in delivered.values()]
+    elapsed = max(latencies) if latencies else args.storm_timeout
+    return summarize(
+        "status-storm", latencies, [200] * len(latencies), elapsed,
+        replies=args.replies, users_alerted=len(alerted), users_answered=len(delivered),
+        commands={key: after[key] - before.get(key, 0) for key in after if isinstance(after[key], int)},
+    )
+
+
+async def wait_for_mail(client, env, since, subject, recipients, timeout):
+    """Wait until each recipient has a mail with `subject` sent after `since`; returns {recipient: first sent time}."""
+    first = {}
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and len(first) < len(recipients):
+        for mail in (await client.get(f"{env.fakes_url}/_control/mail", params={"since": since})).json():
+            if subject in mail["subject"] and mail["to"] in recipients and mail["to"] not in first:
+                first[mail["to"]] = mail["at"]
+        await asyncio.sleep(0.2)
+    return first
+
+
+async def run_calls(env, client, args):
+    """Concurrent calls, each greeting then `turns` operator utterances answered by the assistant."""
+    first_audio, turn_latencies, statuses = [], [], []
+    utterances = [
+        "This is the fire department, what is your emergency?",
+        "What is the address of the fire?",
+        "Is anyone inside the building?",
+        "How big is the fire right now?",
+        "Units are on the way, please stay on the line.",
+    ]
+
+    async def post(path, data):
+        response = await client.post(f"{env.app_url}{path}", data=data)
+        statuses.append(response.status_code)
+        return response
+
+    async def call(index):
+        call_sid = f"CAbench{index:06d}"
+        await post("/fire-conversation", {"CallSid": call_sid})
+        for turn in range(args.turns):
+            started = time.perf_counter()
+            response = await post("/fire-conversation-response",
+                                  {"CallSid": call_sid, "SpeechResult": utterances[turn % len(utterances)]})
+            first_audio.append(time.perf_counter() - started)
+            if "/fire-conversation-continue" in response.text:
+                await post("/fire-conversation-continue", {"CallSid": call_sid})
+            turn_latencies.append(time.perf_counter() - started)
+        await post("/fire-conversation-status", {"CallSid": call_sid, "CallStatus": "completed"})
+
+    started = time.perf_counter()
+    await asyncio.gather(*(call(i) for i in range(args.calls)))
+    elapsed = time.perf_counter() - started
+    result = summarize("calls", turn_latencies, statuses, elapsed, calls=args.calls, turns=args.turns)
+    result["first_audio_ms"] = latency_summary(first_audio)
+    return result
+
+
+def latency_summary(latencies):
+    return {f"p{q}": round(percentile(latencies, q) * 1000, 1) if latencies else None for q in (50, 90, 99)} | {
+        "max": round(max(latencies) * 1000, 1) if latencies else None
+    }
+
+
+def summarize(name, latencies, statuses, elapsed, **extra):
+    ok = sum(1 for status in statuses if status is not None and status < 400)
+    return dict({
+        "scenario": name,
+        "requests": len(statuses),
+        "ok": ok,
+        "errors": len(statuses) - ok,
+        "seconds": round(elapsed, 2),
+        "throughput_per_s": round(ok / elapsed, 2) if elapsed else None,
+        "latency_ms": latency_summary(latencies),
+    }, **extra)
+
+
+def print_report(result):
+    print(f"\n== {result['scenario']} ==")
+    for key, value in result.items():
+        if key not in ("scenario", "stages", "fakes"):
+            print(f"  {key}: {value}")
+    print(f"  {'stage':<34} {'count':>7} {'errors':>7} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    for stage, row in sorted(result["stages"].items(), key=lambda item: -item[1]["mean_ms"] * item[1]["count"]):
+        print(f"  {stage:<34} {row['count']:>7} {row['errors']:>7} {row['mean_ms']:>9.1f} "
+              f"{row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f}")
+    print(f"  fake requests: {result['fakes']['requests']}")
+    if result["fakes"]["injected_errors"]:
+        print(f"  injected errors: {result['fakes']['injected_errors']}")
+
+
+SCENARIOS = {"streams": run_streams, "status-storm": run_status_storm, "calls": run_calls}
+
+
+async def run(args):
+    names = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    results = []
+    with Environment(args) as env:
+        limits = httpx.Limits(max_connections=1000, max_keepalive_connections=1000)
+        async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as client:
+            for name in names:
+                metrics_before = parse_metrics((await client.get(f"{env.app_url}/metrics")).text)
+                fakes_before = (await client.get(f"{env.fakes_url}/_control/stats")).json()
+                result = await SCENARIOS[name](env, client, args)
+                await asyncio.sleep(1)  # let background incident jobs finish recording
+                metrics_after = parse_metrics((await client.get(f"{env.app_url}/metrics")).text)
+                fakes_after = (await client.get(f"{env.fakes_url}/_control/stats")).json()
+                result["stages"] = stage_breakdown(metrics_before, metrics_after)
+                result["fakes"] = {
+                    key: {service: count - fakes_before[key].get(service, 0) for service, count in fakes_after[key].items()}
+                    for key in ("requests", "injected_errors")
+                }
+                print_report(result)
+                results.append(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("scenario", choices=list(SCENARIOS) + ["all"])
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--latency", action="append", default=[], metavar="SERVICE=SPEC")
+    parser.add_argument("--errors", action="append", default=[], metavar="SERVICE=RATE")
+    parser.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE")
+    parser.add_argument("--timeout", type=float, default=30, help="client request timeout in seconds")
+    parser.add_argument("--json", help="also write results to this file")
+    streams = parser.add_argument_group("streams")
+    streams.add_argument("--streams", type=int, default=8)
+    streams.add_argument("--fps", type=float, default=2)
+    streams.add_argument("--duration", type=float, default=20)
+    streams.add_argument("--fire-frames", type=float, default=0.2, help="fraction of frames that look like fire")
+    streams.add_argument("--fire-rate", type=float, default=0.3, help="fraction of Roboflow calls that find fire")
+    streams.add_argument("--emails", action="store_true", help="send user_email so positives trigger alerts")
+    storm = parser.add_argument_group("status-storm")
+    storm.add_argument("--users", type=int, default=20)
+    storm.add_argument("--replies", type=int, default=100)
+    storm.add_argument("--storm-timeout", type=float, default=120)
+    calls = parser.add_argument_group("calls")
+    calls.add_argument("--calls", type=int, default=10)
+    calls.add_argument("--turns", type=int, default=4)
+    calls.add_argument("--call-rate", type=float, default=0.0, help="fraction of Gemini analyses returning a call_help_operator function call")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,47 +1,160 @@
 import os
 from dotenv import load_dotenv
-from pyngrok import ngrok
 
 # Load environment variables
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env.local'))
 
 # Cerebras configuration
 CEREBRAS_API_KEY = os.getenv("CEREBRAS_API_KEY")
+CEREBRAS_BASE_URL = os.getenv("CEREBRAS_BASE_URL")  # None uses the SDK default
+CEREBRAS_STREAMING = os.getenv("CEREBRAS_STREAMING", "true").lower() == "true"  # speak the first sentence early
 
-# convo history
-conversation_history = {}
+# Conversation store for live calls
+CONVERSATION_IDLE_TTL = float(os.getenv("CONVERSATION_IDLE_TTL", "1800"))  # seconds without activity
+CONVERSATION_ENDED_TTL = float(os.getenv("CONVERSATION_ENDED_TTL", "60"))  # seconds after hangup
+CONVERSATION_MAX_TOKENS = int(os.getenv("CONVERSATION_MAX_TOKENS", "2000"))  # per-turn prompt budget
+CONVERSATION_SUMMARY_CHARS = int(os.getenv("CONVERSATION_SUMMARY_CHARS", "600"))
+CONVERSATION_BACKEND = os.getenv("CONVERSATION_BACKEND", "memory")  # "memory" (single worker) or "sqlite"
+CONVERSATION_DB_PATH = os.getenv("CONVERSATION_DB_PATH", os.path.join(os.path.dirname(__file__), "conversations.db"))
 
-#ngrok configuration
-public_url = ngrok.connect(8000)
-print("Public URL:", public_url.public_url)
+#ngrok configuration; a fixed WEBHOOK_BASE_URL (e.g. for benchmarks or a deployed host) skips the tunnel
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL")
+if not WEBHOOK_BASE_URL:
+    from pyngrok import ngrok
+    public_url = ngrok.connect(8000)
+    print("Public URL:", public_url.public_url)
 
-# Make the URL available to other modules
-WEBHOOK_BASE_URL = public_url.public_url
+    # Make the URL available to other modules, and to worker processes so they don't open their own tunnel
+    WEBHOOK_BASE_URL = os.environ["WEBHOOK_BASE_URL"] = public_url.public_url
 
 # Supabase configuration
 SUPABASE_URL = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
 SUPABASE_KEY = os.getenv("NEXT_PUBLIC_SUPABASE_ANON_KEY")
+SUPABASE_BUCKET = os.getenv("SUPABASE_BUCKET", "fireimages")
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "10"))  # seconds per request
+SUPABASE_MAX_RETRIES = int(os.getenv("SUPABASE_MAX_RETRIES", "2"))
+SUPABASE_MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "10"))
 
 #Twilio configuration
 TWILIO_ACCOUNT_SID=os.getenv("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN=os.getenv("TWILIO_AUTH_TOKEN")
 TWILIO_PHONE_NUMBER=os.getenv("TWILIO_PHONE_NUMBER")
+TWILIO_API_URL = os.getenv("TWILIO_API_URL")  # None uses https://api.twilio.com
+TWILIO_TIMEOUT = float(os.getenv("TWILIO_TIMEOUT", "10"))  # seconds per request; the SDK default never times out
 
 # Mailjet configuration
 MAILJET_API_KEY = os.getenv("MAILJET_API_KEY")
 MAILJET_SECRET_KEY = os.getenv("MAILJET_SECRET_KEY")
+MAILJET_API_URL = os.getenv("MAILJET_API_URL", "https://api.mailjet.com/")
 EMAIL_FROM = os.getenv("EMAIL_FROM")
 EMAIL_FROM_NAME = os.getenv("EMAIL_FROM_NAME", "Fire Detection System")
+MAILJET_BATCH_WINDOW = float(os.getenv("MAILJET_BATCH_WINDOW", "0.5"))  # seconds to collect alerts into one send
+MAILJET_BATCH_SIZE = int(os.getenv("MAILJET_BATCH_SIZE", "50"))
+MAILJET_MAX_RETRIES = int(os.getenv("MAILJET_MAX_RETRIES", "3"))
+MAILJET_RETRY_BACKOFF = float(os.getenv("MAILJET_RETRY_BACKOFF", "0.5"))  # seconds, doubled per attempt
 
 # Email IMAP settings
 EMAIL_IMAP_SERVER = os.getenv("EMAIL_IMAP_SERVER", "imap.gmail.com")
 EMAIL_IMAP_PORT = int(os.getenv("EMAIL_IMAP_PORT", "993"))
 EMAIL_USERNAME = os.getenv("EMAIL_USERNAME", EMAIL_FROM)
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
+EMAIL_IMAP_MODE = os.getenv("EMAIL_IMAP_MODE", "idle")  # "idle" (push) or "poll"
+EMAIL_IDLE_TIMEOUT = float(os.getenv("EMAIL_IDLE_TIMEOUT", "1500"))  # re-IDLE before the 29 minute server limit
+EMAIL_POLL_INTERVAL = float(os.getenv("EMAIL_POLL_INTERVAL", "1"))  # seconds, polling mode only
+EMAIL_STATE_PATH = os.getenv("EMAIL_STATE_PATH", os.path.join(os.path.dirname(__file__), "email_state.json"))
+EMAIL_DEDUP_WINDOW = int(os.getenv("EMAIL_DEDUP_WINDOW", "1000"))  # recent Message-IDs remembered
+EMAIL_COMMAND_CONCURRENCY = int(os.getenv("EMAIL_COMMAND_CONCURRENCY", "4"))
+EMAIL_COMMAND_MAX_PENDING = int(os.getenv("EMAIL_COMMAND_MAX_PENDING", "100"))
+EMAIL_BODY_PEEK_BYTES = int(os.getenv("EMAIL_BODY_PEEK_BYTES", "2048"))  # bytes of the first body part fetched
+
+# Alert dedup: each user gets at most one fire alert email per window, across all workers
+ALERT_DEDUP_BACKEND = os.getenv("ALERT_DEDUP_BACKEND", "memory")  # "memory" (single worker) or "sqlite"
+ALERT_DEDUP_WINDOW = float(os.getenv("ALERT_DEDUP_WINDOW", "300"))  # seconds
+ALERT_DEDUP_PATH = os.getenv("ALERT_DEDUP_PATH", os.path.join(os.path.dirname(__file__), "alert_dedup.db"))
+
+# Roboflow detection configuration
+ROBOFLOW_API_KEY = os.getenv("ROBOFLOW_API_KEY", "IU5B46WHH0ZwNfnUG2lM")
+ROBOFLOW_MODEL_URL = os.getenv("ROBOFLOW_MODEL_URL", "https://serverless.roboflow.com/fire-smoke-spark/2")
+ROBOFLOW_TIMEOUT = float(os.getenv("ROBOFLOW_TIMEOUT", "10"))  # seconds per request
+ROBOFLOW_MAX_CONNECTIONS = int(os.getenv("ROBOFLOW_MAX_CONNECTIONS", "20"))
+ROBOFLOW_MAX_CONCURRENCY = int(os.getenv("ROBOFLOW_MAX_CONCURRENCY", "16"))
+ROBOFLOW_BINARY_UPLOAD = os.getenv("ROBOFLOW_BINARY_UPLOAD", "false").lower() == "true"  # multipart JPEG instead of base64
+
+# Local fire-pixel prefilter (frames scoring below the threshold skip Roboflow)
+PREFILTER_ENABLED = os.getenv("PREFILTER_ENABLED", "true").lower() == "true"
+PREFILTER_THRESHOLD = float(os.getenv("PREFILTER_THRESHOLD", "0.05"))
+PREFILTER_SIZE = int(os.getenv("PREFILTER_SIZE", "160"))  # longest side in pixels
+
+# Image preprocessing: frames are downscaled to each model's native input before sending
+DETECTOR_INPUT_SIZE = int(os.getenv("DETECTOR_INPUT_SIZE", "640"))  # Roboflow model input, longest side
+LLM_INPUT_SIZE = int(os.getenv("LLM_INPUT_SIZE", "768"))  # Gemini image tile, longest side
+PREPROCESS_JPEG_QUALITY = int(os.getenv("PREPROCESS_JPEG_QUALITY", "85"))
+
+# Perceptual-hash frame cache (skips detection for near-identical frames)
+FRAME_CACHE_MAX_DISTANCE = int(os.getenv("FRAME_CACHE_MAX_DISTANCE", "4"))  # max differing bits out of 64
+FRAME_CACHE_ENTRIES_PER_STREAM = int(os.getenv("FRAME_CACHE_ENTRIES_PER_STREAM", "16"))
+FRAME_CACHE_MAX_STREAMS = int(os.getenv("FRAME_CACHE_MAX_STREAMS", "10000"))
+FRAME_CACHE_TTL = float(os.getenv("FRAME_CACHE_TTL", "60"))  # seconds
+
+# Frame streaming over WebSocket
+FRAME_STREAM_BUFFER = int(os.getenv("FRAME_STREAM_BUFFER", "4"))  # frames waiting per stream before the oldest is dropped
+FRAME_STREAM_CONCURRENCY = int(os.getenv("FRAME_STREAM_CONCURRENCY", "2"))  # frames in detection at once per stream
+
+# Server-side video ingestion (decoded and sampled in worker processes)
+VIDEO_WORKERS = int(os.getenv("VIDEO_WORKERS", str(os.cpu_count() or 1)))  # videos decoded in parallel
+VIDEO_SAMPLE_INTERVAL = float(os.getenv("VIDEO_SAMPLE_INTERVAL", "0.5"))  # seconds of video between sampled frames
+VIDEO_QUEUE_SIZE = int(os.getenv("VIDEO_QUEUE_SIZE", "16"))  # decoded frames buffered per video
+VIDEO_STALL_TIMEOUT = float(os.getenv("VIDEO_STALL_TIMEOUT", "120"))  # seconds a decoder waits on a full queue
+VIDEO_INPUT_DIR = os.getenv("VIDEO_INPUT_DIR")  # server directory videos may be read from by path; None disables
+VIDEO_JOB_HISTORY = int(os.getenv("VIDEO_JOB_HISTORY", "100"))
+
+# Background incident jobs (upload, email alert, Gemini analysis)
+INCIDENT_WORKERS = int(os.getenv("INCIDENT_WORKERS", "4"))
+INCIDENT_QUEUE_SIZE = int(os.getenv("INCIDENT_QUEUE_SIZE", "100"))
+INCIDENT_STAGE_RETRIES = int(os.getenv("INCIDENT_STAGE_RETRIES", "2"))
+INCIDENT_RETRY_DELAY = float(os.getenv("INCIDENT_RETRY_DELAY", "1"))  # seconds, grows per attempt
+INCIDENT_JOB_HISTORY = int(os.getenv("INCIDENT_JOB_HISTORY", "1000"))
+
+# Per-stream incident tracking (k-of-n frames over threshold opens an incident)
+INCIDENT_WINDOW = int(os.getenv("INCIDENT_WINDOW", "4"))  # n frames
+INCIDENT_MIN_HITS = int(os.getenv("INCIDENT_MIN_HITS", "2"))  # k frames
+INCIDENT_FRAME_THRESHOLD = float(os.getenv("INCIDENT_FRAME_THRESHOLD", "0.5"))
+INCIDENT_EMA_ALPHA = float(os.getenv("INCIDENT_EMA_ALPHA", "0.3"))
+INCIDENT_CLOSE_EMA = float(os.getenv("INCIDENT_CLOSE_EMA", "0.2"))
+INCIDENT_IDLE_TIMEOUT = float(os.getenv("INCIDENT_IDLE_TIMEOUT", "600"))  # seconds
+
+# Adaptive sampling: seconds each stream is told to wait before sending its next frame
+SAMPLING_MIN_INTERVAL = float(os.getenv("SAMPLING_MIN_INTERVAL", "0.25"))  # while an incident is open or confidence is up
+SAMPLING_BASE_INTERVAL = float(os.getenv("SAMPLING_BASE_INTERVAL", "1"))
+SAMPLING_MAX_INTERVAL = float(os.getenv("SAMPLING_MAX_INTERVAL", "10"))  # long-quiet scenes
+SAMPLING_BACKOFF = float(os.getenv("SAMPLING_BACKOFF", "1.5"))  # interval growth per clean frame once quiet
+SAMPLING_QUIET_PERIOD = float(os.getenv("SAMPLING_QUIET_PERIOD", "30"))  # seconds of clean frames before backing off
+SAMPLING_HOT_CONFIDENCE = float(os.getenv("SAMPLING_HOT_CONFIDENCE", "0.3"))
+SAMPLING_CLEAN_CONFIDENCE = float(os.getenv("SAMPLING_CLEAN_CONFIDENCE", "0.1"))
+SAMPLING_RISE_DELTA = float(os.getenv("SAMPLING_RISE_DELTA", "0.1"))  # EMA increase per frame that counts as rising
+SAMPLING_EMA_ALPHA = float(os.getenv("SAMPLING_EMA_ALPHA", "0.5"))
+
+# Resilience for external calls: request budgets, circuit breakers and hedged requests
+FRAME_BUDGET = float(os.getenv("FRAME_BUDGET", "5"))  # seconds from a frame's arrival to its result
+CONVERSATION_BUDGET = float(os.getenv("CONVERSATION_BUDGET", "8"))  # Twilio abandons a webhook after 15 seconds
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))  # consecutive failures that open a circuit
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))  # seconds before a probe call is let through
+ROBOFLOW_HEDGE_AFTER = float(os.getenv("ROBOFLOW_HEDGE_AFTER", "1"))  # seconds before a duplicate request; 0 disables
+CEREBRAS_TIMEOUT = float(os.getenv("CEREBRAS_TIMEOUT", "8"))
+CEREBRAS_HEDGE_AFTER = float(os.getenv("CEREBRAS_HEDGE_AFTER", "1.5"))  # 0 disables
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "30"))
+
+# Shared clients: a provider that doesn't answer its warmup in time is marked degraded instead of holding up startup
+CLIENT_WARMUP_TIMEOUT = float(os.getenv("CLIENT_WARMUP_TIMEOUT", "10"))  # seconds
 
 # Gemini API configuration
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")  # host:port of the gRPC API; None uses the SDK default
+GEMINI_CACHE_SIZE = int(os.getenv("GEMINI_CACHE_SIZE", "256"))
+GEMINI_CACHE_TTL = float(os.getenv("GEMINI_CACHE_TTL", "600"))  # seconds
 
 # Storage settings
 UPLOAD_DIR = "uploaded_frames"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
\ No newline at end of file
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+FRAME_STORE_MEMORY_BYTES = int(os.getenv("FRAME_STORE_MEMORY_BYTES", str(64 * 1024 * 1024)))  # recent frames kept in memory
+FRAME_STORE_DISK_FILES = int(os.getenv("FRAME_STORE_DISK_FILES", "1000"))  # frames spilled to UPLOAD_DIR/cache
\ No newline at end of file
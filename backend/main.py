@@ -1,27 +1,44 @@
 import os
-import random
+import time
+import shutil
+import uuid
 import asyncio
-from fastapi import FastAPI, File, Form, UploadFile
+from typing import List, Optional
+from pydantic import EmailStr
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
 from pyngrok import ngrok
 from twilio.twiml.voice_response import VoiceResponse, Gather
 from fastapi.responses import PlainTextResponse
 from fastapi import Form, Request
-import base64
-import requests
 
 # Import services
 from services.storage_service import upload_fire_image
-from services.email_service import send_email_alert, notified_users, start_email_polling_thread
+from services.detection_service import detect_fire
+from services.clients import clients
+from services.frame_cache import frame_cache, compute_dhash
+from services.frame_store import frame_store
+from services.prefilter import prefilter_score
+from services.preprocessing import PreparedFrame
+from services.incident_jobs import incident_jobs
+from services.frame_stream import frame_streams
+from services.video_ingest import video_ingestor
+from services.incident_service import incident_tracker
+from services.sampling_controller import sampling_controller
+from services.command_dispatcher import command_dispatcher
+from services.mail_outbox import mail_outbox
+from services.email_service import send_email_alert, start_email_polling_thread
+from services.dedup_store import alert_dedup
+from services.metrics import metrics, RequestStartMiddleware
+from services.resilience import resilience, budget
 from models.schemas import FireDetectionResponse
-from config import conversation_history
+from config import PREFILTER_ENABLED, PREFILTER_THRESHOLD, CEREBRAS_STREAMING, UPLOAD_DIR, VIDEO_INPUT_DIR
+from config import FRAME_BUDGET, CONVERSATION_BUDGET
 from services.ai_service import generate_conversation_response
+from services.ai_service import stream_conversation_response, finish_conversation_response, cancel_conversation_response
 from services.ai_service import SYSTEM_PROMPT
-from services.ai_service import analyze_fire_image_with_gemini
-
-
-alreadyCalled = False
-analysis = None
+from services.ai_service import escalate_fire_incident
+from services.conversation_store import conversation_store
 
 
 app = FastAPI()
@@ -34,135 +51,353 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(RequestStartMiddleware)
+
+# Frames by where their result came from, and queue depths read at scrape time
+metrics.counter("firewatch_frames_total", "Frames processed, by detection source.", "source")
+metrics.gauge("firewatch_queue_depth", "Items waiting in each background queue.", "queue", lambda: {
+    "incident_jobs": incident_jobs.depth(),
+    "mail_outbox": mail_outbox.stats()["queued"],
+    "email_commands": command_dispatcher.stats()["queued"],
+})
+metrics.gauge("firewatch_circuit_open", "1 while a provider's circuit breaker is failing calls fast.", "provider",
+              lambda: {provider: int(breaker.state == "open") for provider, breaker in resilience.breakers.items()})
+
 @app.post("/test")
 async def receive_data(
+    request: Request,
     frame_number: int = Form(...),
     timestamp: float = Form(...),
     user_uuid: str = Form(...),
-    user_email: str = Form(None),
+    # Validated the same way as on /test-batch; a malformed address is rejected with 422
+    user_email: Optional[EmailStr] = Form(None),
     image_data: UploadFile = File(...)
 ):
-    global alreadyCalled
-    global analysis
-    # Get file content
+    # Get file content; parse time runs from the request's arrival until its bytes are in hand
     file_content = await image_data.read()
-    file_size = len(file_content)
+    metrics.observe("request_parse", time.perf_counter() - request.state.received_at)
+    with budget(FRAME_BUDGET, since=request.state.received_at):
+        return await process_frame(frame_number, timestamp, user_uuid, user_email, file_content)
+
+@app.post("/test-batch", response_model=List[FireDetectionResponse])
+async def receive_batch(
+    request: Request,
+    frame_numbers: List[int] = Form(...),
+    timestamps: List[float] = Form(...),
+    user_uuid: str = Form(...),
+    # Validated up front: the response model echoes it as an EmailStr
+    user_email: Optional[EmailStr] = Form(None),
+    image_data: List[UploadFile] = File(...)
+):
+    """
+    Receive several frames from one stream in a single multipart request.
+    Each frame goes to detection as soon as its bytes are read, and the results
+    come back in request order with the same fields as /test. An invalid
+    user_email is rejected with 422 before any frame is processed.
+    """
+    if not (len(frame_numbers) == len(timestamps) == len(image_data)):
+        raise HTTPException(
+            status_code=400,
+            detail="frame_numbers, timestamps and image_data must have the same length"
+        )
+
+    metrics.observe("request_parse", time.perf_counter() - request.state.received_at)
+
+    async def handle(frame_number, timestamp, upload):
+        file_content = await upload.read()
+        return await process_frame(frame_number, timestamp, user_uuid, user_email, file_content)
+
+    with budget(FRAME_BUDGET, since=request.state.received_at):
+        return await asyncio.gather(*(
+            handle(frame_number, timestamp, upload)
+            for frame_number, timestamp, upload in zip(frame_numbers, timestamps, image_data)
+        ))
+
+@app.websocket("/ws/frames/{user_uuid}")
+async def stream_frames(websocket: WebSocket, user_uuid: str, user_email: str = None):
+    """
+    Persistent frame stream for one camera. Binary messages carry a frame
+    (length-prefixed header with frame_number and timestamp, then the JPEG);
+    detection results, dropped-frame notices and finished incident jobs are
+    pushed back as JSON text messages. Send {"type": "end"} to have every
+    outstanding frame answered before the server closes the stream.
+    """
+    await frame_streams.serve(websocket, user_uuid, user_email, process_frame)
+
+@app.post("/videos")
+async def ingest_video(
+    user_uuid: str = Form(...),
+    user_email: str = Form(None),
+    sample_interval: float = Form(None),
+    path: str = Form(None),
+    video: UploadFile = File(None)
+):
+    """
+    Process a whole video server-side, either uploaded or (if VIDEO_INPUT_DIR is
+    set) a file already in that directory. Returns immediately with a video_id
+    to poll; frames go through the same detection and incident path as /test.
+    """
+    if (video is None) == (path is None):
+        raise HTTPException(status_code=400, detail="Provide exactly one of video or path")
+    if sample_interval is not None and sample_interval <= 0:
+        raise HTTPException(status_code=400, detail="sample_interval must be positive")
+
+    if video is not None:
+        # Copy the spooled upload to disk in chunks so the decoder can open it by path
+        video_dir = os.path.join(UPLOAD_DIR, "videos")
+        os.makedirs(video_dir, exist_ok=True)
+        video_path = os.path.join(video_dir, f"{uuid.uuid4().hex}{os.path.splitext(video.filename or '')[1]}")
+        with open(video_path, "wb") as f:
+            await asyncio.to_thread(shutil.copyfileobj, video.file, f)
+        cleanup = True
+    else:
+        if not VIDEO_INPUT_DIR:
+            raise HTTPException(status_code=400, detail="Reading videos by path is disabled")
+        input_dir = os.path.realpath(VIDEO_INPUT_DIR)
+        video_path = os.path.realpath(os.path.join(input_dir, path))
+        if os.path.commonpath([input_dir, video_path]) != input_dir or not os.path.isfile(video_path):
+            raise HTTPException(status_code=404, detail="Video not found")
+        cleanup = False
+
+    return video_ingestor.submit(video_path, user_uuid, user_email, process_frame,
+                                 sample_interval=sample_interval, cleanup=cleanup)
+
+@app.get("/videos/{video_id}")
+async def get_video_status(video_id: str):
+    """Progress of a server-side video: frames sampled, prefiltered and detected, and incidents opened."""
+    video = video_ingestor.get(video_id)
+    if video is None:
+        raise HTTPException(status_code=404, detail="Video not found")
+    return video
+
+@metrics.instrument("process_frame")
+async def process_frame(frame_number, timestamp, user_uuid, user_email, file_content, prefilter=None):
+    """
+    Run detection on a single frame and handle alerts if fire is found.
+    `prefilter` is a score already computed by the caller (e.g. the video decoder);
+    frames it rejects may come without file_content.
+    """
+    
+    # Decoded forms and model-sized variants of the frame are built once, on first use
+    frame = PreparedFrame(file_content)
+    
+    # Cheap local colour check first; clearly benign frames never reach Roboflow
+    if prefilter is None and PREFILTER_ENABLED:
+        try:
+            prefilter = prefilter_score(frame)
+        except Exception as e:
+            print(f"Error in prefilter: {e}")
+    
+    # Reuse the result of a near-identical recent frame from this stream if we have one
+    frame_hash = None
+    if prefilter is None or prefilter >= PREFILTER_THRESHOLD:
+        try:
+            frame_hash = compute_dhash(frame)
+        except Exception as e:
+            print(f"Error hashing frame: {e}")
     
-    # Call Roboflow API to detect fire
-    fire_detected, confidence_score = await detect_fire(file_content)
-    print(f"Fire detected: {fire_detected}, Confidence score: {confidence_score}")
+    cached = frame_cache.lookup(user_uuid, frame_hash) if frame_hash is not None else None
+    if prefilter is not None and prefilter < PREFILTER_THRESHOLD:
+        fire_detected, confidence_score = False, prefilter
+        detection_source = "prefilter"
+    elif cached is not None:
+        fire_detected, confidence_score = cached
+        detection_source = "cache"
+    else:
+        # Call Roboflow API to detect fire, within the request's budget or a fresh one for streamed frames
+        with budget(FRAME_BUDGET):
+            fire_detected, confidence_score, detection_source = await detect_fire(frame)
+        # A fallback estimate is only a stand-in, so it must not answer for later frames
+        if frame_hash is not None and detection_source == "roboflow":
+            frame_cache.store(user_uuid, frame_hash, fire_detected, confidence_score)
+    metrics.inc("firewatch_frames_total", detection_source)
+    print(f"Fire detected: {fire_detected}, Confidence score: {confidence_score} ({detection_source})")
     
     response_data = {
         "message": "Frame received", 
         "frame": frame_number,
         "user_uuid": user_uuid,
         "fire_detected": fire_detected,
-        "confidence_score": confidence_score
+        "confidence_score": confidence_score,
+        "detection_source": detection_source
     }
     
     # Add email to response if provided
     if user_email:
         response_data["user_email"] = user_email
     
-    # If fire detected, upload to Supabase and send email alert
+    # Every frame (positive or not) feeds this stream's incident window
+    incident = incident_tracker.update(user_uuid, confidence_score if fire_detected else 0.0)
+    if incident["incident_id"]:
+        response_data["incident_id"] = incident["incident_id"]
+    if incident["event"]:
+        response_data["incident_event"] = incident["event"]
+    
+    # Tell the client how long to wait before its next frame: sparse for quiet scenes, dense around fires
+    response_data["recommended_sample_interval"] = sampling_controller.update(
+        user_uuid, confidence_score, timestamp, incident["incident_id"] is not None
+    )
+    
+    # If fire detected, hand upload, email alert and analysis to the incident workers
     if fire_detected:
-        try:
-            # Reset file pointer position since we've read it already
-            await image_data.seek(0)
-            file_content = await image_data.read()
-            
-            # Upload to Supabase
-            if response_data["confidence_score"] >= 0.82: 
-                print("Uploading to Supabase...")
-                upload_result = await upload_fire_image(user_uuid, frame_number, file_content)
-                
-                if upload_result["success"]:
-                    print("Upload successful")
-                    public_url = upload_result["url"]
-                    response_data["supabase_url"] = public_url
-                    
-                    # Send email alert if user email is provided and they haven't been notified yet
-                    notification_key = f"{user_uuid}_{frame_number // 100}"
-                    
-                    if user_email and notification_key not in notified_users:
-                        # Send email with the image URL
-                        email_sent = send_email_alert(
-                            user_email=user_email,
-                            frame_number=frame_number,
-                            timestamp=timestamp,
-                            user_uuid=user_uuid,
-                            image_url=public_url
-                        )
-                        
-                        if email_sent:
-                            notified_users.add(notification_key)
-                            response_data["email_alert"] = "sent"
-                        else:
-                            response_data["email_alert"] = "failed"
-                    elif notification_key in notified_users:
-                        response_data["email_alert"] = "already_notified"
-                else:
-                    response_data["supabase_error"] = upload_result["error"]
-                    print(f"Upload failed: {upload_result['error']}")
-            
-        except Exception as e:
-            print(f"Error processing file: {e}")
-            response_data["error"] = str(e)
-
-        if alreadyCalled == False:
-            analysis = await analyze_fire_image_with_gemini(file_content) # So we can call help operator when the fire is instantly detected, rather than waiting for user to request status
-        if analysis:
-            alreadyCalled = True
+        job = incident_jobs.submit(handle_incident, {
+            "frame_number": frame_number,
+            "timestamp": timestamp,
+            "user_uuid": user_uuid,
+            "user_email": user_email,
+            "confidence_score": confidence_score,
+            "frame": frame,
+            "incident_id": incident["incident_id"],
+            "escalate": incident["escalate"],
+        })
+        if job:
+            response_data["job_id"] = job["job_id"]
+            response_data["job_status"] = job["status"]
+        else:
+            print("Incident queue full, rejecting job")
+            response_data["job_status"] = "rejected"
+            if incident["escalate"]:
+                incident_tracker.release_escalation(user_uuid, incident["incident_id"])
     
     return response_data
 
-async def detect_fire(image_bytes):
-    """
-    Call Roboflow API to detect fire in the image.
-    Returns a tuple of (fire_detected, confidence_score)
-    """
-    try:
-        # Convert the image bytes to base64
-        base64_image = base64.b64encode(image_bytes).decode('utf-8')
-        
-        # Set up the API request
-        api_key = "IU5B46WHH0ZwNfnUG2lM"
-        url = "https://serverless.roboflow.com/fire-smoke-spark/2"
+@metrics.instrument("incident_job")
+async def handle_incident(job):
+    """Upload the frame, alert the user and analyze the fire for a positive detection."""
+    payload = job["payload"]
+    result = job["result"]
+    user_uuid = payload["user_uuid"]
+    user_email = payload["user_email"]
+    frame_number = payload["frame_number"]
+    frame = payload["frame"]
+    file_content = frame.data
+    
+    # Upload to Supabase
+    if payload["confidence_score"] >= 0.82:
+        async def upload():
+            upload_result = await upload_fire_image(user_uuid, frame_number, file_content, timestamp=payload["timestamp"])
+            if not upload_result["success"]:
+                raise RuntimeError(upload_result["error"])
+            return upload_result["url"]
         
-        # Make the API request
-        response = requests.post(
-            url,
-            params={"api_key": api_key},
-            data=base64_image,
-            headers={"Content-Type": "application/x-www-form-urlencoded"}
-        )
+        print("Uploading to Supabase...")
+        public_url = await incident_jobs.run_stage(job, "upload", upload)
         
-        if response.status_code == 200:
-            result = response.json()
+        if public_url:
+            print("Upload successful")
+            result["supabase_url"] = public_url
             
-            predictions = result.get("predictions", [])
+            # Send email alert if user email is provided and they haven't been alerted within the
+            # dedup window; the claim is atomic, so concurrent jobs and workers send only one
+            notification_key = f"alert:{user_uuid}"
             
-            highest_confidence = 0
-            for pred in predictions:
-                if pred.get("class") in ["fire", "smoke", "spark"]:  # Adjust class names as needed
-                    confidence = pred.get("confidence", 0)
-                    highest_confidence = max(highest_confidence, confidence)
-            
-            # Determine if fire is detected based on confidence threshold
-            fire_detected = highest_confidence >= 0.5
-            return fire_detected, highest_confidence
+            if user_email and alert_dedup.claim(notification_key):
+                async def email():
+                    email_sent = await send_email_alert(
+                        user_email=user_email,
+                        frame_number=frame_number,
+                        timestamp=payload["timestamp"],
+                        user_uuid=user_uuid,
+                        image_url=public_url
+                    )
+                    if not email_sent:
+                        raise RuntimeError("Email alert was not sent")
+                    return email_sent
+                
+                if await incident_jobs.run_stage(job, "email", email):
+                    result["email_alert"] = "sent"
+                else:
+                    # Let a later frame try again instead of suppressing alerts for the whole window
+                    alert_dedup.release(notification_key)
+                    result["email_alert"] = "failed"
+            elif user_email:
+                result["email_alert"] = "already_notified"
         else:
-            print(f"API request failed with status code {response.status_code}: {response.text}")
-            return fire_detected, confidence_score
-            
-    except Exception as e:
-        print(f"Error in fire detection: {e}")
-        # Fallback to random for testing if exception occurs
-        fire_detected = random.random() < 0.4
-        confidence_score = random.uniform(0.9, 0.99) if fire_detected else random.uniform(0.1, 0.49)
-        return fire_detected, confidence_score
+            result["supabase_error"] = job["stages"]["upload"]["error"]
+            print(f"Upload failed: {result['supabase_error']}")
+    else:
+        incident_jobs.skip_stage(job, "upload", "confidence below upload threshold")
+
+    if payload["escalate"]:
+        # Analyze and call the help operator once per incident, as soon as it opens
+        async def analyze():
+            return await escalate_fire_incident(frame)
+        
+        analysis = await incident_jobs.run_stage(job, "analysis", analyze)
+        if analysis is not None:
+            result["analysis"] = analysis
+        else:
+            # The analysis or the help call failed every attempt; let the next frame of this incident escalate
+            result["analysis_error"] = job["stages"]["analysis"]["error"]
+            incident_tracker.release_escalation(user_uuid, payload["incident_id"])
+    else:
+        incident_jobs.skip_stage(job, "analysis", "incident already escalated")
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """Poll the progress of a background incident job."""
+    job = incident_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/incidents/{user_uuid}")
+async def get_incident_state(user_uuid: str):
+    """Current incident window and state for a stream."""
+    state = incident_tracker.get(user_uuid)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Stream not tracked")
+    return state
+
+@app.get("/health/clients")
+async def client_health():
+    """Status, warmup time and call latency of each shared external client."""
+    return clients.health()
+
+@app.get("/email-commands/stats")
+async def email_command_stats():
+    """Queue depth and outcome counters for email commands."""
+    return command_dispatcher.stats()
+
+@app.get("/email-outbox/stats")
+async def email_outbox_stats():
+    """Batching and delivery counters for outgoing alert emails."""
+    return mail_outbox.stats()
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Stage latency histograms, error counters, in-flight gauges and queue depths (Prometheus text format)."""
+    return PlainTextResponse(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/resilience/stats")
+async def resilience_stats():
+    """Circuit breaker state and hedged request counts for each external provider."""
+    return resilience.stats()
+
+@app.get("/alert-dedup/stats")
+async def alert_dedup_stats():
+    """Users currently inside their alert dedup window."""
+    return alert_dedup.stats()
+
+@app.get("/frame-store/stats")
+async def frame_store_stats():
+    """Latest-frame index and local frame byte cache usage."""
+    return frame_store.stats()
 
+@app.get("/frame-streams/stats")
+async def frame_stream_stats():
+    """Open WebSocket frame streams and their received, processed and dropped frame counts."""
+    return frame_streams.stats()
 
+@app.get("/sampling/stats")
+async def sampling_stats():
+    """Streams by recommended sampling interval (dense, base or sparse)."""
+    return sampling_controller.stats()
+
+@app.get("/frame-cache/stats")
+async def frame_cache_stats():
+    """Hit/miss counters for the perceptual-hash frame cache."""
+    return frame_cache.stats()
 
 @app.post("/fire-conversation")
 async def handle_conversation(request: Request):
@@ -177,17 +412,16 @@ async def handle_conversation(request: Request):
     # If this is a new call (no user input yet)
     if not user_input:
         # If we have this call in our history, use the initial message
-        if call_sid in conversation_history:
-            initial_message = conversation_history[call_sid]["messages"][-1]["content"]
+        conversation = await asyncio.to_thread(conversation_store.get, call_sid)
+        if conversation is not None:
+            initial_message = conversation["messages"][-1]["content"]
         else:
             # Default initial message if something went wrong
             initial_message = "Hello, this is your fire detection system AI assistant. We've detected a potential fire. Is everyone safe and do you need assistance?"
-            conversation_history[call_sid] = {
-                "messages": [
-                    {"role": "system", "content": SYSTEM_PROMPT},
-                    {"role": "assistant", "content": initial_message}
-                ]
-            }
+            await asyncio.to_thread(conversation_store.create, call_sid, [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "assistant", "content": initial_message}
+            ])
         
         # Speak the initial message and gather response
         gather = Gather(input='speech', action='/fire-conversation-response', method='POST', timeout=5, speech_timeout='auto')
@@ -206,15 +440,26 @@ async def process_conversation_response(request: Request):
     call_sid = form_data.get('CallSid')
     user_input = form_data.get('SpeechResult', '')
     
-    # Generate AI response based on user input
-    ai_response = await generate_conversation_response(call_sid, user_input)
-    if isinstance(ai_response, tuple):
-        ai_response = ' '.join(str(part) for part in ai_response)
-    print(f"AI Response: {ai_response}")
-    
     # Create TwiML response
     response = VoiceResponse()
     
+    if CEREBRAS_STREAMING:
+        # Speak the first sentence as soon as it's generated; the rest is served by /fire-conversation-continue
+        with budget(CONVERSATION_BUDGET, since=request.state.received_at):
+            ai_response, has_more = await stream_conversation_response(call_sid, user_input)
+        print(f"AI Response: {ai_response}{' ...' if has_more else ''}")
+        if has_more:
+            response.say(ai_response)
+            response.redirect('/fire-conversation-continue')
+            return PlainTextResponse(content=str(response), media_type="application/xml")
+    else:
+        # Generate AI response based on user input
+        with budget(CONVERSATION_BUDGET, since=request.state.received_at):
+            ai_response = await generate_conversation_response(call_sid, user_input)
+        if isinstance(ai_response, tuple):
+            ai_response = ' '.join(str(part) for part in ai_response)
+        print(f"AI Response: {ai_response}")
+    
     # Continue the conversation
     gather = Gather(input='speech', action='/fire-conversation-response', method='POST', timeout=5, speech_timeout='auto')
     gather.say(ai_response)
@@ -225,11 +470,61 @@ async def process_conversation_response(request: Request):
     
     return PlainTextResponse(content=str(response), media_type="application/xml")
 
+@app.post("/fire-conversation-continue")
+async def continue_conversation_response(request: Request):
+    """Speak the rest of a streamed reply, then listen for the next response"""
+    form_data = await request.form()
+    call_sid = form_data.get('CallSid')
+    
+    with budget(CONVERSATION_BUDGET, since=request.state.received_at):
+        remainder = await finish_conversation_response(call_sid)
+    print(f"AI Response (continued): {remainder}")
+    
+    response = VoiceResponse()
+    gather = Gather(input='speech', action='/fire-conversation-response', method='POST', timeout=5, speech_timeout='auto')
+    if remainder:
+        gather.say(remainder)
+    response.append(gather)
+    
+    # If no response, repeat the last message
+    response.redirect('/fire-conversation')
+    
+    return PlainTextResponse(content=str(response), media_type="application/xml")
+
+
+@app.post("/fire-conversation-status")
+async def conversation_status(request: Request):
+    """Twilio status callback; forget the conversation once the call has ended"""
+    form_data = await request.form()
+    call_sid = form_data.get('CallSid')
+    if form_data.get('CallStatus') in ("completed", "busy", "failed", "no-answer", "canceled"):
+        cancel_conversation_response(call_sid)
+        await asyncio.to_thread(conversation_store.end, call_sid)
+    return PlainTextResponse(content="", status_code=204)
+
+@app.get("/conversations/stats")
+async def conversation_stats():
+    """Number of live conversations and the memory they use."""
+    return await asyncio.to_thread(conversation_store.stats)
+
 
 @app.on_event("startup")
 async def startup_event():
-    """Start email polling service on application startup."""
+    """Warm up shared clients, then start email polling and incident workers."""
+    await clients.start()
+    mail_outbox.start()
+    command_dispatcher.start()
     start_email_polling_thread()
+    incident_jobs.start()
+    video_ingestor.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop incident workers and release pooled connections on application shutdown."""
+    await video_ingestor.stop()
+    await incident_jobs.stop()
+    await mail_outbox.stop()
+    await clients.close()
 
 if __name__ == "__main__":
     import uvicorn
@@ -7,7 +7,14 @@ class FireDetectionResponse(BaseModel):
     user_uuid: str
     fire_detected: bool
     confidence_score: float
+    detection_source: Optional[str] = None
     user_email: Optional[EmailStr] = None
     supabase_url: Optional[str] = None
     email_alert: Optional[str] = None
-    supabase_error: Optional[str] = None
\ No newline at end of file
+    supabase_error: Optional[str] = None
+    incident_id: Optional[str] = None
+    incident_event: Optional[str] = None
+    job_id: Optional[str] = None
+    job_status: Optional[str] = None
+    recommended_sample_interval: Optional[float] = None  # seconds until this stream's next frame
+    error: Optional[str] = None
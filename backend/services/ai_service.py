@@ -1,17 +1,37 @@
-import base64
+import asyncio
+import re
 import google.generativeai as genai
 from twilio.rest import Client
-from config import GEMINI_API_KEY
-from config import TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_PHONE_NUMBER
+from twilio.http.http_client import TwilioHttpClient
+from config import GEMINI_API_KEY, GEMINI_API_ENDPOINT, GEMINI_TIMEOUT
+from config import TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_PHONE_NUMBER, TWILIO_API_URL, TWILIO_TIMEOUT
 from config import WEBHOOK_BASE_URL
-from config import conversation_history
-from config import CEREBRAS_API_KEY
+from config import CEREBRAS_API_KEY, CEREBRAS_BASE_URL, CEREBRAS_TIMEOUT, CEREBRAS_HEDGE_AFTER
+from config import GEMINI_CACHE_SIZE, GEMINI_CACHE_TTL
+from services.cache import TTLCache, SingleFlight, content_hash
+from services.preprocessing import PreparedFrame
+from services.clients import clients
+from services.conversation_store import conversation_store
+from services.metrics import metrics
+from services.resilience import resilience, remaining
 
 from twilio.twiml.voice_response import VoiceResponse, Gather
 from fastapi.responses import PlainTextResponse
 from fastapi import Form, Request
 
-twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+def _create_twilio_client():
+    # Pooled HTTP client so outgoing calls reuse one TLS connection; the timeout also frees
+    # the warmup's worker thread if Twilio hangs
+    http_client = TwilioHttpClient(pool_connections=True, timeout=TWILIO_TIMEOUT)
+    client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, http_client=http_client)
+    if TWILIO_API_URL:
+        client.api.base_url = TWILIO_API_URL
+    return client
+
+def _warm_twilio_client(client):
+    return asyncio.to_thread(lambda: client.api.accounts(TWILIO_ACCOUNT_SID).fetch())
+
+clients.register("twilio", _create_twilio_client, warmup=_warm_twilio_client)
 
 # System prompt for the AI assistant
 SYSTEM_PROMPT = """
@@ -36,23 +56,28 @@ def call_help_operator(fire_analysis):
     try:
         # Create a call that will connect to our webhook for conversation
         # The webhook URL must be publicly accessible for Twilio to reach it
-        call = twilio_client.calls.create(
-            url=f"{WEBHOOK_BASE_URL}/fire-conversation",  
-            to=f"+1{EMERGENCY_PHONE_NUMBER}",  
-            from_=TWILIO_PHONE_NUMBER
-        )
+        with clients.track("twilio"):
+            call = clients.get("twilio").calls.create(
+                url=f"{WEBHOOK_BASE_URL}/fire-conversation",  
+                to=f"+1{EMERGENCY_PHONE_NUMBER}",  
+                from_=TWILIO_PHONE_NUMBER,
+                # Tell us when the call ends so its conversation can be evicted
+                status_callback=f"{WEBHOOK_BASE_URL}/fire-conversation-status",
+                status_callback_event=["completed"]
+            )
         
         # Format a brief introduction based on the fire analysis
         initial_message = "Hello, this is Firewatch. We have detected a potential fire and are calling to provide information and request assistance."
         
         # Initialize the conversation history for this call
-        conversation_history[call.sid] = {
-            "messages": [
+        conversation_store.create(
+            call.sid,
+            [
                 {"role": "system", "content": f"{SYSTEM_PROMPT}\n\nFire Analysis: {fire_analysis}"},
                 {"role": "assistant", "content": initial_message}
             ],
-            "fire_analysis": fire_analysis  # Store the analysis for reference during conversation
-        }
+            fire_analysis=fire_analysis  # Store the analysis for reference during conversation
+        )
         
         print(f"HELP NEEDED - Interactive call initiated to {EMERGENCY_PHONE_NUMBER} - SID: {call.sid}")
         return {
@@ -67,130 +92,314 @@ def call_help_operator(fire_analysis):
             "message": f"Failed to place emergency call: {str(e)}"
         }
 
-from cerebras.cloud.sdk import Cerebras
+from cerebras.cloud.sdk import AsyncCerebras
+
+CEREBRAS_MODEL = "llama-4-scout-17b-16e-instruct"
+
+FALLBACK_CONVERSATION_RESPONSE = "I'm sorry, I'm having trouble processing that. Is everyone safe? If you're in immediate danger, please hang up and call emergency services directly."
+
+def _create_cerebras_client():
+    return AsyncCerebras(api_key=CEREBRAS_API_KEY, base_url=CEREBRAS_BASE_URL)
+
+async def _warm_cerebras_client(client):
+    await client.models.list()
+
+clients.register("cerebras", _create_cerebras_client, warmup=_warm_cerebras_client)
 
+@metrics.instrument("generate_conversation_response")
 async def generate_conversation_response(call_sid, user_input):
     """
     Generate a response to the user using Cerebras SDK based on conversation history
     """
     try:
         # Add user's input to conversation history
-        conversation_history[call_sid]["messages"].append({"role": "user", "content": user_input})
+        await asyncio.to_thread(conversation_store.append, call_sid, "user", user_input)
         
-        # Get fire analysis from conversation history if available
-        fire_analysis = conversation_history[call_sid].get("fire_analysis", "")
+        # Prepare messages for Cerebras API (system prompt plus recent turns within the token budget)
+        messages = await asyncio.to_thread(conversation_store.context, call_sid)
         
-        # Prepare messages for Cerebras API
-        messages = conversation_history[call_sid]["messages"].copy()
         
+        # Call Cerebras API for response generation; hedged, and bounded by the webhook's budget
+        async def attempt():
+            with clients.track("cerebras"):
+                return await clients.get("cerebras").chat.completions.create(
+                    messages=messages,
+                    model=CEREBRAS_MODEL,
+                    max_tokens=100  # Keep responses concise for voice conversation
+                )
         
-        # Initialize Cerebras client
-        client = Cerebras(
-            api_key=CEREBRAS_API_KEY,
-        )
-        
-        # Call Cerebras API for response generation
-        chat_completion = client.chat.completions.create(
-            messages=messages,
-            model="llama-4-scout-17b-16e-instruct",
-            max_tokens=100  # Keep responses concise for voice conversation
-        )
+        chat_completion = await resilience.guard("cerebras", attempt, CEREBRAS_TIMEOUT, hedge_after=CEREBRAS_HEDGE_AFTER)
         
         # Extract response text
         response_text = chat_completion.choices[0].message.content
         
         # Add assistant's response to conversation history
-        conversation_history[call_sid]["messages"].append({"role": "assistant", "content": response_text})
+        await asyncio.to_thread(conversation_store.append, call_sid, "assistant", response_text)
         
         return response_text
         
     except Exception as e:
         print(f"Error generating response: {e}")
-        return "I'm sorry, I'm having trouble processing that. Is everyone safe? If you're in immediate danger, please hang up and call emergency services directly."
+        metrics.error("generate_conversation_response")
+        return FALLBACK_CONVERSATION_RESPONSE
 
 
-async def analyze_fire_image_with_gemini(image_data):
-    """Use Gemini to analyze a fire image and provide insights with function calling capability."""
+# A sentence ends at ., ! or ? followed by whitespace; very short openers ("Okay.") are merged with the next sentence
+SENTENCE_END = re.compile(r'[.!?](?=\s)')
+MIN_FIRST_SENTENCE_CHARS = 20
+
+# call_sid -> task that finishes streaming the rest of the current reply; entries go
+# when the reply has been collected, finishes streaming or the call ends
+pending_responses = {}
+
+@metrics.instrument("stream_conversation_response")
+async def stream_conversation_response(call_sid, user_input):
+    """
+    Stream a response from Cerebras and return as soon as its first sentence is complete.
+    Returns (text, has_more). When has_more is True the rest of the reply keeps
+    streaming in the background and can be collected with finish_conversation_response.
+    """
     try:
-        # Convert image data to base64 for Gemini
-        image_base64 = base64.b64encode(image_data).decode('utf-8')
-        
-        # Define the function declaration for the model
-        help_operator_function = {
-            "name": "call_help_operator",
-            "description": "Calls for emergency help when a severe fire is detected.",
-            "parameters": {
-                "type": "object",
-                "properties": {},
-                "required": [],
-            },
-        }
-        
-        # Initialize Gemini model for multimodal inputs with tool configuration
-        model = genai.GenerativeModel(
-            'gemini-1.5-pro',
-            tools=[{"function_declarations": [help_operator_function]}]
-        )
-        
-        # Create a prompt for fire analysis
-        prompt = """
-        Analyze this fire image and provide a detailed assessment. Include:
-        1. Severity level (low, medium, high, extreme)
-        2. Visible flame characteristics
-        3. Smoke density and color
-        4. Probable fire type (electrical, chemical, natural material, etc.)
-        5. Potential spread risk
-        6. Any visible hazards or concerns
-        7. Brief recommendations for immediate action
-        
-        If you determine the fire to be any risk at all, please call for emergency assistance using call_help_operator. If the fire is EXTREMELY small, please just provide the analysis. 
-        The email notification will suffice in this case.
-        
-        Format your response in an easy-to-read manner suitable for someone checking on a fire alert.
-        """
-        
-        # Create the multimodal inputs
-        image_part = {
-            "mime_type": "image/jpeg", 
-            "data": image_base64
-        }
-        
-        contents = [prompt, image_part]
-        
-        # Generate the response from Gemini with function calling capability
-        response = model.generate_content(contents)
-        
-        # First extract the full text analysis
-        full_analysis = ""
-        for part in response.candidates[0].content.parts:
-            if hasattr(part, 'text'):
-                full_analysis += part.text
+        # Add user's input to conversation history
+        await asyncio.to_thread(conversation_store.append, call_sid, "user", user_input)
         
-        if not full_analysis and hasattr(response, 'text'):
-            full_analysis = response.text
-            
-        # Process the response to find function calls
-        function_called = False
-        result_text = full_analysis
+        # Prepare messages for Cerebras API (system prompt plus recent turns within the token budget)
+        messages = await asyncio.to_thread(conversation_store.context, call_sid)
         
-        for part in response.candidates[0].content.parts:
-            if hasattr(part, 'function_call'):
-                function_call = part.function_call
-                print(f"Function to call: {function_call.name}")
-                
-                # Call the appropriate function with the full analysis text
-                if function_call.name == "call_help_operator":
-                    function_called = True
-                    result = call_help_operator(full_analysis)
-                    result_text += f"\n\nEMERGENCY ASSISTANCE REQUESTED: {result['message']}"
+        # Opening the stream is hedged; a duplicate stream that loses the race is closed
+        stream = await resilience.guard("cerebras", lambda: clients.get("cerebras").chat.completions.create(
+            messages=messages,
+            model=CEREBRAS_MODEL,
+            max_tokens=100,  # Keep responses concise for voice conversation
+            stream=True
+        ), CEREBRAS_TIMEOUT, hedge_after=CEREBRAS_HEDGE_AFTER,
+            discard=lambda late: asyncio.create_task(late.close()))
+    except Exception as e:
+        print(f"Error generating response: {e}")
+        metrics.error("stream_conversation_response")
+        return FALLBACK_CONVERSATION_RESPONSE, False
+    
+    first_sentence_ready = asyncio.Event()
+    reply = {"text": "", "first": None}
+    
+    async def consume():
+        try:
+            with clients.track("cerebras"):
+                async for chunk in stream:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if not delta:
+                        continue
+                    reply["text"] += delta
+                    if reply["first"] is None:
+                        match = SENTENCE_END.search(reply["text"], MIN_FIRST_SENTENCE_CHARS)
+                        if match:
+                            reply["first"] = reply["text"][:match.end()]
+                            first_sentence_ready.set()
+        except Exception as e:
+            print(f"Error streaming response: {e}")
+            if not reply["text"]:
+                reply["text"] = FALLBACK_CONVERSATION_RESPONSE
+        finally:
+            if reply["first"] is None:
+                reply["first"] = reply["text"]
+            first_sentence_ready.set()
+            # Release the HTTP stream whether it finished, failed or was cancelled
+            try:
+                await stream.close()
+            except Exception as e:
+                print(f"Error closing response stream: {e}")
         
-        # If no function was called but we have an analysis, call help anyway
-        if not function_called and full_analysis:
-            result = call_help_operator(full_analysis)
-            result_text += f"\n\nEMERGENCY ASSISTANCE REQUESTED: {result['message']}"
-            
-        return result_text
+        # Add the complete response to conversation history and publish the rest for
+        # /fire-conversation-continue, which may be served by another worker
+        remainder = reply["text"][len(reply["first"]):].strip()
+        await asyncio.to_thread(conversation_store.append, call_sid, "assistant", reply["text"])
+        await asyncio.to_thread(conversation_store.set_continuation, call_sid, remainder)
+        return remainder
+    
+    # Mark the reply pending before consume() can publish its remainder, so the marker never overwrites it
+    await asyncio.to_thread(conversation_store.set_continuation, call_sid)
+    task = asyncio.create_task(consume())
+    try:
+        await asyncio.wait_for(first_sentence_ready.wait(), remaining(CEREBRAS_TIMEOUT))
+    except asyncio.TimeoutError:
+        # The stream opened but stalled before its first sentence; don't keep the caller waiting
+        print(f"Timed out waiting for the first sentence for call {call_sid}")
+        task.cancel()
+        await asyncio.to_thread(conversation_store.set_continuation, call_sid, "")
+        resilience.breaker("cerebras").record_failure()
+        metrics.error("stream_conversation_response")
+        return FALLBACK_CONVERSATION_RESPONSE, False
+    
+    if task.done():
+        await asyncio.to_thread(conversation_store.take_continuation, call_sid)
+        return reply["text"].strip(), False
+    
+    pending_responses[call_sid] = task
+    # Once the stream is done its remainder is in the conversation store, so the task needn't be kept
+    task.add_done_callback(lambda done: _forget_response(call_sid, done))
+    return reply["first"].strip(), True
+
+def _forget_response(call_sid, task):
+    if pending_responses.get(call_sid) is task:
+        del pending_responses[call_sid]
+
+def cancel_conversation_response(call_sid):
+    """Stop streaming a reply nobody will collect (the call has ended)."""
+    task = pending_responses.pop(call_sid, None)
+    if task is not None:
+        task.cancel()
+
+# How often another worker's streamed reply is checked for in the conversation store
+CONTINUATION_POLL_INTERVAL = 0.05
+
+async def finish_conversation_response(call_sid, timeout=10):
+    """Return the rest of a streamed reply once it has finished, or "" if there is none."""
+    task = pending_responses.pop(call_sid, None)
+    timeout = remaining(timeout)
+    try:
+        if task is not None:
+            await asyncio.wait_for(asyncio.shield(task), timeout)
+            return await asyncio.to_thread(conversation_store.take_continuation, call_sid) or ""
         
+        # The reply is streaming on another worker; wait for it to publish the rest.
+        # The store is read off the event loop, since a SQLite read can wait on a writer.
+        deadline = asyncio.get_running_loop().time() + timeout
+        while True:
+            remainder = await asyncio.to_thread(conversation_store.take_continuation, call_sid)
+            if remainder is not None:
+                return remainder
+            if asyncio.get_running_loop().time() >= deadline:
+                raise asyncio.TimeoutError
+            await asyncio.sleep(CONTINUATION_POLL_INTERVAL)
+    except asyncio.TimeoutError:
+        print(f"Timed out waiting for the rest of the response for call {call_sid}")
+        return ""
+
+
+# Function declaration exposed to Gemini so it can decide to call for help
+HELP_OPERATOR_FUNCTION = {
+    "name": "call_help_operator",
+    "description": "Calls for emergency help when a severe fire is detected.",
+    "parameters": {
+        "type": "object",
+        "properties": {},
+        "required": [],
+    },
+}
+
+# Prompt for fire analysis
+FIRE_ANALYSIS_PROMPT = """
+Analyze this fire image and provide a detailed assessment. Include:
+1. Severity level (low, medium, high, extreme)
+2. Visible flame characteristics
+3. Smoke density and color
+4. Probable fire type (electrical, chemical, natural material, etc.)
+5. Potential spread risk
+6. Any visible hazards or concerns
+7. Brief recommendations for immediate action
+
+If you determine the fire to be any risk at all, please call for emergency assistance using call_help_operator. If the fire is EXTREMELY small, please just provide the analysis. 
+The email notification will suffice in this case.
+
+Format your response in an easy-to-read manner suitable for someone checking on a fire alert.
+"""
+
+def _create_gemini_model():
+    # Multimodal model with the help-operator tool, built once and reused for every analysis
+    if GEMINI_API_KEY:
+        genai.configure(
+            api_key=GEMINI_API_KEY,
+            client_options={"api_endpoint": GEMINI_API_ENDPOINT} if GEMINI_API_ENDPOINT else None
+        )
+    return genai.GenerativeModel(
+        'gemini-1.5-pro',
+        tools=[{"function_declarations": [HELP_OPERATOR_FUNCTION]}]
+    )
+
+async def _warm_gemini_model(model):
+    await model.count_tokens_async("ping")
+
+clients.register("gemini", _create_gemini_model, warmup=_warm_gemini_model)
+
+
+# Analyses are cached by image content so the same frame is never sent to Gemini twice.
+# Only the analysis text is cached: the emergency call is placed on every request, and failures are never stored.
+analysis_cache = TTLCache(max_entries=GEMINI_CACHE_SIZE, ttl=GEMINI_CACHE_TTL)
+analysis_flight = SingleFlight()
+
+ANALYSIS_UNAVAILABLE = "Unable to analyze the fire image at this moment. Please check the visual directly or contact emergency services if the situation appears dangerous."
+
+async def _cached_analysis(frame):
+    """Gemini's analysis of a PreparedFrame, from the cache or one shared call; raises if Gemini fails."""
+    key = content_hash(frame.data)
+    cached = analysis_cache.get(key)
+    if cached is not None:
+        print("Using cached Gemini analysis")
+        return cached
+    
+    analysis = await analysis_flight.do(key, lambda: _run_gemini_analysis(frame))
+    analysis_cache.set(key, analysis)
+    return analysis
+
+@metrics.instrument("analyze_fire_image_with_gemini")
+async def analyze_fire_image_with_gemini(image_data):
+    """
+    Use Gemini to analyze a fire image (JPEG bytes or PreparedFrame) and call the help operator with the analysis.
+    Analyses are cached by image hash, and concurrent requests for the same image share one Gemini call;
+    the help call is placed for every request.
+    """
+    try:
+        analysis = await _cached_analysis(PreparedFrame.wrap(image_data))
     except Exception as e:
         print(f"Error analyzing image with Gemini: {e}")
-        return "Unable to analyze the fire image at this moment. Please check the visual directly or contact emergency services if the situation appears dangerous."
\ No newline at end of file
+        metrics.error("analyze_fire_image_with_gemini")
+        return ANALYSIS_UNAVAILABLE
+    
+    result = await asyncio.to_thread(call_help_operator, analysis)
+    return f"{analysis}\n\nEMERGENCY ASSISTANCE REQUESTED: {result['message']}"
+
+@metrics.instrument("escalate_fire_incident")
+async def escalate_fire_incident(image_data):
+    """
+    Like analyze_fire_image_with_gemini, for the incident job that escalates each
+    incident once: raises if the analysis or the call fails so the job can retry,
+    or give the escalation back.
+    """
+    analysis = await _cached_analysis(PreparedFrame.wrap(image_data))
+    result = await asyncio.to_thread(call_help_operator, analysis)
+    if result["status"] != "Help requested":
+        raise RuntimeError(result["message"])
+    return f"{analysis}\n\nEMERGENCY ASSISTANCE REQUESTED: {result['message']}"
+
+
+async def _run_gemini_analysis(frame):
+    """Send one image to Gemini and return its analysis text; raises if there is none."""
+    # Create the multimodal inputs; the SDK takes raw JPEG bytes, already sized for the model
+    image_part = {
+        "mime_type": "image/jpeg", 
+        "data": frame.llm_jpeg
+    }
+    
+    contents = [FIRE_ANALYSIS_PROMPT, image_part]
+    
+    # Generate the response from Gemini with function calling capability
+    async def attempt():
+        with clients.track("gemini"):
+            return await clients.get("gemini").generate_content_async(contents)
+    
+    response = await resilience.guard("gemini", attempt, GEMINI_TIMEOUT)
+    
+    # Extract the full text analysis; a call_help_operator function call needs no
+    # handling here, since callers always call for help with the analysis
+    full_analysis = ""
+    for part in response.candidates[0].content.parts:
+        if hasattr(part, 'text'):
+            full_analysis += part.text
+    
+    if not full_analysis and hasattr(response, 'text'):
+        full_analysis = response.text
+    
+    if not full_analysis:
+        raise ValueError("Gemini returned no analysis")
+    return full_analysis
+
@@ -0,0 +1,74 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+
+
+def content_hash(data):
+    """Stable key for a blob of bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class TTLCache:
+    """Small LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (value, expires_at)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self.entries[key]
+        self.misses += 1
+        return None
+
+    def set(self, key, value):
+        self.entries[key] = (value, time.monotonic() + self.ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries)}
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key into one in-flight task.
+    Callers that arrive while a call is running await the same result.
+    """
+
+    def __init__(self):
+        self.inflight = {}  # key -> asyncio.Task
+        self.coalesced = 0
+
+    async def do(self, key, coro_factory):
+        loop = asyncio.get_running_loop()
+        task = self.inflight.get(key)
+        # Tasks belong to one event loop; never share across loops
+        if task is not None and task.get_loop() is loop:
+            self.coalesced += 1
+            return await asyncio.shield(task)
+
+        task = loop.create_task(coro_factory())
+        self.inflight[key] = task
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if task.done() and self.inflight.get(key) is task:
+                del self.inflight[key]
+            elif not task.done():
+                task.add_done_callback(lambda t: self._forget(key, t))
+
+    def _forget(self, key, task):
+        if self.inflight.get(key) is task:
+            del self.inflight[key]
@@ -0,0 +1,121 @@
+import asyncio
+import inspect
+import time
+from contextlib import contextmanager
+from config import CLIENT_WARMUP_TIMEOUT
+
+
+class ClientRegistry:
+    """
+    Long-lived SDK/HTTP clients shared by the services.
+
+    Each service registers a factory (and optionally a warmup coroutine or
+    function) at import time. start() builds every client once at application
+    startup and warms its connection; get() hands out the same instance for the
+    lifetime of the process. Calls wrapped in track() feed per-client latency
+    and error counters that health() reports.
+    """
+
+    def __init__(self, warmup_timeout=CLIENT_WARMUP_TIMEOUT):
+        self.warmup_timeout = warmup_timeout
+        self.factories = {}
+        self.warmups = {}
+        self.clients = {}
+        self.health_info = {}
+
+    def register(self, name, factory, warmup=None):
+        self.factories[name] = factory
+        if warmup is not None:
+            self.warmups[name] = warmup
+        self.health_info.setdefault(name, {
+            "status": "not_started",
+            "created_at": None,
+            "warmup_ms": None,
+            "last_latency_ms": None,
+            "avg_latency_ms": None,
+            "calls": 0,
+            "errors": 0,
+            "last_error": None,
+        })
+
+    def get(self, name):
+        """Return the shared client, creating it on first use if start() hasn't run."""
+        client = self.clients.get(name)
+        if client is None:
+            client = self.clients[name] = self.factories[name]()
+            info = self.health_info[name]
+            info["status"] = "ok"
+            info["created_at"] = time.time()
+        return client
+
+    async def start(self):
+        """
+        Create every registered client and warm up its connection concurrently.
+        Each warmup gets warmup_timeout seconds, so one hanging provider can't block startup.
+        """
+        await asyncio.gather(*(self._start_client(name) for name in self.factories))
+
+    async def _start_client(self, name):
+        info = self.health_info[name]
+        try:
+            client = self.get(name)
+            warmup = self.warmups.get(name)
+            if warmup is not None:
+                started = time.perf_counter()
+                result = warmup(client)
+                if inspect.isawaitable(result):
+                    await asyncio.wait_for(result, self.warmup_timeout)
+                info["warmup_ms"] = (time.perf_counter() - started) * 1000
+            print(f"Client {name} ready")
+        except asyncio.TimeoutError:
+            info["status"] = "degraded"
+            info["last_error"] = f"Warmup timed out after {self.warmup_timeout:g}s"
+            print(f"Warmup of client {name} timed out after {self.warmup_timeout:g}s")
+        except Exception as e:
+            # A failed warmup is not fatal; the client is retried on first real use
+            info["status"] = "degraded"
+            info["last_error"] = str(e)
+            print(f"Error warming up client {name}: {e}")
+
+    async def close(self):
+        """Close every client that holds connections."""
+        for name, client in list(self.clients.items()):
+            try:
+                if hasattr(client, "aclose"):
+                    await client.aclose()
+                elif hasattr(client, "close") and inspect.iscoroutinefunction(client.close):
+                    await client.close()
+                elif hasattr(client, "close"):
+                    client.close()
+            except Exception as e:
+                print(f"Error closing client {name}: {e}")
+        self.clients.clear()
+
+    @contextmanager
+    def track(self, name):
+        """Record latency and errors for one call made with a client."""
+        info = self.health_info[name]
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            info["errors"] += 1
+            info["last_error"] = str(e)
+            info["status"] = "degraded"
+            raise
+        else:
+            info["status"] = "ok"
+        finally:
+            latency = (time.perf_counter() - started) * 1000
+            info["calls"] += 1
+            info["last_latency_ms"] = latency
+            if info["avg_latency_ms"] is None:
+                info["avg_latency_ms"] = latency
+            else:
+                info["avg_latency_ms"] = 0.9 * info["avg_latency_ms"] + 0.1 * latency
+
+    def health(self):
+        return {name: dict(info) for name, info in self.health_info.items()}
+
+
+clients = ClientRegistry()
@@ -0,0 +1,89 @@
+import asyncio
+import threading
+from config import EMAIL_COMMAND_CONCURRENCY, EMAIL_COMMAND_MAX_PENDING
+
+
+class CommandDispatcher:
+    """
+    Runs email commands on the application's event loop instead of the IMAP thread.
+
+    The poller thread calls submit(), which returns immediately. Commands run
+    with bounded concurrency, and a command that is already queued or running
+    for the same sender absorbs any repeats (three STATUS emails from one user
+    become one analysis).
+    """
+
+    def __init__(self, max_concurrency=EMAIL_COMMAND_CONCURRENCY, max_pending=EMAIL_COMMAND_MAX_PENDING):
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.loop = None
+        self.semaphore = None
+        self.lock = threading.Lock()
+        self.pending = {}  # (sender, command) -> concurrent.futures.Future
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.coalesced = 0
+        self.rejected = 0
+
+    def start(self):
+        """Bind the dispatcher to the running event loop (call from application startup)."""
+        self.loop = asyncio.get_running_loop()
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    def submit(self, sender, command, handler):
+        """
+        Schedule `handler` (a zero-argument coroutine function) for a sender's command.
+        Safe to call from any thread. Returns a future, or None if the command was rejected.
+        """
+        if self.loop is None:
+            # No event loop to hand off to (e.g. running standalone); run inline
+            asyncio.run(handler())
+            return None
+
+        key = (sender, command)
+        with self.lock:
+            future = self.pending.get(key)
+            if future is not None:
+                self.coalesced += 1
+                print(f"{command} from {sender} already pending, coalescing")
+                return future
+            if len(self.pending) >= self.max_pending:
+                self.rejected += 1
+                print(f"Command queue full, dropping {command} from {sender}")
+                return None
+            self.queued += 1
+            future = asyncio.run_coroutine_threadsafe(self._run(key, handler), self.loop)
+            self.pending[key] = future
+            return future
+
+    async def _run(self, key, handler):
+        async with self.semaphore:
+            with self.lock:
+                self.queued -= 1
+                self.running += 1
+            try:
+                await handler()
+                self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"Error running {key[1]} command for {key[0]}: {e}")
+            finally:
+                with self.lock:
+                    self.running -= 1
+                    self.pending.pop(key, None)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "queued": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "coalesced": self.coalesced,
+                "rejected": self.rejected,
+            }
+
+
+command_dispatcher = CommandDispatcher()
@@ -0,0 +1,285 @@
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from config import (CONVERSATION_IDLE_TTL, CONVERSATION_ENDED_TTL,
+                    CONVERSATION_MAX_TOKENS, CONVERSATION_SUMMARY_CHARS,
+                    CONVERSATION_BACKEND, CONVERSATION_DB_PATH)
+from services import sqlite_db
+
+# How often expired calls are swept out, in seconds
+SWEEP_INTERVAL = 30
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token plus message overhead)."""
+    return len(text) // 4 + 4
+
+
+class MemorySessionBackend:
+    """Call records held in this process; only correct with a single worker."""
+
+    def __init__(self):
+        self.records = {}  # call_sid -> record
+        self.locks = {}  # call_sid -> lock serializing updates to that call
+        self.locks_lock = threading.Lock()
+
+    @contextmanager
+    def transaction(self, call_sid):
+        with self.locks_lock:
+            lock = self.locks.setdefault(call_sid, threading.Lock())
+        with lock:
+            yield
+
+    def load(self, call_sid):
+        return self.records.get(call_sid)
+
+    def save(self, call_sid, record):
+        self.records[call_sid] = record
+
+    def sweep(self, idle_before, ended_before):
+        """Delete calls idle since idle_before or ended before ended_before; returns how many."""
+        expired = [
+            call_sid for call_sid, record in list(self.records.items())
+            if record["updated_at"] < idle_before
+            or (record["ended_at"] is not None and record["ended_at"] < ended_before)
+        ]
+        for call_sid in expired:
+            self.records.pop(call_sid, None)
+            with self.locks_lock:
+                self.locks.pop(call_sid, None)
+        return len(expired)
+
+    def stats(self):
+        message_count = 0
+        approx_bytes = sys.getsizeof(self.records)
+        for record in list(self.records.values()):
+            message_count += len(record["messages"])
+            approx_bytes += len(record["summary"]) + len(record["fire_analysis"] or "")
+            approx_bytes += sum(len(m["content"]) + 100 for m in record["messages"])
+        return {
+            "backend": "memory",
+            "calls": len(self.records),
+            "messages": message_count,
+            "approx_bytes": approx_bytes,
+        }
+
+
+class SQLiteSessionBackend:
+    """
+    Call records in a SQLite database shared by every worker on the host.
+
+    Each record is one JSON row. Reads are plain selects (WAL readers never
+    wait); updates run in a BEGIN IMMEDIATE transaction, which holds the
+    database write lock across processes for the few hundred microseconds a
+    read-modify-write takes, so a webhook landing on any worker sees and
+    extends the same conversation.
+    """
+
+    def __init__(self, path=CONVERSATION_DB_PATH):
+        self.path = path
+        self.lock = threading.RLock()  # the connection is shared by this process's threads
+        self.conn = sqlite_db.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            "call_sid TEXT PRIMARY KEY, record TEXT NOT NULL, "
+            "updated_at REAL NOT NULL, ended_at REAL)"
+        )
+
+    @contextmanager
+    def transaction(self, call_sid):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def load(self, call_sid):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT record FROM conversations WHERE call_sid = ?", (call_sid,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, call_sid, record):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO conversations (call_sid, record, updated_at, ended_at) "
+                "VALUES (?, ?, ?, ?)",
+                (call_sid, json.dumps(record), record["updated_at"], record["ended_at"])
+            )
+
+    def sweep(self, idle_before, ended_before):
+        """Delete calls idle since idle_before or ended before ended_before; returns how many."""
+        with self.lock:
+            cursor = self.conn.execute(
+                "DELETE FROM conversations WHERE updated_at < ? OR ended_at < ?",
+                (idle_before, ended_before)
+            )
+        return cursor.rowcount
+
+    def stats(self):
+        with self.lock:
+            calls, approx_bytes = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(record)), 0) FROM conversations"
+            ).fetchone()
+        return {"backend": "sqlite", "path": self.path, "calls": calls, "approx_bytes": approx_bytes}
+
+
+def create_session_backend(backend=CONVERSATION_BACKEND):
+    if backend == "sqlite":
+        return SQLiteSessionBackend()
+    if backend != "memory":
+        raise ValueError(f"Unknown conversation backend: {backend}")
+    return MemorySessionBackend()
+
+
+class ConversationStore:
+    """
+    Conversation state for live Twilio calls.
+
+    Each call keeps its system prompt (which carries the fire analysis) and as
+    many recent turns as fit in max_tokens. Older turns are folded into a short
+    running summary, so both memory per call and prompt size stay flat however
+    long the call runs. Calls are evicted ended_ttl seconds after hangup, or
+    idle_ttl seconds after their last activity if no hangup is ever reported.
+
+    Records live in a session backend (see create_session_backend), and every
+    update is a read-modify-write inside the backend's per-call transaction.
+    """
+
+    def __init__(self, backend=None, idle_ttl=CONVERSATION_IDLE_TTL, ended_ttl=CONVERSATION_ENDED_TTL,
+                 max_tokens=CONVERSATION_MAX_TOKENS, summary_chars=CONVERSATION_SUMMARY_CHARS):
+        self.backend = backend if backend is not None else create_session_backend()
+        self.idle_ttl = idle_ttl
+        self.ended_ttl = ended_ttl
+        self.max_tokens = max_tokens
+        self.summary_chars = summary_chars
+        self.last_sweep = time.time()
+        self.evicted = 0
+
+    def create(self, call_sid, messages, fire_analysis=None):
+        """Start tracking a call with its initial system/assistant messages."""
+        self._maybe_sweep()
+        record = {
+            "messages": list(messages),
+            "fire_analysis": fire_analysis,
+            "summary": "",
+            "tokens": sum(estimate_tokens(m["content"]) for m in messages),
+            "updated_at": time.time(),
+            "ended_at": None,
+            "continuation": None,
+        }
+        with self.backend.transaction(call_sid):
+            self.backend.save(call_sid, record)
+        return record
+
+    def get(self, call_sid):
+        """Return the call's record, or None if it is unknown or expired."""
+        self._maybe_sweep()
+        return self.backend.load(call_sid)
+
+    def __contains__(self, call_sid):
+        return self.get(call_sid) is not None
+
+    @contextmanager
+    def _update(self, call_sid):
+        """Yield the call's record for modification and save it afterwards (None if unknown)."""
+        with self.backend.transaction(call_sid):
+            record = self.backend.load(call_sid)
+            yield record
+            if record is not None:
+                self.backend.save(call_sid, record)
+
+    def append(self, call_sid, role, content):
+        """Add a turn to the call and trim older turns into the summary if over budget."""
+        with self._update(call_sid) as record:
+            if record is None:
+                return
+            record["messages"].append({"role": role, "content": content})
+            record["tokens"] += estimate_tokens(content)
+            record["updated_at"] = time.time()
+            self._compact(record)
+
+    def context(self, call_sid):
+        """Messages to send to the model: system prompt, summary of older turns, recent turns."""
+        record = self.backend.load(call_sid)
+        if record is None:
+            raise KeyError(call_sid)
+        messages = [m for m in record["messages"] if m["role"] == "system"]
+        if record["summary"]:
+            messages.append({"role": "system", "content": f"Earlier in this call: {record['summary']}"})
+        messages.extend(m for m in record["messages"] if m["role"] != "system")
+        return messages
+
+    def end(self, call_sid):
+        """Mark a call as finished; it is evicted after ended_ttl seconds."""
+        with self._update(call_sid) as record:
+            if record is not None:
+                record["ended_at"] = time.time()
+
+    def set_continuation(self, call_sid, text=None):
+        """
+        Record the state of a reply still being streamed: pending (text None) or
+        finished with the given remaining text. Any worker can then pick it up.
+        """
+        with self._update(call_sid) as record:
+            if record is not None:
+                record["continuation"] = {"done": text is not None, "text": text}
+
+    def take_continuation(self, call_sid):
+        """
+        Return the finished remainder of a streamed reply and clear it. Returns ""
+        if no reply is streaming for the call, or None if it is still pending.
+        Callers poll this, so the check is a plain read and only a finished reply
+        takes the write transaction to clear it.
+        """
+        record = self.backend.load(call_sid)
+        continuation = record.get("continuation") if record is not None else None
+        if continuation is None:
+            return ""
+        if not continuation["done"]:
+            return None
+        # Read again under the transaction in case another worker took it first
+        with self._update(call_sid) as record:
+            continuation = record.get("continuation") if record is not None else None
+            if continuation is None:
+                return ""
+            if not continuation["done"]:
+                return None
+            record["continuation"] = None
+            return continuation["text"]
+
+    def _compact(self, record):
+        messages = record["messages"]
+        while record["tokens"] > self.max_tokens:
+            # Keep system messages and at least the latest exchange
+            index = next((i for i, m in enumerate(messages) if m["role"] != "system"), None)
+            if index is None or len(messages) - index <= 2:
+                break
+            dropped = messages.pop(index)
+            record["tokens"] -= estimate_tokens(dropped["content"])
+            speaker = "Operator" if dropped["role"] == "user" else "Assistant"
+            summary = f"{record['summary']} {speaker}: {dropped['content']}".strip()
+            # Only the most recent part of the summary is kept, starting at a word boundary
+            if len(summary) > self.summary_chars:
+                summary = summary[-self.summary_chars:].split(" ", 1)[-1]
+            record["summary"] = summary
+
+    def _maybe_sweep(self):
+        now = time.time()
+        if now - self.last_sweep < SWEEP_INTERVAL:
+            return
+        self.last_sweep = now
+        self.evicted += self.backend.sweep(now - self.idle_ttl, now - self.ended_ttl)
+
+    def stats(self):
+        """Number of tracked calls and approximate memory (or database space) they use."""
+        return dict(self.backend.stats(), evicted=self.evicted)
+
+
+conversation_store = ConversationStore()
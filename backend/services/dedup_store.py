@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+from config import ALERT_DEDUP_BACKEND, ALERT_DEDUP_WINDOW, ALERT_DEDUP_PATH
+from services import sqlite_db
+
+
+class MemoryDedupStore:
+    """
+    Process-local dedup store: a key can be claimed once per `window` seconds.
+
+    Claims are kept in expiry order, so expired keys are dropped from the head
+    and memory stays bounded by the number of keys claimed within one window.
+    """
+
+    def __init__(self, window=ALERT_DEDUP_WINDOW):
+        self.window = window
+        self.claims = OrderedDict()  # key -> expires_at
+        self.lock = threading.Lock()
+
+    def claim(self, key, now=None):
+        """Atomically claim `key`; returns False if it was already claimed within the window."""
+        now = time.time() if now is None else now
+        with self.lock:
+            while self.claims and next(iter(self.claims.values())) <= now:
+                self.claims.popitem(last=False)
+            if key in self.claims:
+                return False
+            self.claims[key] = now + self.window
+            return True
+
+    def release(self, key):
+        """Give up a claim (e.g. the alert failed) so the next attempt can claim it again."""
+        with self.lock:
+            self.claims.pop(key, None)
+
+    def stats(self):
+        return {"backend": "memory", "active_claims": len(self.claims)}
+
+
+class SQLiteDedupStore:
+    """
+    Dedup store in a SQLite database that several worker processes can share.
+
+    The database runs in WAL mode so readers never block the writer, and a claim
+    is a single upsert that only succeeds when the key is absent or expired, so
+    two workers racing for the same key cannot both win.
+    """
+
+    SWEEP_INTERVAL = 60  # seconds between deletes of expired rows
+
+    def __init__(self, path=ALERT_DEDUP_PATH, window=ALERT_DEDUP_WINDOW):
+        self.path = path
+        self.window = window
+        self.lock = threading.Lock()
+        self.last_sweep = 0.0
+        self.conn = sqlite_db.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS dedup_claims (key TEXT PRIMARY KEY, expires_at REAL NOT NULL)"
+        )
+
+    def claim(self, key, now=None):
+        """Atomically claim `key`; returns False if it was already claimed within the window."""
+        now = time.time() if now is None else now
+        with self.lock:
+            cursor = self.conn.execute(
+                "INSERT INTO dedup_claims (key, expires_at) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET expires_at = excluded.expires_at "
+                "WHERE dedup_claims.expires_at <= ?",
+                (key, now + self.window, now)
+            )
+            if now - self.last_sweep > self.SWEEP_INTERVAL:
+                self.last_sweep = now
+                self.conn.execute("DELETE FROM dedup_claims WHERE expires_at <= ?", (now,))
+            return cursor.rowcount == 1
+
+    def release(self, key):
+        """Give up a claim (e.g. the alert failed) so the next attempt can claim it again."""
+        with self.lock:
+            self.conn.execute("DELETE FROM dedup_claims WHERE key = ?", (key,))
+
+    def stats(self):
+        with self.lock:
+            (active,) = self.conn.execute(
+                "SELECT COUNT(*) FROM dedup_claims WHERE expires_at > ?", (time.time(),)
+            ).fetchone()
+        return {"backend": "sqlite", "path": self.path, "active_claims": active}
+
+
+def create_dedup_store(backend=ALERT_DEDUP_BACKEND):
+    if backend == "sqlite":
+        return SQLiteDedupStore()
+    if backend != "memory":
+        raise ValueError(f"Unknown dedup backend: {backend}")
+    return MemoryDedupStore()
+
+
+# Claims for "this user was already alerted recently", shared by every alert path
+alert_dedup = create_dedup_store()
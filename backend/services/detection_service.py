@@ -0,0 +1,99 @@
+import asyncio
+import base64
+import httpx
+from services.prefilter import estimate_fire
+from services.preprocessing import PreparedFrame
+from services.clients import clients
+from services.metrics import metrics
+from services.resilience import resilience
+from config import (ROBOFLOW_API_KEY, ROBOFLOW_MODEL_URL, ROBOFLOW_TIMEOUT, ROBOFLOW_MAX_CONNECTIONS,
+                    ROBOFLOW_MAX_CONCURRENCY, ROBOFLOW_BINARY_UPLOAD, ROBOFLOW_HEDGE_AFTER)
+
+# Classes from the Roboflow model that count as a fire detection
+FIRE_CLASSES = ["fire", "smoke", "spark"]
+FIRE_THRESHOLD = 0.5
+
+# Concurrency cap for Roboflow calls, created lazily on the running event loop
+_semaphore = None
+
+
+def _create_detection_client():
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(ROBOFLOW_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=ROBOFLOW_MAX_CONNECTIONS,
+            max_keepalive_connections=ROBOFLOW_MAX_CONNECTIONS
+        )
+    )
+
+
+async def _warm_detection_client(client):
+    # Any response means the TCP+TLS connection is now open in the pool
+    await client.head(ROBOFLOW_MODEL_URL)
+
+
+clients.register("roboflow", _create_detection_client, warmup=_warm_detection_client)
+
+
+def _get_semaphore():
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(ROBOFLOW_MAX_CONCURRENCY)
+    return _semaphore
+
+
+@metrics.instrument("detect_fire")
+async def detect_fire(image):
+    """
+    Call Roboflow API to detect fire in the image (JPEG bytes or PreparedFrame).
+    Returns a tuple of (fire_detected, confidence_score, source), where source is
+    "roboflow", or "fallback" when the local estimate answered instead.
+    """
+    frame = PreparedFrame.wrap(image)
+    try:
+        # Send the frame downscaled to the model's input size, as raw JPEG where enabled
+        if ROBOFLOW_BINARY_UPLOAD:
+            request = {"files": {"file": ("frame.jpg", frame.detector_jpeg, "image/jpeg")}}
+        else:
+            request = {
+                "content": base64.b64encode(frame.detector_jpeg).decode('utf-8'),
+                "headers": {"Content-Type": "application/x-www-form-urlencoded"}
+            }
+
+        async def attempt():
+            with clients.track("roboflow"):
+                response = await clients.get("roboflow").post(
+                    ROBOFLOW_MODEL_URL,
+                    params={"api_key": ROBOFLOW_API_KEY},
+                    **request
+                )
+            response.raise_for_status()
+            return response.json()
+
+        # Wait for a free slot so a burst of frames can't flood Roboflow. The wait comes out of
+        # the frame's budget but not the call's timeout, so queueing is never blamed on Roboflow.
+        # Within the budget, a slow call is hedged (in a slot of its own, if one is free) and a
+        # failing provider skipped entirely.
+        semaphore = _get_semaphore()
+        async with semaphore:
+            result = await resilience.guard("roboflow", attempt, ROBOFLOW_TIMEOUT,
+                                            hedge_after=ROBOFLOW_HEDGE_AFTER, hedge_slot=semaphore)
+
+        predictions = result.get("predictions", [])
+
+        highest_confidence = 0
+        for pred in predictions:
+            if pred.get("class") in FIRE_CLASSES:
+                confidence = pred.get("confidence", 0)
+                highest_confidence = max(highest_confidence, confidence)
+
+        # Determine if fire is detected based on confidence threshold
+        fire_detected = highest_confidence >= FIRE_THRESHOLD
+        return fire_detected, highest_confidence, "roboflow"
+
+    except Exception as e:
+        print(f"Error in fire detection: {e!r}")
+        metrics.error("detect_fire")
+        # Fall back to the local colour-based estimate if Roboflow is failing, slow or out of budget
+        fire_detected, confidence_score = estimate_fire(frame, threshold=FIRE_THRESHOLD)
+        return fire_detected, confidence_score, "fallback"
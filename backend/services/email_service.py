@@ -1,49 +1,52 @@
+import fcntl
 import imaplib
+import select
+import ssl
+import base64
+import json
+import quopri
+import re
+from collections import deque
 import email
 import email.header
 import time
 import os
 import threading
+from contextlib import contextmanager
 from datetime import datetime
 from email.utils import parseaddr
-from mailjet_rest import Client
-import asyncio
+from string import Template
 
-from config import (MAILJET_API_KEY, MAILJET_SECRET_KEY, EMAIL_FROM, 
+from config import (EMAIL_FROM, 
                     EMAIL_FROM_NAME, EMAIL_IMAP_SERVER, EMAIL_IMAP_PORT, 
-                    EMAIL_USERNAME, EMAIL_PASSWORD)
+                    EMAIL_USERNAME, EMAIL_PASSWORD, EMAIL_IMAP_MODE,
+                    EMAIL_IDLE_TIMEOUT, EMAIL_POLL_INTERVAL, EMAIL_STATE_PATH,
+                    EMAIL_DEDUP_WINDOW, EMAIL_BODY_PEEK_BYTES)
 from services.storage_service import get_latest_fire_image
 from services.ai_service import analyze_fire_image_with_gemini
+from services.mail_outbox import mail_outbox
+from services.command_dispatcher import command_dispatcher
+from services.metrics import metrics
 
-# Initialize Mailjet client
-mailjet = Client(auth=(MAILJET_API_KEY, MAILJET_SECRET_KEY), version='v3.1')
-
-# Keep track of users who have already been notified (to avoid spam)
-notified_users = set()
+# Longest wait for the rest of a server line once IDLE has seen input; a stalled connection is dropped and reopened
+IDLE_LINE_TIMEOUT = 30
 
 # Dictionary to keep track of user UUIDs by email (to retrieve their images later)
 user_email_to_uuid = {}
 
-def send_email_alert(user_email, frame_number, timestamp, user_uuid, image_url=None):
-    """Send an email alert to the user when a fire is detected using Mailjet API."""
-    try:
-        # Store the email-to-uuid mapping for later use
-        user_email_to_uuid[user_email] = user_uuid
-        print(f"User email {user_email} mapped to UUID {user_uuid}")
-        
-        # Email body with reply instructions
-        html_body = f"""
+# Email bodies are compiled once; only the per-message values are filled in on each send
+ALERT_HTML_TEMPLATE = Template("""
         <html>
         <body>
             <h2>⚠️ Fire Detection Alert ⚠️</h2>
             <p>Our system has detected a potential fire in your video processing.</p>
             <p><strong>Details:</strong></p>
             <ul>
-                <li>Frame Number: {frame_number}</li>
-                <li>Timestamp: {timestamp:.2f} seconds</li>
-                <li>Detection Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</li>
+                <li>Frame Number: $frame_number</li>
+                <li>Timestamp: $timestamp seconds</li>
+                <li>Detection Time: $detection_time</li>
             </ul>
-            {"<p>You can view the detected frame here: <a href='" + image_url + "'>View Image</a></p>" if image_url else ""}
+            $image_link
             <p>Please check your monitoring system immediately and take appropriate action.</p>
             <hr>
             <p><strong>Need an update?</strong> You can reply to this email with:</p>
@@ -53,20 +56,20 @@ def send_email_alert(user_email, frame_number, timestamp, user_uuid, image_url=N
             <p><em>This is an automated message from your fire monitoring system.</em></p>
         </body>
         </html>
-        """
-        
-        # Text version for clients that don't support HTML
-        text_body = f"""
+        """)
+
+# Text version for clients that don't support HTML
+ALERT_TEXT_TEMPLATE = Template("""
         ⚠️ Fire Detection Alert ⚠️
         
         Our system has detected a potential fire in your video processing.
         
         Details:
-        - Frame Number: {frame_number}
-        - Timestamp: {timestamp:.2f} seconds
-        - Detection Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+        - Frame Number: $frame_number
+        - Timestamp: $timestamp seconds
+        - Detection Time: $detection_time
         
-        {"You can view the detected frame here: " + image_url if image_url else ""}
+        $image_link
         
         Please check your monitoring system immediately and take appropriate action.
         
@@ -75,64 +78,20 @@ def send_email_alert(user_email, frame_number, timestamp, user_uuid, image_url=N
         - CALL - To request emergency services (coming soon)
         
         This is an automated message from your fire monitoring system.
-        """
-        
-        # Create Mailjet email data structure
-        data = {
-            'Messages': [
-                {
-                    'From': {
-                        'Email': EMAIL_FROM,
-                        'Name': EMAIL_FROM_NAME
-                    },
-                    'To': [
-                        {
-                            'Email': user_email
-                        }
-                    ],
-                    'Subject': "🔥 URGENT: Fire Detection Alert! 🔥",
-                    'TextPart': text_body,
-                    'HTMLPart': html_body,
-                    'CustomID': f"fire_alert_{user_uuid}_{frame_number}"
-                }
-            ]
-        }
-        
-        # Send the email using Mailjet API
-        print("SENDING EMAIL VIA MAILJET")
-        result = mailjet.send.create(data=data)
-        
-        # Check if the email was sent successfully
-        if result.status_code == 200:
-            print(f"Email alert sent to {user_email}")
-            return True
-        else:
-            print(f"Failed to send email: {result.status_code}, {result.json()}")
-            return False
-            
-    except Exception as e:
-        print(f"Error sending email alert: {e}")
-        return False
+        """)
 
-def send_status_response_email(to_email, analysis_text, image_url):
-    """Send a response email with fire status analysis using Mailjet API."""
-    try:
-        # Current time for the report
-        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        
-        # HTML body with the analysis
-        html_body = f"""
+STATUS_HTML_TEMPLATE = Template("""
         <html>
         <body>
             <h2>🔍 Fire Status Analysis Report</h2>
-            <p>Time of Report: {current_time}</p>
+            <p>Time of Report: $current_time</p>
             <p>Below is an AI-powered analysis of the most recent fire image:</p>
             
             <div style="background-color: #f8f9fa; border-left: 4px solid #ff6b6b; padding: 15px; margin: 15px 0;">
-                {analysis_text.replace('\n', '<br>')}
+                $analysis_html
             </div>
             
-            <p>Reference Image: <a href="{image_url}">View Image</a></p>
+            <p>Reference Image: <a href="$image_url">View Image</a></p>
             
             <p><strong>Important:</strong> This is an automated analysis. In case of an actual emergency, please contact emergency services immediately.</p>
             
@@ -145,19 +104,18 @@ def send_status_response_email(to_email, analysis_text, image_url):
             <p><em>This is an automated message from your fire monitoring system.</em></p>
         </body>
         </html>
-        """
-        
-        # Text version
-        text_body = f"""
+        """)
+
+STATUS_TEXT_TEMPLATE = Template("""
         🔍 Fire Status Analysis Report
         
-        Time of Report: {current_time}
+        Time of Report: $current_time
         
         Below is an AI-powered analysis of the most recent fire image:
         
-        {analysis_text}
+        $analysis_text
         
-        Reference Image: {image_url}
+        Reference Image: $image_url
         
         Important: This is an automated analysis. In case of an actual emergency, please contact emergency services immediately.
         
@@ -166,44 +124,148 @@ def send_status_response_email(to_email, analysis_text, image_url):
         - CALL - To request emergency services (coming soon)
         
         This is an automated message from your fire monitoring system.
-        """
+        """)
+
+SENDER = {
+    'Email': EMAIL_FROM,
+    'Name': EMAIL_FROM_NAME
+}
+
+@metrics.instrument("send_email_alert")
+async def send_email_alert(user_email, frame_number, timestamp, user_uuid, image_url=None):
+    """Send an email alert to the user when a fire is detected using Mailjet API."""
+    try:
+        # Store the email-to-uuid mapping for later use
+        user_email_to_uuid[user_email] = user_uuid
+        print(f"User email {user_email} mapped to UUID {user_uuid}")
         
-        # Create Mailjet email data structure
-        data = {
-            'Messages': [
+        values = {
+            "frame_number": frame_number,
+            "timestamp": f"{timestamp:.2f}",
+            "detection_time": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        html_body = ALERT_HTML_TEMPLATE.substitute(
+            values,
+            image_link=f"<p>You can view the detected frame here: <a href='{image_url}'>View Image</a></p>" if image_url else ""
+        )
+        text_body = ALERT_TEXT_TEMPLATE.substitute(
+            values,
+            image_link=f"You can view the detected frame here: {image_url}" if image_url else ""
+        )
+        
+        # Create Mailjet message
+        message = {
+            'From': SENDER,
+            'To': [
                 {
-                    'From': {
-                        'Email': EMAIL_FROM,
-                        'Name': EMAIL_FROM_NAME
-                    },
-                    'To': [
-                        {
-                            'Email': to_email
-                        }
-                    ],
-                    'Subject': "Fire Status Analysis - Automated Response",
-                    'TextPart': text_body,
-                    'HTMLPart': html_body,
-                    'CustomID': f"fire_status_{datetime.now().timestamp()}"
+                    'Email': user_email
                 }
-            ]
+            ],
+            'Subject': "🔥 URGENT: Fire Detection Alert! 🔥",
+            'TextPart': text_body,
+            'HTMLPart': html_body,
+            'CustomID': f"fire_alert_{user_uuid}_{frame_number}"
         }
         
-        # Send the email using Mailjet API
-        result = mailjet.send.create(data=data)
+        # Queue the email; it goes out with any other alerts in the same batch window
+        print("SENDING EMAIL VIA MAILJET")
+        sent = await mail_outbox.send(message)
         
-        # Check if the email was sent successfully
-        if result.status_code == 200:
+        if sent:
+            print(f"Email alert sent to {user_email}")
+        else:
+            print(f"Failed to send email alert to {user_email}")
+            metrics.error("send_email_alert")
+        return sent
+            
+    except Exception as e:
+        print(f"Error sending email alert: {e}")
+        metrics.error("send_email_alert")
+        return False
+
+async def send_status_response_email(to_email, analysis_text, image_url):
+    """Send a response email with fire status analysis using Mailjet API."""
+    try:
+        # Current time for the report
+        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        
+        html_body = STATUS_HTML_TEMPLATE.substitute(
+            current_time=current_time,
+            analysis_html=analysis_text.replace('\n', '<br>'),
+            image_url=image_url
+        )
+        text_body = STATUS_TEXT_TEMPLATE.substitute(
+            current_time=current_time,
+            analysis_text=analysis_text,
+            image_url=image_url
+        )
+        
+        # Create Mailjet message
+        message = {
+            'From': SENDER,
+            'To': [
+                {
+                    'Email': to_email
+                }
+            ],
+            'Subject': "Fire Status Analysis - Automated Response",
+            'TextPart': text_body,
+            'HTMLPart': html_body,
+            'CustomID': f"fire_status_{datetime.now().timestamp()}"
+        }
+        
+        sent = await mail_outbox.send(message)
+        
+        if sent:
             print(f"Status analysis email sent to {to_email}")
-            return True
         else:
-            print(f"Failed to send status email: {result.status_code}, {result.json()}")
-            return False
+            print(f"Failed to send status email to {to_email}")
+        return sent
             
     except Exception as e:
         print(f"Error sending status response email: {e}")
         return False
 
+# Only the headers we need plus the first few KB of the first body part; attachments are never downloaded
+FETCH_ITEMS = (
+    f"(UID BODY.PEEK[HEADER.FIELDS (FROM TO SUBJECT DATE MESSAGE-ID CONTENT-TYPE CONTENT-TRANSFER-ENCODING)] "
+    f"BODY.PEEK[1]<0.{EMAIL_BODY_PEEK_BYTES}>)"
+)
+FETCH_BATCH_SIZE = 100
+BASE64_BODY = re.compile(rb'^[A-Za-z0-9+/=]{40,}\r?\n(?:[A-Za-z0-9+/=]*\r?\n?)*$')
+
+def decode_body_part(body_bytes, header_message):
+    """
+    Decode the first body part of a message to text.
+    For single-part messages the transfer encoding comes from the headers;
+    for multipart ones it is not fetched, so it is inferred from the content.
+    """
+    if header_message.get_content_maintype() == 'multipart':
+        if BASE64_BODY.match(body_bytes.lstrip()):
+            encoding = 'base64'
+        elif b'=\r\n' in body_bytes or re.search(rb'=[0-9A-F]{2}', body_bytes):
+            encoding = 'quoted-printable'
+        else:
+            encoding = '7bit'
+    else:
+        encoding = header_message.get('Content-Transfer-Encoding', '7bit').strip().lower()
+    
+    try:
+        if encoding == 'base64':
+            # The fetch may cut the body mid-quantum; drop the incomplete tail
+            data = b''.join(body_bytes.split())
+            body_bytes = base64.b64decode(data[:len(data) - len(data) % 4])
+        elif encoding == 'quoted-printable':
+            body_bytes = quopri.decodestring(body_bytes)
+    except Exception as e:
+        print(f"Error decoding email body: {e}")
+    
+    charset = header_message.get_content_charset() or 'utf-8'
+    try:
+        return body_bytes.decode(charset, errors='replace')
+    except LookupError:
+        return body_bytes.decode('utf-8', errors='replace')
+
 class EmailPoller:
     """Class to handle checking for email responses via IMAP."""
     
@@ -212,7 +274,13 @@ class EmailPoller:
         self.imap_port = EMAIL_IMAP_PORT
         self.username = EMAIL_USERNAME
         self.password = EMAIL_PASSWORD
-        self.processed_ids = set()  # Track processed message IDs
+        self.state_path = EMAIL_STATE_PATH
+        self.uid_validity = None
+        self.last_uid = 0
+        # Track recently processed message IDs (bounded window)
+        self.recent_ids = deque(maxlen=EMAIL_DEDUP_WINDOW)
+        self.processed_ids = set()
+        self.load_state()
         
     def connect(self):
         """Establish connection to the IMAP server."""
@@ -236,90 +304,223 @@ class EmailPoller:
             #print("Disconnected from email server")
         except Exception as e:
             print(f"Error disconnecting from email server: {e}")
+    
+    def supports_idle(self):
+        """Whether the connected server advertises the IDLE extension (RFC 2177)."""
+        return "IDLE" in self.mail.capabilities
+    
+    def idle(self, timeout):
+        """
+        Wait in IMAP IDLE until the server reports new mail or `timeout` seconds pass.
+        Returns True if new mail arrived. Raises on connection errors so the caller can reconnect.
+        """
+        tag = self.mail._new_tag()
+        self.mail.send(tag + b" IDLE\r\n")
+        
+        sock = self.mail.sock
+        previous_timeout = sock.gettimeout()
+        sock.settimeout(IDLE_LINE_TIMEOUT)
+        new_mail = False
+        deadline = time.monotonic() + timeout
+        try:
+            # Lines go through imaplib's own buffered reader, but only once input is waiting:
+            # a read that times out would leave that reader unusable
+            while self._input_waiting(deadline - time.monotonic()):
+                line = self._read_line()
+                if line.startswith(b"+"):
+                    continue  # Server accepted IDLE
+                if line.startswith(tag):
+                    raise imaplib.IMAP4.error(f"IDLE rejected: {line.decode(errors='replace')}")
+                if line.endswith(b"EXISTS") or line.endswith(b"RECENT"):
+                    new_mail = True
+                    break
+            
+            # Leave IDLE and wait for the tagged completion
+            self.mail.send(b"DONE\r\n")
+            while not self._read_line().startswith(tag):
+                pass
+        finally:
+            sock.settimeout(previous_timeout)
+        return new_mail
+    
+    def _input_waiting(self, timeout):
+        """Whether a server line can be read within `timeout` seconds, counting what imaplib has buffered."""
+        if timeout <= 0:
+            return False
+        sock = self.mail.sock
+        sock.setblocking(False)
+        try:
+            if self.mail.file.peek(1):
+                return True
+        except (BlockingIOError, ssl.SSLWantReadError):
+            pass  # Nothing buffered and nothing on the socket yet
+        finally:
+            sock.settimeout(IDLE_LINE_TIMEOUT)
+        readable, _, _ = select.select([sock], [], [], timeout)
+        return bool(readable)
+    
+    def _read_line(self):
+        line = self.mail.readline()
+        if not line:
+            raise imaplib.IMAP4.abort("Connection closed during IDLE")
+        return line.rstrip(b"\r\n")
             
+    @contextmanager
+    def state_lock(self, exclusive):
+        """
+        Hold the lock on the state file. Every uvicorn worker runs its own poller
+        (each only knows the users it alerted) and they all share the file.
+        """
+        with open(f"{self.state_path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield  # Closing the file releases the lock
+    
+    def read_state(self):
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+    
+    def load_state(self):
+        """Load the persisted UIDVALIDITY and highest processed UID."""
+        try:
+            with self.state_lock(exclusive=False):
+                state = self.read_state()
+            self.uid_validity = state.get("uid_validity")
+            self.last_uid = state.get("last_uid", 0)
+        except Exception as e:
+            print(f"Error loading email state: {e}")
+    
+    def save_state(self):
+        """
+        Persist the UID high-water mark so a restart resumes where we left off.
+        The file keeps the highest mark any worker has reached for the mailbox.
+        """
+        try:
+            with self.state_lock(exclusive=True):
+                state = self.read_state()
+                last_uid = self.last_uid
+                if state.get("uid_validity") == self.uid_validity:
+                    last_uid = max(last_uid, state.get("last_uid", 0))
+                # Per-process temporary file, swapped in atomically
+                tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump({"uid_validity": self.uid_validity, "last_uid": last_uid}, f)
+                os.replace(tmp_path, self.state_path)
+        except Exception as e:
+            print(f"Error saving email state: {e}")
+    
+    def mark_processed(self, email_id):
+        """Remember a Message-ID; returns False if it was already seen recently."""
+        if email_id in self.processed_ids:
+            return False
+        if len(self.recent_ids) == self.recent_ids.maxlen:
+            self.processed_ids.discard(self.recent_ids[0])
+        self.recent_ids.append(email_id)
+        self.processed_ids.add(email_id)
+        return True
+    
+    def find_new_uids(self):
+        """Select the inbox and return the UIDs that arrived since the last check."""
+        self.mail.select('INBOX')
+        _, values = self.mail.response('UIDVALIDITY')
+        uid_validity = int(values[0]) if values and values[0] else None
+        
+        if uid_validity != self.uid_validity or not self.last_uid:
+            # First run or the mailbox was rebuilt: UIDs are meaningless, start from unread mail
+            if self.uid_validity is not None and uid_validity != self.uid_validity:
+                print("UIDVALIDITY changed, resyncing from unread messages")
+            self.uid_validity = uid_validity
+            self.last_uid = 0
+            status, data = self.mail.uid('SEARCH', None, 'UNSEEN')
+        else:
+            status, data = self.mail.uid('SEARCH', None, f'UID {self.last_uid + 1}:*')
+        
+        if status != 'OK' or not data or not data[0]:
+            return []
+        # "N:*" always matches the newest message, even if it is older than N
+        return sorted(uid for uid in map(int, data[0].split()) if uid > self.last_uid)
+    
+    def fetch_messages(self, uids):
+        """
+        Fetch headers and the start of the first body part for many UIDs in one round trip.
+        Returns a list of (uid, header_bytes, body_bytes).
+        """
+        status, data = self.mail.uid('FETCH', ','.join(map(str, uids)), FETCH_ITEMS)
+        if status != 'OK':
+            print(f"Error fetching emails {uids}: {status}")
+            return []
+        
+        messages = []
+        current = None
+        for item in data:
+            prefix = item[0] if isinstance(item, tuple) else item
+            if not isinstance(prefix, bytes):
+                continue
+            if re.match(rb'^\d+ \(', prefix):
+                current = {"uid": None, "header": b"", "body": b""}
+                messages.append(current)
+            if current is None:
+                continue
+            uid_match = re.search(rb'UID (\d+)', prefix)
+            if uid_match:
+                current["uid"] = int(uid_match.group(1))
+            if isinstance(item, tuple):
+                if b'HEADER.FIELDS' in prefix:
+                    current["header"] = item[1]
+                elif b'BODY[1]' in prefix:
+                    current["body"] = item[1]
+        return [(m["uid"], m["header"], m["body"]) for m in messages if m["uid"] is not None]
+            
+    @metrics.instrument("imap_poll")
     def check_for_replies(self):
         """Check for new reply emails and process them."""
         try:
-            # Select the inbox
-            self.mail.select('INBOX')
-            #print(self.username, "TEMP MAIL USERNAME")
-            
-            status, data = self.mail.search(None, 'UNSEEN')
+            uids = self.find_new_uids()
             
-            # Process each unread email
-            for num in data[0].split():
-                status, data = self.mail.fetch(num, '(RFC822)')
+            for start in range(0, len(uids), FETCH_BATCH_SIZE):
+                batch = uids[start:start + FETCH_BATCH_SIZE]
                 
-                if status != 'OK':
-                    print(f"Error fetching email {num}: {status}")
-                    continue
+                for uid, header, body_bytes in sorted(self.fetch_messages(batch)):
+                    email_message = email.message_from_bytes(header)
                     
-                raw_email = data[0][1]
-                email_message = email.message_from_bytes(raw_email)
-                
-                # Get email ID to avoid processing duplicates
-                email_id = email_message.get('Message-ID', '')
-                
-                if email_id in self.processed_ids:
-                    print(f"Already processed email ID: {email_id}")
-                    continue
+                    # Get email ID to avoid processing duplicates
+                    email_id = email_message.get('Message-ID', '') or f"uid:{self.uid_validity}:{uid}"
                     
-                self.processed_ids.add(email_id)
-                
-                # Extract sender email
-                sender_email = parseaddr(email_message['From'])[1]
-                print(f"Sender email: {sender_email}")
-                
-                # Only process emails from users who have received fire alerts
-                if sender_email not in user_email_to_uuid:
-                    # Mark as read but don't process further
-                    self.mail.store(num, '+FLAGS', '\\Seen')
-                    continue
-                
-                # Print email details for debugging (only for relevant users)
-                print("\n=== NEW EMAIL RECEIVED FROM MONITORED USER ===")
-                print(f"From: {email_message['From']}")
-                print(f"To: {email_message['To']}")
-                print(f"Subject: {email_message['Subject']}")
-                print(f"Date: {email_message['Date']}")
-                print(f"Sender email: {sender_email}")
-                
-                # Process email body
-                body = ""
-                
-                # Extract body content based on message type
-                if email_message.is_multipart():
-                    for part in email_message.walk():
-                        content_type = part.get_content_type()
-                        content_disposition = str(part.get("Content-Disposition"))
-                        
-                        # Skip attachments
-                        if "attachment" in content_disposition:
-                            continue
-                            
-                        # Get text content
-                        if content_type in ["text/plain", "text/html"]:
-                            try:
-                                body_part = part.get_payload(decode=True).decode()
-                                body += body_part
-                                break  # We only need one text part
-                            except Exception as e:
-                                print(f"Error decoding email body: {e}")
-                else:
-                    # Get body for non-multipart messages
-                    try:
-                        body = email_message.get_payload(decode=True).decode()
-                    except Exception as e:
-                        print(f"Error decoding email body: {e}")
-                
-                # Process commands in email body
-                self.process_email_command(sender_email, body)
+                    if not self.mark_processed(email_id):
+                        print(f"Already processed email ID: {email_id}")
+                        continue
+                    
+                    # Extract sender email
+                    sender_email = parseaddr(email_message['From'])[1]
+                    print(f"Sender email: {sender_email}")
+                    
+                    # Only process emails from users who have received fire alerts
+                    if sender_email not in user_email_to_uuid:
+                        continue
+                    
+                    # Print email details for debugging (only for relevant users)
+                    print("\n=== NEW EMAIL RECEIVED FROM MONITORED USER ===")
+                    print(f"From: {email_message['From']}")
+                    print(f"To: {email_message['To']}")
+                    print(f"Subject: {email_message['Subject']}")
+                    print(f"Date: {email_message['Date']}")
+                    print(f"Sender email: {sender_email}")
+                    
+                    body = decode_body_part(body_bytes, email_message)
+                    
+                    # Process commands in email body
+                    self.process_email_command(sender_email, body)
                 
-                # Mark as read
-                self.mail.store(num, '+FLAGS', '\\Seen')
+                # Mark the whole batch as read and advance the high-water mark
+                self.mail.uid('STORE', ','.join(map(str, batch)), '+FLAGS', '\\Seen')
+                self.last_uid = max(self.last_uid, batch[-1])
+                self.save_state()
                 
         except Exception as e:
             print(f"Error checking for replies: {e}")
+            metrics.error("imap_poll")
 
     async def handle_status_command(self, sender_email):
         """Handle STATUS command from a user."""
@@ -340,7 +541,7 @@ class EmailPoller:
             analysis = await analyze_fire_image_with_gemini(latest_image["content"])
             
             # Send the analysis back to the user
-            send_status_response_email(
+            await send_status_response_email(
                 to_email=sender_email,
                 analysis_text=analysis,
                 image_url=latest_image["url"]
@@ -358,33 +559,68 @@ class EmailPoller:
         # Check for known commands
         if "STATUS" in body_upper:
             print(f"STATUS command received from {sender_email}")
-            asyncio.run(self.handle_status_command(sender_email))
+            # Hand off to the app's event loop so this thread can keep reading mail
+            command_dispatcher.submit(sender_email, "STATUS", lambda: self.handle_status_command(sender_email))
         elif "CALL" in body_upper:
             print(f"CALL command received from {sender_email}")
             # TODO: Implement call functionality
         else:
             print(f"No recognized command in email from {sender_email}")
 
+def poll_for_replies(poller):
+    """Check for replies on a fresh connection every EMAIL_POLL_INTERVAL seconds."""
+    while True:
+        # Connect to email server
+        if poller.connect():
+            # Check for new emails
+            poller.check_for_replies()
+            
+            # Disconnect
+            poller.disconnect()
+        
+        # Wait before checking again
+        time.sleep(EMAIL_POLL_INTERVAL)
+
+def idle_for_replies(poller):
+    """
+    Keep one IMAP connection open and wait for new mail with IDLE.
+    Reconnects with backoff when the connection drops. Returns if the server
+    does not support IDLE so the caller can fall back to polling.
+    """
+    backoff = 1
+    while True:
+        if not poller.connect():
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+            continue
+        backoff = 1
+        
+        if not poller.supports_idle():
+            print("IMAP server does not support IDLE, falling back to polling")
+            poller.disconnect()
+            return
+        
+        try:
+            # Catch up on anything that arrived while we were disconnected
+            poller.check_for_replies()
+            while True:
+                if poller.idle(EMAIL_IDLE_TIMEOUT):
+                    poller.check_for_replies()
+                else:
+                    # Keepalive before re-issuing IDLE so servers don't drop the session
+                    poller.mail.noop()
+        except Exception as e:
+            print(f"IMAP IDLE connection lost, reconnecting: {e}")
+            poller.disconnect()
+
 def start_email_polling():
-    """Start polling for email responses."""
+    """Start listening for email responses (IDLE push, or polling as a fallback)."""
     poller = EmailPoller()
     
     try:
-        #print("Starting email polling service...")
-        
-        while True:
-            # Connect to email server
-            if poller.connect():
-                # Check for new emails
-                #print("POLLER CONNECTED")
-                poller.check_for_replies()
-                
-                # Disconnect
-                poller.disconnect()
-            
-            # Wait before checking again
-            #print(f"Waiting 2 seconds before checking again...")
-            time.sleep(1)
+        if EMAIL_IMAP_MODE == "idle":
+            idle_for_replies(poller)
+        poll_for_replies(poller)
             
     except KeyboardInterrupt:
         print("Email polling service stopped by user")
@@ -0,0 +1,95 @@
+import time
+from collections import OrderedDict
+from PIL import Image
+from services.preprocessing import PreparedFrame
+from config import (FRAME_CACHE_MAX_DISTANCE, FRAME_CACHE_ENTRIES_PER_STREAM,
+                    FRAME_CACHE_MAX_STREAMS, FRAME_CACHE_TTL)
+
+HASH_SIZE = 8  # 8x8 difference bits -> 64-bit hash
+
+
+def compute_dhash(frame, hash_size=HASH_SIZE):
+    """
+    Compute a difference hash (dHash) of a frame (JPEG bytes or PreparedFrame).
+    The frame is shrunk to (hash_size + 1) x hash_size grayscale and each bit
+    records whether a pixel is brighter than its right-hand neighbour.
+    """
+    # Start from the frame's small decoded thumbnail rather than decoding the JPEG again
+    image = PreparedFrame.wrap(frame).thumbnail_image
+    pixels = list(image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR).getdata())
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+class FrameCache:
+    """
+    Per-stream cache of recent detection results keyed by perceptual hash.
+
+    Each stream keeps its most recent entries (LRU by last hit) and entries
+    older than the TTL are ignored and dropped. Streams themselves are evicted
+    least-recently-used once there are more than max_streams of them.
+    """
+
+    def __init__(self, max_distance=FRAME_CACHE_MAX_DISTANCE,
+                 entries_per_stream=FRAME_CACHE_ENTRIES_PER_STREAM,
+                 max_streams=FRAME_CACHE_MAX_STREAMS, ttl=FRAME_CACHE_TTL):
+        self.max_distance = max_distance
+        self.entries_per_stream = entries_per_stream
+        self.max_streams = max_streams
+        self.ttl = ttl
+        self.streams = OrderedDict()  # stream_id -> OrderedDict(frame_hash -> (fire_detected, confidence, stored_at))
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, stream_id, frame_hash):
+        """Return a cached (fire_detected, confidence) for a similar frame, or None."""
+        entries = self.streams.get(stream_id)
+        if entries is not None:
+            self.streams.move_to_end(stream_id)
+            now = time.monotonic()
+            for cached_hash, (fire_detected, confidence, stored_at) in list(entries.items()):
+                if now - stored_at > self.ttl:
+                    del entries[cached_hash]
+                    continue
+                if hamming_distance(cached_hash, frame_hash) <= self.max_distance:
+                    entries.move_to_end(cached_hash)
+                    self.hits += 1
+                    return fire_detected, confidence
+        self.misses += 1
+        return None
+
+    def store(self, stream_id, frame_hash, fire_detected, confidence):
+        """Remember the detection result for a frame hash."""
+        entries = self.streams.get(stream_id)
+        if entries is None:
+            entries = self.streams[stream_id] = OrderedDict()
+            if len(self.streams) > self.max_streams:
+                self.streams.popitem(last=False)
+        else:
+            self.streams.move_to_end(stream_id)
+
+        entries[frame_hash] = (fire_detected, confidence, time.monotonic())
+        entries.move_to_end(frame_hash)
+        while len(entries) > self.entries_per_stream:
+            entries.popitem(last=False)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "streams": len(self.streams),
+        }
+
+
+frame_cache = FrameCache()
@@ -0,0 +1,114 @@
+import os
+import re
+from collections import OrderedDict
+from config import UPLOAD_DIR, FRAME_STORE_MEMORY_BYTES, FRAME_STORE_DISK_FILES
+
+FRAME_NUMBER_PATTERN = re.compile(r'_fire_frame_(\d+)\.jpg$')
+
+
+def frame_number_from_name(name):
+    """Numeric frame number from an uploaded file name, or -1 if it has none."""
+    match = FRAME_NUMBER_PATTERN.search(name)
+    return int(match.group(1)) if match else -1
+
+
+class FrameStore:
+    """
+    Index of each user's latest uploaded fire frame plus a local cache of frame bytes.
+
+    Uploads record the frame here, so STATUS requests can find the latest image
+    without listing the bucket. Frame bytes are held in an in-memory LRU capped at
+    max_bytes; frames pushed out of memory spill to disk (capped at max_files)
+    before being forgotten entirely.
+    """
+
+    def __init__(self, max_bytes=FRAME_STORE_MEMORY_BYTES, spill_dir=os.path.join(UPLOAD_DIR, "cache"),
+                 max_files=FRAME_STORE_DISK_FILES):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.max_files = max_files
+        self.latest = {}  # user_uuid -> {"frame_number", "timestamp", "path", "url"}
+        self.memory = OrderedDict()  # storage path -> bytes
+        self.memory_bytes = 0
+        self.spilled = OrderedDict()  # storage path -> local file
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.spill_dir, exist_ok=True)
+
+    def record(self, user_uuid, frame_number, timestamp, path, url, content=None):
+        """Remember an uploaded frame; it becomes the user's latest if it is the newest seen."""
+        current = self.latest.get(user_uuid)
+        key = (frame_number, timestamp or 0)
+        if current is None or key >= (current["frame_number"], current["timestamp"] or 0):
+            self.latest[user_uuid] = {
+                "frame_number": frame_number,
+                "timestamp": timestamp,
+                "path": path,
+                "url": url,
+            }
+        if content is not None:
+            self.put(path, content)
+
+    def latest_for(self, user_uuid):
+        return self.latest.get(user_uuid)
+
+    def put(self, path, content):
+        if path in self.memory:
+            self.memory_bytes -= len(self.memory.pop(path))
+        self.memory[path] = content
+        self.memory_bytes += len(content)
+        while self.memory_bytes > self.max_bytes and len(self.memory) > 1:
+            old_path, old_content = self.memory.popitem(last=False)
+            self.memory_bytes -= len(old_content)
+            self._spill(old_path, old_content)
+
+    def get(self, path):
+        """Frame bytes from memory or disk, or None if they are not cached locally."""
+        content = self.memory.get(path)
+        if content is not None:
+            self.memory.move_to_end(path)
+            self.hits += 1
+            return content
+
+        local_file = self.spilled.get(path)
+        if local_file is not None:
+            try:
+                with open(local_file, "rb") as f:
+                    content = f.read()
+                self.hits += 1
+                return content
+            except OSError:
+                del self.spilled[path]
+
+        self.misses += 1
+        return None
+
+    def _spill(self, path, content):
+        local_file = os.path.join(self.spill_dir, path.replace("/", "__"))
+        try:
+            with open(local_file, "wb") as f:
+                f.write(content)
+        except OSError as e:
+            print(f"Error spilling frame to disk: {e}")
+            return
+        self.spilled[path] = local_file
+        self.spilled.move_to_end(path)
+        while len(self.spilled) > self.max_files:
+            _, old_file = self.spilled.popitem(last=False)
+            try:
+                os.remove(old_file)
+            except OSError:
+                pass
+
+    def stats(self):
+        return {
+            "users": len(self.latest),
+            "memory_frames": len(self.memory),
+            "memory_bytes": self.memory_bytes,
+            "disk_frames": len(self.spilled),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+frame_store = FrameStore()
@@ -0,0 +1,197 @@
+import asyncio
+import json
+import struct
+from collections import deque
+from fastapi import WebSocket, WebSocketDisconnect
+from services.incident_jobs import incident_jobs
+from config import FRAME_STREAM_BUFFER, FRAME_STREAM_CONCURRENCY
+
+# Each binary message is: uint16 header length, header, JPEG bytes. The header
+# currently holds frame_number (uint32) and timestamp (float64, seconds), all
+# big-endian; readers skip header bytes they don't know so fields can be added.
+HEADER_LENGTH = struct.Struct("!H")
+FRAME_HEADER = struct.Struct("!Id")
+
+
+def pack_frame_message(frame_number, timestamp, data):
+    return HEADER_LENGTH.pack(FRAME_HEADER.size) + FRAME_HEADER.pack(frame_number, timestamp) + data
+
+
+def parse_frame_message(message):
+    """Split a binary frame message into (frame_number, timestamp, jpeg bytes); raises ValueError if malformed."""
+    if len(message) < HEADER_LENGTH.size:
+        raise ValueError("message shorter than its header length prefix")
+    (header_length,) = HEADER_LENGTH.unpack_from(message)
+    body_start = HEADER_LENGTH.size + header_length
+    if header_length < FRAME_HEADER.size or len(message) <= body_start:
+        raise ValueError("truncated frame header or empty image")
+    frame_number, timestamp = FRAME_HEADER.unpack_from(message, HEADER_LENGTH.size)
+    return frame_number, timestamp, message[body_start:]
+
+
+class FrameStream:
+    """
+    One WebSocket carrying a camera's frames in and its results out.
+
+    Frames wait in a small buffer and at most `concurrency` of them are in
+    detection at once. When detection falls behind and the buffer is full the
+    oldest waiting frame is dropped, since a newer frame of the same scene is
+    worth more than a stale one. Every frame gets exactly one reply ("result",
+    "dropped" or "error"), so a client can keep a fixed window of frames in
+    flight; the window is announced in the "ready" message. Incident jobs
+    started by a frame are reported with a "job" message once they finish.
+
+    A client that is done sends the text message {"type": "end"}: the server
+    stops reading, finishes every buffered and in-flight frame, sends their
+    replies and an "end" message, then closes the socket. Closing without it
+    abandons whatever is still waiting for detection.
+    """
+
+    def __init__(self, hub, websocket, user_uuid, user_email, process,
+                 buffer_size=FRAME_STREAM_BUFFER, concurrency=FRAME_STREAM_CONCURRENCY):
+        self.hub = hub
+        self.websocket = websocket
+        self.user_uuid = user_uuid
+        self.user_email = user_email
+        self.process = process
+        self.buffer_size = buffer_size
+        self.concurrency = concurrency
+        self.pending = deque()  # (frame_number, timestamp, data), oldest first
+        self.frame_ready = asyncio.Event()
+        self.outbox = asyncio.Queue()
+        self.tasks = set()
+        self.detecting = 0  # frames taken off the buffer whose reply isn't queued yet
+        self.idle = asyncio.Event()
+
+    async def run(self):
+        await self.websocket.accept()
+        workers = [asyncio.create_task(self._detect()) for _ in range(self.concurrency)]
+        sender = asyncio.create_task(self._send())
+        self.push({"type": "ready", "user_uuid": self.user_uuid,
+                   "max_in_flight": self.buffer_size + self.concurrency})
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes") is None:
+                    if self._is_end(message.get("text")):
+                        await self._finish(sender)
+                        break
+                    self.push({"type": "error", "frame": None, "error": "expected a binary frame or an end message"})
+                    continue
+                message = message["bytes"]
+                self.hub.received += 1
+                try:
+                    frame_number, timestamp, data = parse_frame_message(message)
+                except ValueError as e:
+                    self.push({"type": "error", "frame": None, "error": str(e)})
+                    continue
+                if len(self.pending) >= self.buffer_size:
+                    dropped = self.pending.popleft()
+                    self.hub.dropped += 1
+                    self.push({"type": "dropped", "frame": dropped[0], "reason": "detection behind"})
+                self.pending.append((frame_number, timestamp, data))
+                self.frame_ready.set()
+        except WebSocketDisconnect:
+            pass
+        except RuntimeError as e:
+            # The socket closed under us
+            print(f"Frame stream for {self.user_uuid} closed: {e}")
+        finally:
+            for task in workers + [sender] + list(self.tasks):
+                task.cancel()
+            await asyncio.gather(*workers, sender, *self.tasks, return_exceptions=True)
+
+    def push(self, message):
+        self.outbox.put_nowait(message)
+
+    @staticmethod
+    def _is_end(text):
+        try:
+            return json.loads(text).get("type") == "end"
+        except (TypeError, ValueError, AttributeError):
+            return False
+
+    async def _finish(self, sender):
+        """Drain the buffer and in-flight detections, send every reply and "end", then close."""
+        while self.pending or self.detecting:
+            self.idle.clear()
+            await self.idle.wait()
+        self.push({"type": "end", "jobs_running": len(self.tasks)})
+        # Stop waiting for the replies to go out if the sender died with the connection
+        flushed = asyncio.create_task(self.outbox.join())
+        await asyncio.wait([flushed, sender], return_when=asyncio.FIRST_COMPLETED)
+        flushed.cancel()
+        await self.websocket.close()
+
+    async def _send(self):
+        while True:
+            message = await self.outbox.get()
+            try:
+                await self.websocket.send_text(json.dumps(message))
+            finally:
+                self.outbox.task_done()
+
+    async def _detect(self):
+        while True:
+            while not self.pending:
+                self.frame_ready.clear()
+                await self.frame_ready.wait()
+            frame_number, timestamp, data = self.pending.popleft()
+            self.detecting += 1
+            try:
+                result = await self.process(frame_number, timestamp, self.user_uuid, self.user_email, data)
+            except Exception as e:
+                print(f"Error processing streamed frame {frame_number}: {e}")
+                self.push({"type": "error", "frame": frame_number, "error": str(e)})
+            else:
+                self.hub.processed += 1
+                self.push(dict(result, type="result"))
+                if result.get("job_id"):
+                    task = asyncio.create_task(self._report_job(result["job_id"]))
+                    self.tasks.add(task)
+                    task.add_done_callback(self.tasks.discard)
+            finally:
+                self.detecting -= 1
+                if not self.pending and not self.detecting:
+                    self.idle.set()
+
+    async def _report_job(self, job_id):
+        job = await incident_jobs.wait(job_id)
+        if job is not None:
+            self.push(dict(job, type="job"))
+
+
+class FrameStreamHub:
+    """Open frame streams, one per user_uuid; a new connection for a stream replaces the old one."""
+
+    def __init__(self):
+        self.streams = {}  # user_uuid -> FrameStream
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+
+    async def serve(self, websocket: WebSocket, user_uuid, user_email, process):
+        previous = self.streams.get(user_uuid)
+        if previous is not None:
+            await previous.websocket.close(code=4000, reason="replaced by a newer connection")
+
+        stream = self.streams[user_uuid] = FrameStream(self, websocket, user_uuid, user_email, process)
+        try:
+            await stream.run()
+        finally:
+            if self.streams.get(user_uuid) is stream:
+                del self.streams[user_uuid]
+
+    def stats(self):
+        return {
+            "open_streams": len(self.streams),
+            "buffered_frames": sum(len(stream.pending) for stream in self.streams.values()),
+            "frames_received": self.received,
+            "frames_processed": self.processed,
+            "frames_dropped": self.dropped,
+        }
+
+
+frame_streams = FrameStreamHub()
@@ -0,0 +1,152 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from config import (INCIDENT_WORKERS, INCIDENT_QUEUE_SIZE, INCIDENT_STAGE_RETRIES,
+                    INCIDENT_RETRY_DELAY, INCIDENT_JOB_HISTORY)
+
+
+class IncidentJobQueue:
+    """
+    Bounded in-process job queue with a fixed pool of asyncio workers.
+
+    Jobs are submitted with a handler coroutine function which receives the job
+    record and runs its stages through run_stage, so each stage gets its own
+    retries and status. Finished jobs are kept (up to job_history of them) so
+    clients can poll their progress.
+    """
+
+    def __init__(self, workers=INCIDENT_WORKERS, max_queue=INCIDENT_QUEUE_SIZE,
+                 stage_retries=INCIDENT_STAGE_RETRIES, retry_delay=INCIDENT_RETRY_DELAY,
+                 job_history=INCIDENT_JOB_HISTORY):
+        self.worker_count = workers
+        self.max_queue = max_queue
+        self.stage_retries = stage_retries
+        self.retry_delay = retry_delay
+        self.job_history = job_history
+        self.queue = None
+        self.workers = []
+        self.jobs = OrderedDict()  # job_id -> job record
+        self.waiters = {}  # job_id -> futures resolved when the job finishes
+        self.rejected = 0
+
+    def start(self):
+        """Create the queue and worker tasks on the running event loop."""
+        if self.workers:
+            return
+        self.queue = asyncio.Queue(maxsize=self.max_queue)
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+        print(f"Incident job queue started with {self.worker_count} workers")
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    def submit(self, handler, payload):
+        """
+        Queue a job and return its record, or None if the queue is full.
+        Callers should treat None as backpressure and degrade accordingly.
+        """
+        if self.queue is None or self.queue.full():
+            self.rejected += 1
+            return None
+
+        now = time.time()
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "status": "queued",
+            "created_at": now,
+            "updated_at": now,
+            "stages": {},
+            "result": {},
+            "payload": payload,
+        }
+        self.jobs[job["job_id"]] = job
+        self._trim_history()
+        self.queue.put_nowait((handler, job))
+        return job
+
+    def get(self, job_id):
+        """Return the public view of a job, or None if unknown."""
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        return {key: value for key, value in job.items() if key != "payload"}
+
+    async def wait(self, job_id):
+        """Wait until a job has finished and return its public view, or None if unknown."""
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        if job["status"] in ("queued", "running"):
+            future = asyncio.get_running_loop().create_future()
+            self.waiters.setdefault(job_id, []).append(future)
+            await future
+        return self.get(job_id)
+
+    def depth(self):
+        return self.queue.qsize() if self.queue is not None else 0
+
+    async def run_stage(self, job, name, stage):
+        """
+        Run one stage of a job with retries.
+        `stage` is a zero-argument coroutine function; an exception counts as failure.
+        Returns the stage's result, or None once every attempt has failed.
+        """
+        record = job["stages"][name] = {"status": "running", "attempts": 0, "error": None}
+        job["updated_at"] = time.time()
+
+        for attempt in range(1, self.stage_retries + 2):
+            record["attempts"] = attempt
+            try:
+                result = await stage()
+                record["status"] = "completed"
+                record["error"] = None
+                job["updated_at"] = time.time()
+                return result
+            except Exception as e:
+                record["error"] = str(e)
+                print(f"Job {job['job_id']} stage {name} attempt {attempt} failed: {e}")
+                if attempt <= self.stage_retries:
+                    await asyncio.sleep(self.retry_delay * attempt)
+
+        record["status"] = "failed"
+        job["updated_at"] = time.time()
+        return None
+
+    def skip_stage(self, job, name, reason):
+        job["stages"][name] = {"status": "skipped", "attempts": 0, "error": reason}
+
+    async def _worker(self):
+        while True:
+            handler, job = await self.queue.get()
+            job["status"] = "running"
+            job["updated_at"] = time.time()
+            try:
+                await handler(job)
+                failed = any(stage["status"] == "failed" for stage in job["stages"].values())
+                job["status"] = "failed" if failed else "completed"
+            except Exception as e:
+                print(f"Job {job['job_id']} failed: {e}")
+                job["status"] = "failed"
+                job["result"]["error"] = str(e)
+            finally:
+                # Drop the frame bytes once the job is done; only the status is kept
+                job["payload"] = None
+                job["updated_at"] = time.time()
+                for future in self.waiters.pop(job["job_id"], []):
+                    if not future.done():
+                        future.set_result(None)
+                self.queue.task_done()
+
+    def _trim_history(self):
+        while len(self.jobs) > self.job_history:
+            oldest_id, oldest = next(iter(self.jobs.items()))
+            if oldest["status"] in ("queued", "running"):
+                break
+            del self.jobs[oldest_id]
+
+
+incident_jobs = IncidentJobQueue()
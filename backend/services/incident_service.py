@@ -0,0 +1,125 @@
+import time
+import uuid
+from collections import OrderedDict
+from config import (INCIDENT_WINDOW, INCIDENT_MIN_HITS, INCIDENT_FRAME_THRESHOLD,
+                    INCIDENT_EMA_ALPHA, INCIDENT_CLOSE_EMA, INCIDENT_IDLE_TIMEOUT)
+
+
+class StreamState:
+    """Compact per-stream detection state; the frame window is stored as a bitmask."""
+    __slots__ = ("bits", "hits", "ema", "incident_id", "opened_at", "last_seen", "peak", "escalated")
+
+    def __init__(self, now):
+        self.bits = 0
+        self.hits = 0
+        self.ema = 0.0
+        self.incident_id = None
+        self.opened_at = None
+        self.last_seen = now
+        self.peak = 0.0
+        self.escalated = False
+
+
+class IncidentTracker:
+    """
+    Per-stream incident engine.
+
+    Every frame updates a sliding k-of-n window of over-threshold frames and an
+    exponential moving average of confidence in O(1). An incident opens when at
+    least min_hits of the last `window` frames are over threshold, and closes
+    once the window is clear and the EMA has decayed below close_ema. Escalation
+    (Gemini analysis / emergency call) is requested exactly once per incident.
+    Streams that go quiet for idle_timeout seconds are dropped.
+    """
+
+    def __init__(self, window=INCIDENT_WINDOW, min_hits=INCIDENT_MIN_HITS,
+                 threshold=INCIDENT_FRAME_THRESHOLD, alpha=INCIDENT_EMA_ALPHA,
+                 close_ema=INCIDENT_CLOSE_EMA, idle_timeout=INCIDENT_IDLE_TIMEOUT):
+        self.window = window
+        self.mask = (1 << window) - 1
+        self.min_hits = min_hits
+        self.threshold = threshold
+        self.alpha = alpha
+        self.close_ema = close_ema
+        self.idle_timeout = idle_timeout
+        self.streams = OrderedDict()  # stream_id -> StreamState, least recently seen first
+
+    def update(self, stream_id, confidence, now=None):
+        """
+        Record one frame's confidence for a stream.
+        Returns a dict with the incident_id (if any), the event that happened
+        ("opened", "updated", "closed" or None) and whether to escalate.
+        """
+        now = time.time() if now is None else now
+        self._evict_idle(now)
+
+        state = self.streams.get(stream_id)
+        if state is None:
+            state = self.streams[stream_id] = StreamState(now)
+        else:
+            self.streams.move_to_end(stream_id)
+        state.last_seen = now
+
+        hit = 1 if confidence >= self.threshold else 0
+        outgoing = (state.bits >> (self.window - 1)) & 1
+        state.bits = ((state.bits << 1) | hit) & self.mask
+        state.hits += hit - outgoing
+        state.ema = self.alpha * confidence + (1 - self.alpha) * state.ema
+
+        event = None
+        escalate = False
+        incident_id = state.incident_id
+
+        if incident_id is None:
+            if state.hits >= self.min_hits:
+                incident_id = state.incident_id = uuid.uuid4().hex
+                state.opened_at = now
+                state.peak = confidence
+                state.escalated = False
+                event = "opened"
+        elif state.hits == 0 and state.ema < self.close_ema:
+            state.incident_id = None
+            state.opened_at = None
+            event = "closed"
+        else:
+            state.peak = max(state.peak, confidence)
+            event = "updated"
+
+        if state.incident_id is not None and not state.escalated and hit:
+            state.escalated = True
+            escalate = True
+
+        return {"incident_id": incident_id, "event": event, "escalate": escalate}
+
+    def release_escalation(self, stream_id, incident_id):
+        """Allow a later frame to escalate again, e.g. when the escalation job was rejected."""
+        state = self.streams.get(stream_id)
+        if state is not None and state.incident_id == incident_id:
+            state.escalated = False
+
+    def get(self, stream_id):
+        """Return a snapshot of a stream's state, or None if it is not tracked."""
+        state = self.streams.get(stream_id)
+        if state is None:
+            return None
+        return {
+            "incident_id": state.incident_id,
+            "incident_open": state.incident_id is not None,
+            "opened_at": state.opened_at,
+            "last_seen": state.last_seen,
+            "recent_hits": state.hits,
+            "window": self.window,
+            "confidence_ema": state.ema,
+            "peak_confidence": state.peak,
+        }
+
+    def _evict_idle(self, now):
+        # Streams are kept in last-seen order, so only the head ever needs checking
+        while self.streams:
+            stream_id, state = next(iter(self.streams.items()))
+            if now - state.last_seen <= self.idle_timeout:
+                break
+            del self.streams[stream_id]
+
+
+incident_tracker = IncidentTracker()
@@ -0,0 +1,128 @@
+import asyncio
+from mailjet_rest import Client
+from config import (MAILJET_API_KEY, MAILJET_SECRET_KEY, MAILJET_API_URL, MAILJET_BATCH_WINDOW,
+                    MAILJET_BATCH_SIZE, MAILJET_MAX_RETRIES, MAILJET_RETRY_BACKOFF)
+from services.clients import clients
+
+# Mailjet client is created once and shared through the client registry
+clients.register("mailjet", lambda: Client(auth=(MAILJET_API_KEY, MAILJET_SECRET_KEY), version='v3.1',
+                                            api_url=MAILJET_API_URL))
+
+# HTTP statuses worth retrying; anything else is a final answer from Mailjet
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class MailOutbox:
+    """
+    Asynchronous, batching sender for Mailjet v3.1.
+
+    Messages queued with send() are collected for up to `window` seconds (or
+    until `batch_size` are waiting) and sent together in one `Messages` call
+    off the event loop. Transient failures are retried with exponential
+    backoff. Each caller gets back whether its own message was accepted.
+    """
+
+    def __init__(self, window=MAILJET_BATCH_WINDOW, batch_size=MAILJET_BATCH_SIZE,
+                 max_retries=MAILJET_MAX_RETRIES, retry_backoff=MAILJET_RETRY_BACKOFF):
+        self.window = window
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.queue = None
+        self.task = None
+        self.batches_sent = 0
+        self.messages_sent = 0
+        self.messages_failed = 0
+
+    def start(self):
+        if self.task is None:
+            self.queue = asyncio.Queue()
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop accepting mail after sending whatever is already queued."""
+        if self.task is None:
+            return
+        await self.queue.join()
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        self.task = None
+
+    async def send(self, message):
+        """Queue one Mailjet message dict and wait until its batch has been sent."""
+        if self.task is None:
+            # Outbox not running (e.g. standalone use); send on its own
+            return (await self._send_batch([message]))[0]
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((message, future))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            deadline = asyncio.get_running_loop().time() + self.window
+            while len(batch) < self.batch_size:
+                remaining = deadline - asyncio.get_running_loop().time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                results = await self._send_batch([message for message, _ in batch])
+            except Exception as e:
+                print(f"Error sending email batch: {e}")
+                results = [False] * len(batch)
+
+            for (_, future), sent in zip(batch, results):
+                if not future.done():
+                    future.set_result(sent)
+                self.queue.task_done()
+
+    async def _send_batch(self, messages):
+        """Send messages in one Mailjet call, retrying transient failures. Returns one bool per message."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                with clients.track("mailjet"):
+                    result = await asyncio.to_thread(clients.get("mailjet").send.create, data={"Messages": messages})
+            except Exception as e:
+                print(f"Mailjet request failed (attempt {attempt + 1}): {e}")
+                status = None
+            else:
+                status = result.status_code
+                if status not in RETRYABLE_STATUSES:
+                    return self._message_results(result, len(messages))
+                print(f"Mailjet returned {status} (attempt {attempt + 1})")
+
+            if attempt < self.max_retries:
+                await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+
+        self.messages_failed += len(messages)
+        return [False] * len(messages)
+
+    def _message_results(self, result, count):
+        self.batches_sent += 1
+        try:
+            statuses = [m.get("Status") == "success" for m in result.json().get("Messages", [])]
+        except Exception:
+            statuses = []
+        if len(statuses) != count:
+            statuses = [result.status_code == 200] * count
+        if not all(statuses):
+            print(f"Failed to send {count - sum(statuses)} of {count} emails: {result.status_code}")
+        self.messages_sent += sum(statuses)
+        self.messages_failed += count - sum(statuses)
+        return statuses
+
+    def stats(self):
+        return {
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "batches_sent": self.batches_sent,
+            "messages_sent": self.messages_sent,
+            "messages_failed": self.messages_failed,
+        }
+
+
+mail_outbox = MailOutbox()
@@ -0,0 +1,144 @@
+import functools
+import inspect
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds in seconds, from local work up to slow third-party calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """
+    In-process counters, gauges and latency histograms rendered in the
+    Prometheus text format.
+
+    Recording a stage costs two perf_counter() calls, a bisect and a few integer
+    updates, so it is safe on the per-frame path. Gauges for queue depths are
+    read from callbacks at scrape time rather than updated as items move.
+    """
+
+    def __init__(self):
+        self.latency = {}  # stage -> Histogram
+        self.errors = {}  # stage -> count
+        self.in_flight = {}  # stage -> count
+        self.counters = {}  # metric name -> (help, label name, {label value -> count})
+        self.gauges = {}  # metric name -> (help, label name, callback returning {label value -> value})
+
+    @contextmanager
+    def time(self, stage):
+        """Record the latency of the wrapped block under `stage`; exceptions count as errors."""
+        histogram = self._histogram(stage)
+        self.in_flight[stage] = self.in_flight.get(stage, 0) + 1
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.error(stage)
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - started)
+            self.in_flight[stage] -= 1
+
+    def observe(self, stage, seconds):
+        """Record a latency measured by the caller."""
+        self._histogram(stage).observe(seconds)
+
+    def _histogram(self, stage):
+        histogram = self.latency.get(stage)
+        if histogram is None:
+            histogram = self.latency[stage] = Histogram()
+        return histogram
+
+    def instrument(self, stage):
+        """Decorator timing every call of a function (sync or async) under `stage`."""
+        def decorator(fn):
+            if inspect.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def wrapper(*args, **kwargs):
+                    with self.time(stage):
+                        return await fn(*args, **kwargs)
+            else:
+                @functools.wraps(fn)
+                def wrapper(*args, **kwargs):
+                    with self.time(stage):
+                        return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def error(self, stage):
+        """Count a failure of `stage` that was handled without raising."""
+        self.errors[stage] = self.errors.get(stage, 0) + 1
+
+    def counter(self, name, help_text, label):
+        self.counters[name] = (help_text, label, {})
+
+    def inc(self, name, label_value, amount=1):
+        values = self.counters[name][2]
+        values[label_value] = values.get(label_value, 0) + amount
+
+    def gauge(self, name, help_text, label, callback):
+        self.gauges[name] = (help_text, label, callback)
+
+    def render(self):
+        lines = [
+            "# HELP firewatch_stage_duration_seconds Latency of each processing stage and third-party call.",
+            "# TYPE firewatch_stage_duration_seconds histogram",
+        ]
+        for stage, histogram in list(self.latency.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), histogram.counts):
+                cumulative += count
+                lines.append(f'firewatch_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'firewatch_stage_duration_seconds_sum{{stage="{stage}"}} {histogram.sum}')
+            lines.append(f'firewatch_stage_duration_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+        lines += self._family("firewatch_stage_errors_total", "Failures of each stage, raised or handled.",
+                              "counter", "stage", self.errors)
+        lines += self._family("firewatch_stage_in_flight", "Calls of each stage currently running.",
+                              "gauge", "stage", self.in_flight)
+        for name, (help_text, label, values) in list(self.counters.items()):
+            lines += self._family(name, help_text, "counter", label, values)
+        for name, (help_text, label, callback) in list(self.gauges.items()):
+            try:
+                values = callback()
+            except Exception as e:
+                print(f"Error reading gauge {name}: {e}")
+                continue
+            lines += self._family(name, help_text, "gauge", label, values)
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _family(name, help_text, kind, label, values):
+        lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        lines += [f'{name}{{{label}="{key}"}} {value}' for key, value in list(values.items())]
+        return lines
+
+
+class RequestStartMiddleware:
+    """ASGI middleware stamping each HTTP request's arrival time into request.state.received_at."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            scope.setdefault("state", {})["received_at"] = time.perf_counter()
+        await self.app(scope, receive, send)
+
+
+metrics = Metrics()
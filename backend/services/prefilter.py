@@ -0,0 +1,54 @@
+import numpy as np
+from services.preprocessing import PreparedFrame
+
+# Weights applied to the fraction of flame- and smoke-coloured pixels. A frame
+# with ~5% flame pixels already scores 1.0; grey smoke is much weaker evidence
+# on its own since walls and overcast sky look the same.
+FLAME_WEIGHT = 20.0
+SMOKE_WEIGHT = 0.1
+BRIGHT_WEIGHT = 1.0
+
+
+def fire_pixel_score(rgb):
+    """
+    Score an RGB array between 0 and 1 by how much of it looks like flame or smoke.
+
+    Flame pixels are bright and red-dominant (R > G > B with a wide R-B gap).
+    Smoke pixels are unsaturated mid-grey. Very bright pixels add a little
+    extra weight when they appear next to flame colour.
+    """
+    rgb = rgb.astype(np.int16)
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+
+    flame = (r > 180) & (r > g) & (g > b) & ((r - b) > 60)
+
+    max_c = rgb.max(axis=-1)
+    min_c = rgb.min(axis=-1)
+    smoke = ((max_c - min_c) < 20) & (max_c > 80) & (max_c < 220)
+
+    bright = (r > 230) & (g > 200)
+
+    flame_ratio = flame.mean()
+    smoke_ratio = smoke.mean()
+    bright_ratio = bright.mean() if flame_ratio > 0 else 0.0
+
+    score = FLAME_WEIGHT * flame_ratio + SMOKE_WEIGHT * smoke_ratio + BRIGHT_WEIGHT * bright_ratio
+    return float(min(1.0, score))
+
+
+def prefilter_score(frame):
+    """Return the local fire-pixel score (0-1) for a frame (JPEG bytes or PreparedFrame)."""
+    return fire_pixel_score(PreparedFrame.wrap(frame).thumbnail)
+
+
+def estimate_fire(frame, threshold=0.5):
+    """
+    Local stand-in for the remote detector.
+    Returns a tuple of (fire_detected, confidence_score).
+    """
+    try:
+        score = prefilter_score(frame)
+    except Exception as e:
+        print(f"Error estimating fire locally: {e}")
+        return False, 0.0
+    return score >= threshold, score
@@ -0,0 +1,110 @@
+import io
+import math
+from functools import cached_property
+import cv2
+import numpy as np
+from PIL import Image
+from config import PREFILTER_SIZE, DETECTOR_INPUT_SIZE, LLM_INPUT_SIZE, PREPROCESS_JPEG_QUALITY
+
+
+class PreparedFrame:
+    """
+    One uploaded JPEG frame with its decoded form and derived variants cached.
+
+    Consumers read cached properties instead of decoding the bytes themselves.
+    The prefilter thumbnail and the perceptual-hash image share one small
+    draft-mode decode (~1/8 scale), so a benign frame never pays for more. The
+    detector and LLM JPEGs share one larger decode, made only when one of them
+    is first needed. The original bytes stay available unchanged in `data` for
+    storage and emails.
+    """
+
+    def __init__(self, data):
+        self.data = data
+
+    @classmethod
+    def wrap(cls, image):
+        """Return `image` as a PreparedFrame, accepting either raw bytes or an existing frame."""
+        return image if isinstance(image, cls) else cls(image)
+
+    @cached_property
+    def original_size(self):
+        """(width, height) of the uploaded frame, read from the JPEG header."""
+        return Image.open(io.BytesIO(self.data)).size
+
+    def _decode(self, size):
+        image = Image.open(io.BytesIO(self.data))
+        width, height = image.size
+        # Draft mode lets the JPEG decoder skip detail (1/2 to 1/8 scale) as long as both
+        # requested sides fit, so ask for the box the longest side actually scales to
+        ratio = size / max(width, height)
+        if ratio < 1:
+            image.draft("RGB", (math.ceil(width * ratio), math.ceil(height * ratio)))
+        return image.convert("RGB")
+
+    @cached_property
+    def image(self):
+        """
+        BGR array decoded at the smallest JPEG scale covering the largest model input.
+        OpenCV decodes straight into the array its resize and encoder work on.
+        """
+        longest = max(self.original_size)
+        size = max(DETECTOR_INPUT_SIZE, LLM_INPUT_SIZE)
+        flags = cv2.IMREAD_COLOR
+        for factor, reduced in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                                (2, cv2.IMREAD_REDUCED_COLOR_2)):
+            if longest / factor >= size:
+                flags = reduced
+                break
+        # Match the Pillow decodes, which don't apply EXIF rotation
+        image = cv2.imdecode(np.frombuffer(self.data, np.uint8), flags | cv2.IMREAD_IGNORE_ORIENTATION)
+        if image is None:
+            raise ValueError("Frame is not a decodable JPEG")
+        return image
+
+    @cached_property
+    def thumbnail_image(self):
+        """Small RGB image for the prefilter and perceptual hash."""
+        if "image" in self.__dict__:
+            # A model variant already needed the larger decode; shrinking it is cheaper than decoding again
+            return Image.fromarray(cv2.cvtColor(self._resize(PREFILTER_SIZE), cv2.COLOR_BGR2RGB))
+        thumbnail = self._decode(PREFILTER_SIZE)
+        thumbnail.thumbnail((PREFILTER_SIZE, PREFILTER_SIZE), Image.BILINEAR)
+        return thumbnail
+
+    @cached_property
+    def thumbnail(self):
+        """Small RGB array for the fire-pixel prefilter."""
+        return np.asarray(self.thumbnail_image)
+
+    @cached_property
+    def detector_jpeg(self):
+        """JPEG sized for the detector's native input."""
+        return self._encode(DETECTOR_INPUT_SIZE)
+
+    @cached_property
+    def llm_jpeg(self):
+        """JPEG sized for the LLM's native image input."""
+        return self._encode(LLM_INPUT_SIZE)
+
+    def _resize(self, size):
+        image = self.image
+        height, width = image.shape[:2]
+        scale = size / max(width, height)
+        if scale >= 1:
+            return image
+        # Area averaging for big reductions (the thumbnail), where it is cheap and avoids
+        # aliasing; the model sizes are within 2x of the decode, where bilinear is enough
+        # and several times faster
+        interpolation = cv2.INTER_AREA if scale <= 0.5 else cv2.INTER_LINEAR
+        return cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))),
+                          interpolation=interpolation)
+
+    def _encode(self, size):
+        if max(self.original_size) <= size:
+            # Already small enough; re-encoding would only cost CPU and quality
+            return self.data
+        ok, encoded = cv2.imencode(".jpg", self._resize(size), [cv2.IMWRITE_JPEG_QUALITY, PREPROCESS_JPEG_QUALITY])
+        if not ok:
+            raise ValueError("Could not encode the downscaled frame")
+        return encoded.tobytes()
@@ -0,0 +1,217 @@
+import asyncio
+import contextvars
+import time
+from contextlib import contextmanager
+from config import BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT
+
+# Absolute time.perf_counter() deadline of the request being served, if it set a budget
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit breaker is open."""
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """Raised when the request's budget ran out before a call could be made."""
+
+
+@contextmanager
+def budget(seconds, since=None):
+    """
+    Give everything inside the block `seconds` in total for external calls,
+    counted from `since` (a perf_counter() time such as request.state.received_at)
+    or from now. A nested budget can only shorten the enclosing one. Tasks
+    created inside the block inherit it, background queues that outlive the
+    request do not.
+    """
+    deadline = (time.perf_counter() if since is None else since) + seconds
+    current = _deadline.get()
+    if current is not None:
+        deadline = min(deadline, current)
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining(timeout):
+    """Timeout for the next call: `timeout`, shortened to what is left of the request's budget."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return timeout
+    return max(0.0, min(timeout, deadline - time.perf_counter()))
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for one provider.
+
+    After failure_threshold failures in a row the circuit opens and calls fail
+    immediately for reset_timeout seconds. Then a single probe call is let
+    through (half-open): success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.rejected = 0
+        self.opened = 0
+
+    def allow(self):
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+            self.probing = False
+        if self.state == "closed":
+            return True
+        if self.state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.opened += 1
+                print(f"Circuit breaker for {self.name} opened after {self.failures} failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "times_opened": self.opened,
+            "rejected_calls": self.rejected,
+        }
+
+
+class Resilience:
+    """
+    Shared guard for calls to external providers: deadline, circuit breaker and optional hedging.
+
+    Callers keep their own local fallbacks: guard() raises CircuitOpenError,
+    DeadlineExceeded, asyncio.TimeoutError or the call's own exception, and the
+    service's existing except branch answers locally.
+    """
+
+    def __init__(self):
+        self.breakers = {}  # provider -> CircuitBreaker
+        self.hedges = {}  # provider -> {"sent", "won", "skipped"}
+
+    def breaker(self, provider):
+        breaker = self.breakers.get(provider)
+        if breaker is None:
+            breaker = self.breakers[provider] = CircuitBreaker(provider)
+        return breaker
+
+    async def guard(self, provider, attempt, timeout, hedge_after=None, discard=None, hedge_slot=None):
+        """
+        Run `attempt` (a zero-argument coroutine function) for `provider`.
+
+        The call gets `timeout` seconds, or less if the request's budget is
+        nearly spent. With `hedge_after`, a duplicate attempt starts if the first
+        hasn't finished after that many seconds, and whichever succeeds first
+        wins; `discard` is called with the result of a late finisher (e.g. to
+        close a stream). If the caller caps concurrency with a semaphore, pass it
+        as `hedge_slot`: the duplicate then takes a slot of its own, and is
+        skipped when none is free. Failures and timeouts count against the breaker;
+        running out of budget does not, since it says nothing about the provider,
+        and neither does a timeout that only fired early because the budget had
+        less than `timeout` left (it is raised as DeadlineExceeded).
+        """
+        breaker = self.breaker(provider)
+        if not breaker.allow():
+            raise CircuitOpenError(f"{provider} circuit is open")
+
+        seconds = remaining(timeout)
+        if seconds <= 0:
+            breaker.probing = False
+            raise DeadlineExceeded(f"No time left in the request budget to call {provider}")
+
+        try:
+            if hedge_after and hedge_after < seconds:
+                result = await asyncio.wait_for(self._hedged(provider, attempt, hedge_after, discard, hedge_slot), seconds)
+            else:
+                result = await asyncio.wait_for(attempt(), seconds)
+        except asyncio.CancelledError:
+            breaker.probing = False
+            raise
+        except asyncio.TimeoutError:
+            if seconds < timeout:
+                breaker.probing = False
+                raise DeadlineExceeded(f"Request budget ran out after {seconds:.2f}s calling {provider}")
+            breaker.record_failure()
+            raise
+        except Exception:
+            breaker.record_failure()
+            raise
+        breaker.record_success()
+        return result
+
+    async def _hedged(self, provider, attempt, hedge_after, discard, hedge_slot):
+        counters = self.hedges.setdefault(provider, {"sent": 0, "won": 0, "skipped": 0})
+        attempts = [asyncio.create_task(attempt())]
+        winner = None
+        try:
+            done, _ = await asyncio.wait(attempts, timeout=hedge_after)
+            if not done and hedge_slot is not None and hedge_slot.locked():
+                # Every slot is busy; queueing a duplicate would only delay other callers
+                counters["skipped"] += 1
+            elif not done:
+                counters["sent"] += 1
+                if hedge_slot is not None:
+                    await hedge_slot.acquire()  # A slot is free, so this doesn't wait
+                hedge = asyncio.create_task(attempt())
+                if hedge_slot is not None:
+                    # Released however the hedge ends, even if it is cancelled before it starts
+                    hedge.add_done_callback(lambda _: hedge_slot.release())
+                attempts.append(hedge)
+            pending = set(attempts)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                succeeded = [task for task in done if task.exception() is None]
+                if succeeded:
+                    winner = succeeded[0]
+                    if winner is not attempts[0]:
+                        counters["won"] += 1
+                    return winner.result()
+            # Every attempt failed; report the original one
+            raise attempts[0].exception()
+        finally:
+            for task in attempts:
+                if task is winner:
+                    continue
+                task.cancel()
+                if discard is not None:
+                    task.add_done_callback(self._discard_callback(discard))
+
+    @staticmethod
+    def _discard_callback(discard):
+        def callback(task):
+            if not task.cancelled() and task.exception() is None:
+                discard(task.result())
+        return callback
+
+    def stats(self):
+        return {
+            provider: dict(breaker.stats(), hedges=self.hedges.get(provider, {"sent": 0, "won": 0, "skipped": 0}))
+            for provider, breaker in self.breakers.items()
+        }
+
+
+resilience = Resilience()
@@ -0,0 +1,97 @@
+import time
+from collections import OrderedDict
+from config import (SAMPLING_MIN_INTERVAL, SAMPLING_BASE_INTERVAL, SAMPLING_MAX_INTERVAL, SAMPLING_BACKOFF,
+                    SAMPLING_QUIET_PERIOD, SAMPLING_HOT_CONFIDENCE, SAMPLING_CLEAN_CONFIDENCE,
+                    SAMPLING_RISE_DELTA, SAMPLING_EMA_ALPHA, INCIDENT_IDLE_TIMEOUT)
+
+
+class SamplingState:
+    __slots__ = ("interval", "ema", "calm_since", "last_seen")
+
+    def __init__(self, interval, timestamp, now):
+        self.interval = interval
+        self.ema = 0.0
+        self.calm_since = timestamp
+        self.last_seen = now
+
+
+class SamplingController:
+    """
+    Per-stream recommendation of how many seconds to wait before sending the next frame.
+
+    Streams start at the base interval. Anything suspicious (an open incident,
+    a confident frame, or confidence rising quickly) drops straight to the
+    minimum interval. Clean frames back off geometrically, up to the base
+    interval at first and towards the maximum once the stream has been clean
+    for quiet_period seconds. Time is measured on the frames' own timestamps,
+    so recorded video played faster than real time backs off per second of
+    footage rather than per second of wall clock.
+    """
+
+    def __init__(self, min_interval=SAMPLING_MIN_INTERVAL, base_interval=SAMPLING_BASE_INTERVAL,
+                 max_interval=SAMPLING_MAX_INTERVAL, backoff=SAMPLING_BACKOFF,
+                 quiet_period=SAMPLING_QUIET_PERIOD, hot_confidence=SAMPLING_HOT_CONFIDENCE,
+                 clean_confidence=SAMPLING_CLEAN_CONFIDENCE, rise_delta=SAMPLING_RISE_DELTA,
+                 alpha=SAMPLING_EMA_ALPHA, idle_timeout=INCIDENT_IDLE_TIMEOUT):
+        self.min_interval = min_interval
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.quiet_period = quiet_period
+        self.hot_confidence = hot_confidence
+        self.clean_confidence = clean_confidence
+        self.rise_delta = rise_delta
+        self.alpha = alpha
+        self.idle_timeout = idle_timeout
+        self.streams = OrderedDict()  # stream_id -> SamplingState, least recently seen first
+
+    def update(self, stream_id, confidence, timestamp, incident_open, now=None):
+        """Record one frame's confidence and return the recommended interval (seconds) until the next frame."""
+        now = time.time() if now is None else now
+        self._evict_idle(now)
+
+        state = self.streams.get(stream_id)
+        if state is None:
+            state = self.streams[stream_id] = SamplingState(self.base_interval, timestamp, now)
+        else:
+            self.streams.move_to_end(stream_id)
+        state.last_seen = now
+
+        previous_ema = state.ema
+        state.ema = self.alpha * confidence + (1 - self.alpha) * state.ema
+        rising = state.ema - previous_ema >= self.rise_delta
+
+        if incident_open or confidence >= self.hot_confidence or rising:
+            state.interval = self.min_interval
+            state.calm_since = timestamp
+        elif confidence >= self.clean_confidence:
+            state.interval = min(state.interval, self.base_interval)
+            state.calm_since = timestamp
+        else:
+            if timestamp < state.calm_since:
+                # Timestamps went backwards (client restarted or a new video); measure calm from here
+                state.calm_since = timestamp
+            # Clean frames relax back to the base interval, and beyond it once the scene has been quiet a while
+            quiet = timestamp - state.calm_since >= self.quiet_period
+            state.interval = min(self.max_interval if quiet else self.base_interval, state.interval * self.backoff)
+        return state.interval
+
+    def stats(self):
+        intervals = [state.interval for state in list(self.streams.values())]
+        return {
+            "streams": len(intervals),
+            "dense": sum(1 for interval in intervals if interval < self.base_interval),
+            "base": sum(1 for interval in intervals if interval == self.base_interval),
+            "sparse": sum(1 for interval in intervals if interval > self.base_interval),
+            "mean_interval": sum(intervals) / len(intervals) if intervals else None,
+        }
+
+    def _evict_idle(self, now):
+        while self.streams:
+            stream_id, state = next(iter(self.streams.items()))
+            if now - state.last_seen <= self.idle_timeout:
+                break
+            del self.streams[stream_id]
+
+
+sampling_controller = SamplingController()
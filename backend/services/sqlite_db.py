@@ -0,0 +1,15 @@
+import sqlite3
+
+
+def connect(path):
+    """
+    Open a SQLite database for sharing between worker processes.
+
+    WAL mode lets readers proceed while another process writes, and the busy
+    timeout makes a writer wait for the lock instead of failing. Statements run
+    in autocommit mode unless a transaction is opened explicitly.
+    """
+    conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
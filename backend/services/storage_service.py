@@ -1,68 +1,123 @@
-import supabase
-import os
-from config import SUPABASE_URL, SUPABASE_KEY
+import asyncio
+import httpx
+from config import (SUPABASE_URL, SUPABASE_KEY, SUPABASE_BUCKET, SUPABASE_TIMEOUT,
+                    SUPABASE_MAX_RETRIES, SUPABASE_MAX_CONNECTIONS)
+from services.clients import clients
+from services.metrics import metrics
+from services.resilience import resilience
+from services.frame_store import frame_store, frame_number_from_name
 
-# Initialize Supabase client
-supabase_client = supabase.create_client(SUPABASE_URL, SUPABASE_KEY)
+# Supabase Storage REST endpoints, called directly over one pooled async HTTP client
+STORAGE_URL = f"{SUPABASE_URL}/storage/v1"
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RETRY_BACKOFF = 0.2  # seconds before the first retry, doubling after each one
 
-async def upload_fire_image(user_uuid, frame_number, file_content):
-    """Upload a fire image to Supabase storage."""
+# Long enough for _request to use all of its attempts and the backoff between them
+UPLOAD_TIMEOUT = SUPABASE_TIMEOUT * (SUPABASE_MAX_RETRIES + 1) + RETRY_BACKOFF * (2 ** SUPABASE_MAX_RETRIES - 1)
+
+
+def _create_storage_client():
+    return httpx.AsyncClient(
+        headers={"Authorization": f"Bearer {SUPABASE_KEY}", "apikey": SUPABASE_KEY},
+        timeout=httpx.Timeout(SUPABASE_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=SUPABASE_MAX_CONNECTIONS,
+            max_keepalive_connections=SUPABASE_MAX_CONNECTIONS
+        )
+    )
+
+
+async def _warm_storage_client(client):
+    await client.get(f"{STORAGE_URL}/bucket/{SUPABASE_BUCKET}")
+
+
+clients.register("supabase_storage", _create_storage_client, warmup=_warm_storage_client)
+
+
+def get_public_url(path):
+    """Public URL of an object in the bucket (computed locally, no API call)."""
+    return f"{STORAGE_URL}/object/public/{SUPABASE_BUCKET}/{path}"
+
+
+async def _request(method, url, **kwargs):
+    """Make a storage request, retrying connection errors and transient statuses with backoff."""
+    for attempt in range(SUPABASE_MAX_RETRIES + 1):
+        try:
+            with clients.track("supabase_storage"):
+                response = await clients.get("supabase_storage").request(method, url, **kwargs)
+            if response.status_code not in RETRYABLE_STATUSES or attempt == SUPABASE_MAX_RETRIES:
+                response.raise_for_status()
+                return response
+        except httpx.TransportError:
+            if attempt == SUPABASE_MAX_RETRIES:
+                raise
+        await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+
+
+@metrics.instrument("upload_fire_image")
+async def upload_fire_image(user_uuid, frame_number, file_content, timestamp=None):
+    """Upload a fire image to Supabase storage and record it as the user's latest frame."""
     try:
         supabase_filename = f"{user_uuid}/{user_uuid}_fire_frame_{frame_number}.jpg"
-        
-        upload_result = supabase_client.storage.from_("fireimages").upload(
-            supabase_filename,
-            file_content,
-            file_options={"content-type": "image/jpeg"}
-        )
-        
-        # Get public URL for the uploaded file
-        public_url = supabase_client.storage.from_("fireimages").get_public_url(supabase_filename)
-        
+
+        # The bytes already read from the request are sent as-is; upsert makes retries idempotent.
+        # Retries included, the upload gets UPLOAD_TIMEOUT and is skipped while storage is failing
+        await resilience.guard("supabase", lambda: _request(
+            "POST",
+            f"{STORAGE_URL}/object/{SUPABASE_BUCKET}/{supabase_filename}",
+            content=file_content,
+            headers={"Content-Type": "image/jpeg", "x-upsert": "true"}
+        ), UPLOAD_TIMEOUT)
+
+        public_url = get_public_url(supabase_filename)
+        frame_store.record(user_uuid, frame_number, timestamp, supabase_filename, public_url, file_content)
         return {"success": True, "url": public_url}
     except Exception as e:
         #print(f"Error uploading to Supabase: {e}")
-        return {"success": False, "error": str(e)}
+        metrics.error("upload_fire_image")
+        return {"success": False, "error": str(e) or type(e).__name__}
 
 async def get_latest_fire_image(user_uuid):
-    """Get the most recent fire image for a specific user from Supabase storage, create 'images' directory, and upload it back."""
+    """
+    Get the most recent fire image for a specific user.
+    Frames uploaded by this process are found in the local index and usually served
+    from the local cache; otherwise the user's folder is listed and downloaded.
+    """
     try:
-        # List all objects in the user's directory in Supabase storage
-        list_result = supabase_client.storage.from_("fireimages").list(user_uuid)
-        
-        sorted_files = sorted(list_result, key=lambda x: x['name'], reverse=True)
-        
-        if not sorted_files:
-            return None
-        
-        # Get the latest file
-        latest_file = sorted_files[0]
-        file_path = f"{user_uuid}/{latest_file['name']}"
-        
-        # Download the file content
-        response = supabase_client.storage.from_("fireimages").download(file_path)
-        
-        # Get the public URL for reference
-        public_url = supabase_client.storage.from_("fireimages").get_public_url(file_path)
-        
-        # Create 'images' directory if it doesn't exist
-        """ if not os.path.exists('images'):
-            os.makedirs('images')
-        
-        # Save the downloaded content to the 'images' directory
-        image_path = os.path.join('images', latest_file['name'])
-        with open(image_path, 'wb') as file:
-            file.write(response) """
+        latest = frame_store.latest_for(user_uuid)
+        if latest is None:
+            # Not uploaded by this process; list the user's directory in Supabase storage
+            list_response = await _request(
+                "POST",
+                f"{STORAGE_URL}/object/list/{SUPABASE_BUCKET}",
+                json={"prefix": user_uuid, "limit": 1000, "offset": 0}
+            )
+            list_result = list_response.json()
+            
+            if not list_result:
+                return None
+            
+            # Latest by numeric frame number (so frame_100 ranks above frame_99)
+            latest_file = max(list_result, key=lambda x: frame_number_from_name(x['name']))
+            file_path = f"{user_uuid}/{latest_file['name']}"
+            frame_store.record(user_uuid, frame_number_from_name(latest_file['name']), None,
+                               file_path, get_public_url(file_path))
+            latest = frame_store.latest_for(user_uuid)
         
-        # Now upload the saved image back to the Supabase storage in 'images' directory
-        #upload_response = supabase_client.storage.from_("images").upload(latest_file['name'], image_path)
+        file_path = latest["path"]
+        content = frame_store.get(file_path)
+        if content is None:
+            # Download the file content
+            download_response = await _request("GET", f"{STORAGE_URL}/object/{SUPABASE_BUCKET}/{file_path}")
+            content = download_response.content
+            frame_store.put(file_path, content)
 
         # Return the image information
         return {
-            "content": response,
-            "name": latest_file['name'],
-            "url": public_url
+            "content": content,
+            "name": file_path.split("/", 1)[-1],
+            "url": latest["url"]
         }
     except Exception as e:
         print(f"Error retrieving the latest fire image: {e}")
-        return None
\ No newline at end of file
+        return None
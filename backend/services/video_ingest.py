@@ -0,0 +1,224 @@
+import asyncio
+import multiprocessing
+import os
+import queue
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+from services.prefilter import fire_pixel_score
+from services.metrics import metrics
+from config import (VIDEO_WORKERS, VIDEO_SAMPLE_INTERVAL, VIDEO_QUEUE_SIZE, VIDEO_STALL_TIMEOUT,
+                    VIDEO_JOB_HISTORY, PREFILTER_ENABLED, PREFILTER_THRESHOLD, PREFILTER_SIZE,
+                    DETECTOR_INPUT_SIZE, LLM_INPUT_SIZE, PREPROCESS_JPEG_QUALITY)
+
+
+# --- Decoder side: runs in a worker process, one video per call ---
+
+def sample_frames(path, sample_interval):
+    """Yield (frame_index, timestamp, BGR array) every `sample_interval` seconds of video."""
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"Cannot open video {os.path.basename(path)}")
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+        step = max(1, round(fps * sample_interval))
+        index = 0
+        while True:
+            if index % step:
+                # grab() demuxes and decodes without converting the picture, so skipped frames stay cheap
+                if not capture.grab():
+                    return
+            else:
+                ok, image = capture.read()
+                if not ok:
+                    return
+                yield index, index / fps, image
+            index += 1
+    finally:
+        capture.release()
+
+
+def prepare_frames(frames):
+    """
+    Yield (frame_index, timestamp, prefilter score, JPEG bytes or None) per sampled frame.
+
+    The prefilter runs on a small thumbnail, and only frames that pass are
+    encoded, at the largest model input size, so a benign frame never costs
+    a JPEG encode.
+    """
+    for index, timestamp, image in frames:
+        height, width = image.shape[:2]
+        score = None
+        if PREFILTER_ENABLED:
+            scale = PREFILTER_SIZE / max(width, height)
+            thumbnail = cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))),
+                                   interpolation=cv2.INTER_AREA)
+            score = fire_pixel_score(cv2.cvtColor(thumbnail, cv2.COLOR_BGR2RGB))
+            if score < PREFILTER_THRESHOLD:
+                yield index, timestamp, score, None
+                continue
+
+        scale = max(DETECTOR_INPUT_SIZE, LLM_INPUT_SIZE) / max(width, height)
+        if scale < 1:
+            image = cv2.resize(image, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+        ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, PREPROCESS_JPEG_QUALITY])
+        yield index, timestamp, score, encoded.tobytes() if ok else None
+
+
+def decode_video(path, sample_interval, frames_out):
+    """
+    Worker process entry point: stream a video's sampled frames into `frames_out`.
+
+    The queue is bounded, so the decoder runs at most a few frames ahead of
+    detection and memory stays flat however long the video is. A consumer that
+    stops reading for VIDEO_STALL_TIMEOUT seconds makes the decoder give up.
+    """
+    try:
+        for item in prepare_frames(sample_frames(path, sample_interval)):
+            frames_out.put(("frame",) + item, timeout=VIDEO_STALL_TIMEOUT)
+        frames_out.put(("done",), timeout=VIDEO_STALL_TIMEOUT)
+    except queue.Full:
+        pass
+    except Exception as e:
+        frames_out.put(("error", str(e)), timeout=VIDEO_STALL_TIMEOUT)
+
+
+# --- Application side ---
+
+class VideoIngestor:
+    """
+    Runs uploaded or server-side videos through the frame pipeline.
+
+    Decoding, sampling, prefiltering and JPEG encoding happen in a pool of
+    worker processes (one video each, VIDEO_WORKERS at a time) so long videos
+    use every CPU core without blocking the event loop. Sampled frames come
+    back through a bounded queue and go through process_frame in order, so
+    detection, incident tracking, uploads and alerts work exactly as for
+    frames posted to /test.
+    """
+
+    def __init__(self, workers=VIDEO_WORKERS, sample_interval=VIDEO_SAMPLE_INTERVAL,
+                 queue_size=VIDEO_QUEUE_SIZE, job_history=VIDEO_JOB_HISTORY):
+        self.worker_count = workers
+        self.sample_interval = sample_interval
+        self.queue_size = queue_size
+        self.job_history = job_history
+        self.pool = None
+        self.manager = None
+        self.semaphore = None
+        self.tasks = set()
+        self.videos = OrderedDict()  # video_id -> status record
+
+    def start(self):
+        """Start the decoder pool (call from application startup)."""
+        # Spawned workers start clean instead of inheriting the app's event loop and threads
+        context = multiprocessing.get_context("spawn")
+        self.pool = ProcessPoolExecutor(max_workers=self.worker_count, mp_context=context)
+        self.manager = context.Manager()
+        self.semaphore = asyncio.Semaphore(self.worker_count)
+        print(f"Video ingestion started with {self.worker_count} decoder processes")
+
+    async def stop(self):
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.manager.shutdown()
+            self.pool = None
+
+    def submit(self, path, user_uuid, user_email, process, sample_interval=None, cleanup=False):
+        """
+        Queue a video for ingestion and return its status record.
+        `process` is the per-frame handler (process_frame); with `cleanup` the
+        file is deleted once the video has been processed.
+        """
+        now = time.time()
+        video = {
+            "video_id": uuid.uuid4().hex,
+            "status": "queued",
+            "user_uuid": user_uuid,
+            "source": os.path.basename(path),
+            "sample_interval": sample_interval or self.sample_interval,
+            "created_at": now,
+            "updated_at": now,
+            "frames_sampled": 0,
+            "frames_prefiltered": 0,
+            "frames_detected": 0,
+            "fire_frames": 0,
+            "incidents": [],
+            "error": None,
+        }
+        self.videos[video["video_id"]] = video
+        self._trim_history()
+        task = asyncio.create_task(self._run(video, path, user_email, process, cleanup))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return video
+
+    def get(self, video_id):
+        return self.videos.get(video_id)
+
+    async def _run(self, video, path, user_email, process, cleanup):
+        try:
+            async with self.semaphore:
+                video["status"] = "running"
+                with metrics.time("video_ingest"):
+                    await self._ingest(video, path, user_email, process)
+                video["status"] = "completed" if video["error"] is None else "failed"
+        except asyncio.CancelledError:
+            video["status"] = "cancelled"
+            raise
+        except Exception as e:
+            print(f"Error ingesting video {video['video_id']}: {e}")
+            video["status"] = "failed"
+            video["error"] = str(e)
+        finally:
+            video["updated_at"] = time.time()
+            if cleanup:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    async def _ingest(self, video, path, user_email, process):
+        loop = asyncio.get_running_loop()
+        frames_in = self.manager.Queue(maxsize=self.queue_size)
+        decoder = loop.run_in_executor(self.pool, decode_video, path, video["sample_interval"], frames_in)
+        while True:
+            try:
+                item = await loop.run_in_executor(None, frames_in.get, True, VIDEO_STALL_TIMEOUT)
+            except queue.Empty:
+                raise RuntimeError("Video decoder stopped responding")
+            if item[0] == "done":
+                break
+            if item[0] == "error":
+                video["error"] = item[1]
+                break
+
+            _, index, timestamp, score, jpeg = item
+            video["frames_sampled"] += 1
+            if jpeg is None:
+                video["frames_prefiltered"] += 1
+            result = await process(index, timestamp, video["user_uuid"], user_email, jpeg, prefilter=score)
+            if result["detection_source"] != "prefilter":
+                video["frames_detected"] += 1
+            if result["fire_detected"]:
+                video["fire_frames"] += 1
+            if result.get("incident_event") == "opened":
+                video["incidents"].append({"incident_id": result["incident_id"], "frame": index,
+                                           "timestamp": timestamp})
+            video["updated_at"] = time.time()
+        await decoder
+
+    def _trim_history(self):
+        while len(self.videos) > self.job_history:
+            oldest_id, oldest = next(iter(self.videos.items()))
+            if oldest["status"] in ("queued", "running"):
+                break
+            del self.videos[oldest_id]
+
+
+video_ingestor = VideoIngestor()